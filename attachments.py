@@ -0,0 +1,170 @@
+"""
+Mirroring of Jira attachments, so migrated issues keep their screenshots and logs.
+
+Every attachment an issue lists is downloaded from Jira and streamed to disk
+in chunks, hashing it on the way, so even large files never sit in memory.
+Files are stored by the SHA-256 of their contents, as <hash[:2]>/<hash>/<name>
+below the mirror directory; an attachment whose contents are already there,
+e.g. the same log attached to several issues, is not stored a second time.
+The directory is meant to be published as is, at the mirror URL.
+
+A manifest (SQLite, .manifest.db in the mirror directory) records every
+attachment mirrored so far, so a restarted run only downloads the rest.
+Issue bodies and comments are then rewritten: Jira attachment and thumbnail
+URLs point at the mirrored copies, and the body gets a list of the issue's
+attachments.
+
+    mirror = AttachmentMirror('https://issues.example.com', 'mirror', 'https://example.github.io/mirror')
+    mirror.mirror(issue)
+"""
+
+import hashlib
+import html
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+MANIFEST_NAME = '.manifest.db'
+CHUNK_SIZE = 1 << 16
+
+_ATTACHMENTS = '\n\n<details><summary>Attachments</summary>\n<ul>{items}\n</ul>\n</details>'
+_ATTACHMENT = '\n<li><a href="{url}">{name}</a></li>'
+
+
+def create_session(workers, auth=None):
+    """
+    A session whose connection pool fits `workers` concurrent downloads and
+    which retries transient failures.
+    """
+    retry = Retry(total=5, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset(['GET']))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.auth = auth
+    return session
+
+
+class AttachmentMirror:
+    def __init__(self, jira_base_url, mirror_dir, mirror_url, session=None, workers=8):
+        self.jira_base_url = jira_base_url.rstrip('/')
+        self.mirror_dir = mirror_dir
+        self.mirror_url = mirror_url.rstrip('/')
+        self._session = session or create_session(workers)
+        # Absolute or relative links to an attachment or its thumbnail, by attachment id
+        self._jira_url = re.compile(
+            rf'(?:{re.escape(self.jira_base_url)})?/secure/(?:attachment|thumbnail)/(\d+)(?:/[^\s"\'<>)]*)?')
+
+        os.makedirs(os.path.join(mirror_dir, '.partial'), exist_ok=True)
+        # Written by several download threads, so access is serialised with a lock
+        self._connection = sqlite3.connect(os.path.join(mirror_dir, MANIFEST_NAME), check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, path TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS attachments (id TEXT PRIMARY KEY, digest TEXT)')
+        self._connection.commit()
+        self._lock = threading.Lock()
+        # Attachment id -> path below the mirror directory
+        self._paths = dict(self._connection.execute(
+            'SELECT attachments.id, blobs.path FROM attachments JOIN blobs USING (digest)'))
+        self.downloaded = 0
+        self.deduplicated = 0
+        self.failed = 0
+
+    def mirror(self, issue):
+        """
+        Mirror the attachments of `issue` that are not mirrored yet and
+        rewrite its body and comments to link to the copies. Attachments that
+        fail to download keep their Jira links. Returns True if every
+        attachment is mirrored.
+        """
+        complete = True
+        for attachment in issue.attachments:
+            if attachment.id not in self._paths and not self._download(attachment):
+                complete = False
+        self.rewrite(issue)
+        return complete
+
+    def is_mirrored(self, issue):
+        return all(attachment.id in self._paths for attachment in issue.attachments)
+
+    def rewrite(self, issue):
+        """
+        Point the Jira attachment links of `issue` at the mirrored copies and
+        list its mirrored attachments below the body. Rewriting an issue
+        again leaves it unchanged.
+        """
+        if not issue.attachments:
+            return
+        issue.body = self._jira_url.sub(self._mirrored_url, issue.body)
+        items = ''.join(_ATTACHMENT.format(url=self.url(attachment.id), name=html.escape(attachment.name))
+                        for attachment in issue.attachments if attachment.id in self._paths)
+        if items:
+            section = _ATTACHMENTS.format(items=items)
+            if section not in issue.body:
+                issue.body += section
+        issue.rewrite_comments(lambda body: self._jira_url.sub(self._mirrored_url, body))
+
+    def url(self, attachment_id):
+        return f'{self.mirror_url}/{quote(self._paths[attachment_id])}'
+
+    def close(self):
+        self._connection.close()
+
+    def _mirrored_url(self, match):
+        if match.group(1) not in self._paths:
+            return match.group(0)
+        return self.url(match.group(1))
+
+    def _download(self, attachment):
+        source = f'{self.jira_base_url}/secure/attachment/{attachment.id}/{quote(attachment.name, safe="")}'
+        partial_path = os.path.join(self.mirror_dir, '.partial', uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        try:
+            with self._session.get(source, stream=True, timeout=60) as response:
+                if response.status_code != 200:
+                    print(f"Failed to download attachment {attachment.id} ({attachment.name}): "
+                          f"{response.status_code}")
+                    with self._lock:
+                        self.failed += 1
+                    return False
+                with open(partial_path, 'wb') as file:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        digest.update(chunk)
+                        file.write(chunk)
+        except (requests.RequestException, OSError) as error:
+            print(f"Failed to download attachment {attachment.id} ({attachment.name}): {error}")
+            with self._lock:
+                self.failed += 1
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            return False
+
+        digest = digest.hexdigest()
+        with self._lock:
+            row = self._connection.execute('SELECT path FROM blobs WHERE digest = ?', (digest,)).fetchone()
+            if row is not None:
+                os.remove(partial_path)
+                path = row[0]
+                self.deduplicated += 1
+            else:
+                # The name is only kept for people downloading the file; anything path-like is dropped
+                name = os.path.basename(attachment.name.replace('\\', '/')).strip('.') or 'attachment'
+                path = f'{digest[:2]}/{digest}/{name}'
+                os.makedirs(os.path.join(self.mirror_dir, os.path.dirname(path)), exist_ok=True)
+                os.replace(partial_path, os.path.join(self.mirror_dir, path))
+                self._connection.execute('INSERT INTO blobs (digest, path) VALUES (?, ?)', (digest, path))
+                self.downloaded += 1
+            self._connection.execute('INSERT OR REPLACE INTO attachments (id, digest) VALUES (?, ?)',
+                                     (attachment.id, digest))
+            self._connection.commit()
+            self._paths[attachment.id] = path
+        return True
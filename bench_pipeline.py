@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark suite for the import pipeline.
+
+Generates a synthetic export with generate_export.py and measures each stage
+on it: XML parsing, Project.add_item, label resolution, body and comment
+rendering, and an end-to-end import into mock_github.py over HTTP. Every stage
+runs in a fresh process, so the peak memory it reports (the growth of the
+process's peak RSS, which includes lxml's own allocations) is not skewed by
+the stages before it. The best of `--repeat` runs is reported.
+
+Results can be saved as a baseline and later runs compared against it:
+
+    python3 bench_pipeline.py --issues 5000 --save-baseline
+    python3 bench_pipeline.py --issues 5000
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from generate_export import ExportGenerator
+from labels import LabelResolver
+from renderer import IssueRenderer
+from utils import iter_xml_items, read_xml_files
+
+BASELINE_FILE = 'bench_baseline.json'
+JIRA_BASE_URL = 'https://issues.example.com'
+# A change beyond this share of the baseline is flagged
+TOLERANCE = 0.10
+
+LABELS_MAPPING = {f'label-{n}': f'area-{n % 20}' for n in range(0, 200, 3)}
+ALLOWED_LABELS = [f'area-{n}' for n in range(20)] + [f'label-{n}' for n in range(100)] + ['regression']
+
+
+def bench_parse(file_names):
+    count = 0
+    for item in iter_xml_items(file_names):
+        item.key.text
+        count += 1
+    return count
+
+
+def bench_transform(file_names):
+    from project import Project
+
+    project = Project('BENCH', '3', JIRA_BASE_URL, label_resolver=LabelResolver(LABELS_MAPPING, ALLOWED_LABELS))
+    project.add_files(file_names)
+    return len(project.get_issues())
+
+
+def setup_labels(file_names):
+    return [[label.text for label in item.labels.findall('label')] for item in iter_xml_items(file_names)]
+
+
+def bench_labels(issue_labels):
+    resolver = LabelResolver(LABELS_MAPPING, ALLOWED_LABELS)
+    for labels in issue_labels:
+        resolver.resolve_all(labels)
+    return len(issue_labels)
+
+
+def setup_render(file_names):
+    return [item for root in read_xml_files(file_names) for item in root.channel.item]
+
+
+def bench_render(items):
+    renderer = IssueRenderer(JIRA_BASE_URL)
+    for item in items:
+        renderer.render_body(item.description.text, (str(item.reporter), item.reporter.get('username')),
+                             item.key.text, item.summary.text, status=str(item.status),
+                             priority=str(item.priority), resolution=str(item.resolution))
+        if hasattr(item, 'comments'):
+            for comment in item.comments.comment:
+                renderer.render_comment(comment.get('author'), comment.text)
+    return len(items)
+
+
+def setup_import(file_names):
+    from project import Project
+
+    project = Project('BENCH', '3', JIRA_BASE_URL, label_resolver=LabelResolver())
+    project.add_files(file_names)
+    return project
+
+
+def bench_import(project):
+    from github_client import GitHubClient
+    from importer import Importer
+    from mock_github import MockGitHub
+
+    mock = MockGitHub(import_polls=0)
+    url = mock.start()
+    try:
+        client = GitHubClient('token', api_url=url, concurrency=8, writes_per_second=1_000_000,
+                              write_burst=1_000_000)
+        options = namedtuple('Options', 'accesstoken account repo')('token', 'bench', 'bench')
+        importer = Importer(options, project, client, poll_interval=0.001)
+        # The importer reports every issue, which would drown the results
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results = importer.import_issues(0)
+    finally:
+        mock.stop()
+    return sum(1 for number in results.values() if number is not None)
+
+
+STAGES = {
+    'parse': (None, bench_parse),
+    'transform': (None, bench_transform),
+    'labels': (setup_labels, bench_labels),
+    'render': (setup_render, bench_render),
+    'import': (setup_import, bench_import),
+}
+
+
+def _peak_rss():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_stage(stage, file_names):
+    """
+    Run one stage and return (issues, seconds, peak memory growth in bytes).
+    Meant to be called in a fresh process.
+    """
+    setup, bench = STAGES[stage]
+    data = setup(file_names) if setup else file_names
+    before = _peak_rss()
+    started = time.perf_counter()
+    issues = bench(data)
+    elapsed = time.perf_counter() - started
+    return issues, elapsed, _peak_rss() - before
+
+
+def measure(stage, file_names, repeat):
+    runs = []
+    for _ in range(repeat):
+        # max_tasks_per_child is not available everywhere, a new pool per run gives the same fresh process
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            runs.append(executor.submit(run_stage, stage, file_names).result())
+    issues = runs[0][0]
+    seconds = min(run[1] for run in runs)
+    return {'issues': issues, 'seconds': seconds, 'issues_per_second': issues / seconds,
+            'peak_memory_mib': max(run[2] for run in runs) / 2 ** 20}
+
+
+def compare(results, baseline):
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+        previous = baseline[stage]
+        speed = result['issues_per_second'] / previous['issues_per_second'] - 1
+        memory = result['peak_memory_mib'] - previous['peak_memory_mib']
+        flag = ''
+        if speed < -TOLERANCE:
+            flag = '  SLOWER'
+        elif speed > TOLERANCE:
+            flag = '  faster'
+        print(f'{stage:10} {speed:+7.1%} throughput, {memory:+8.1f} MiB peak memory vs baseline{flag}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the import pipeline on a synthetic export.')
+    parser.add_argument('--issues', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=5, help='mean comments per issue')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma-separated stages to run')
+    parser.add_argument('--export', help='benchmark these export files instead of generating them')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.export:
+            file_names = args.export
+        else:
+            ExportGenerator(issues=args.issues, comments=args.comments, seed=args.seed).write(directory)
+            file_names = directory
+
+        results = {}
+        for stage in args.stages.split(','):
+            results[stage] = measure(stage, file_names, args.repeat)
+            result = results[stage]
+            print(f"{stage:10} {result['issues']:7d} issues {result['seconds']:8.3f}s "
+                  f"{result['issues_per_second']:10.0f} issues/s {result['peak_memory_mib']:8.1f} MiB peak")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
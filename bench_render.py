@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+Microbenchmark for issue body and comment rendering.
+
+Renders the same synthetic items with the previous string-concatenation
+implementation and with renderer.IssueRenderer, checks that both produce
+identical output, and prints the time each one takes.
+
+    python3 bench_render.py [issues] [comments-per-issue]
+"""
+
+import re
+import sys
+import timeit
+from datetime import datetime
+from html.entities import name2codepoint
+
+from lxml import objectify
+
+from renderer import IssueRenderer
+
+JIRA_BASE_URL = 'https://issues.example.com'
+
+ITEM_TEMPLATE = '''<item>
+<title>[BENCH-{n}] Benchmark issue {n}</title>
+<key>BENCH-{n}</key>
+<description>&lt;p&gt;Steps &amp;amp; details for issue {n} &amp;mdash; see &amp;quot;log&amp;quot;&lt;/p&gt;</description>
+<status>Open</status>
+<priority>Major</priority>
+<resolution>Unresolved</resolution>
+<assignee username="dev{n}">Developer {n}</assignee>
+<reporter username="user{n}">User {n}</reporter>
+<comments>{comments}</comments>
+</item>'''
+COMMENT_TEMPLATE = '<comment author="user{c}">Comment {c} &amp;eacute;&amp;lt;code&amp;gt; with some longer text that looks like a stack trace</comment>'
+
+
+def legacy_htmlentitydecode(s):
+    if s is None:
+        return ''
+    s = s.replace(' ' * 8, '')
+    return re.sub('&(%s);' % '|'.join(name2codepoint),
+                  lambda m: chr(name2codepoint[m.group(1)]), s)
+
+
+def legacy_render(item):
+    body = legacy_htmlentitydecode(item.description.text)
+    body = body + '\n\n---\n<details><summary><i>Originally reported by <a title="' + str(item.reporter) + '" href="' + JIRA_BASE_URL + '/secure/ViewProfile.jspa?name=' + item.reporter.get('username') + '">' + item.reporter.get('username') + '</a>, imported from: <a href="' + JIRA_BASE_URL + '/browse/' + item.key.text + '" target="_blank">' + item.title.text[item.title.text.index("]") + 2:len(item.title.text)] + '</a></i></summary>'
+    body = body + '\n<i><ul>'
+    if item.assignee != 'Unassigned':
+        body = body + '\n<li><b>assignee</b>: <a title="' + str(item.assignee) + '" href="' + JIRA_BASE_URL + '/secure/ViewProfile.jspa?name=' + item.assignee.get('username') + '">' + item.assignee.get('username') + '</a>'
+    body = body + '\n<li><b>status</b>: ' + item.status
+    body = body + '\n<li><b>priority</b>: ' + item.priority
+    body = body + '\n<li><b>resolution</b>: ' + item.resolution
+    body = body + '\n<li><b>imported</b>: ' + datetime.today().strftime('%Y-%m-%d')
+    body = body + '\n</ul></i>\n</details>'
+    comments = ['<i><a href="' + JIRA_BASE_URL + '/secure/ViewProfile.jspa?name=' + comment.get('author') + '">' + comment.get('author') + '</a>:</i>\n' + legacy_htmlentitydecode(comment.text)
+                for comment in item.comments.comment]
+    return body, comments
+
+
+def compiled_render(renderer, item):
+    body = renderer.render_body(
+        item.description.text,
+        (str(item.reporter), item.reporter.get('username')),
+        item.key.text,
+        item.title.text[item.title.text.index("]") + 2:len(item.title.text)],
+        assignee=(str(item.assignee), item.assignee.get('username')),
+        status=str(item.status),
+        priority=str(item.priority),
+        resolution=str(item.resolution))
+    comments = [renderer.render_comment(comment.get('author'), comment.text) for comment in item.comments.comment]
+    return body, comments
+
+
+def make_items(issues, comments_per_issue):
+    comments = ''.join(COMMENT_TEMPLATE.format(c=c) for c in range(comments_per_issue))
+    return [objectify.fromstring(ITEM_TEMPLATE.format(n=n, comments=comments)) for n in range(issues)]
+
+
+def main():
+    issues = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    comments_per_issue = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    items = make_items(issues, comments_per_issue)
+    renderer = IssueRenderer(JIRA_BASE_URL)
+
+    for item in items:
+        assert legacy_render(item) == compiled_render(renderer, item), f'Output differs for {item.key.text}'
+
+    legacy = min(timeit.repeat(lambda: [legacy_render(item) for item in items], number=1, repeat=3))
+    compiled = min(timeit.repeat(lambda: [compiled_render(renderer, item) for item in items], number=1, repeat=3))
+    print(f'{issues} issues x {comments_per_issue} comments, output identical')
+    print(f'legacy:   {legacy:8.3f}s')
+    print(f'compiled: {compiled:8.3f}s ({legacy / compiled:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Fixtures shared by the tests: the mock GitHub and Jira servers, a client that
+does not wait between attempts, and a ledger in a temporary directory.
+"""
+
+from collections import namedtuple
+
+import pytest
+
+from github_client import GitHubClient
+from issues import IssueRecord
+from ledger import MigrationLedger
+from mock_github import MockGitHub
+
+Options = namedtuple('Options', 'accesstoken account repo')
+Project = namedtuple('Project', 'name')
+
+
+@pytest.fixture
+def github():
+    mock = MockGitHub(import_polls=0)
+    mock.start()
+    yield mock
+    mock.stop()
+
+
+@pytest.fixture
+def client(github):
+    return GitHubClient('token', api_url=github.url, writes_per_second=1000, write_burst=1000, backoff=0.01)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = MigrationLedger(str(tmp_path / 'ledger.db'))
+    yield ledger
+    ledger.close()
+
+
+@pytest.fixture
+def reopen():
+    """
+    Open a ledger again, as the next run would after this one was interrupted.
+    """
+    opened = []
+
+    def reopen(ledger):
+        ledger.flush()
+        opened.append(MigrationLedger(ledger.path))
+        return opened[-1]
+
+    yield reopen
+    for ledger in opened:
+        ledger.close()
+
+
+def make_issue(key, comments=(), body=None):
+    """
+    An issue as Project reads it, with `comments` given as (id, body) pairs.
+    """
+    issue = IssueRecord(key, f'[{key}] Summary of {key}', body or f'Description of {key}',
+                        '2020-01-01T00:00:00', '2020-01-02T00:00:00', False)
+    for minute, (comment_id, comment_body) in enumerate(comments):
+        issue.add_comment(f'2020-01-01T00:{minute:02d}:00', comment_body, comment_id)
+    issue.content_hash = issue.compute_hash()
+    return issue
+
+
+def requests_to(mock, method, path_suffix):
+    return sum(1 for sent, path in mock.requests if sent == method and path.endswith(path_suffix))
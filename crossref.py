@@ -0,0 +1,151 @@
+"""
+Post-import rewriting of Jira issue keys into links to the migrated GitHub issues.
+
+A key -> (repository, issue number) index is built from the migration ledger,
+or from one paginated listing of the target repositories. Every body and
+comment is then scanned once with a single compiled pattern matching any Jira
+key, and each match is looked up in the index, so the cost does not grow with
+the number of keys. Issue links collected by Project (blocks, depends-on,
+duplicates, epic, ...) are appended to the body before the scan so they are
+resolved the same way. Keys become HTML links, since bodies and comments are
+HTML blocks, inside which GitHub does not render Markdown. Jira renders the
+keys it knows as issue-link anchors to its browse page; those are pointed at
+the GitHub issue instead, while any other link is left alone. Only issues and
+comments whose text actually changes are updated. With a ledger, an issue is
+not touched at all while its rewrite is the same as the one recorded there.
+"""
+
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from issues import LINK_TYPES
+
+GITHUB_URL = 'https://github.com'
+
+KEY = r'[A-Z][A-Z0-9_]+-\d+'
+# In order: a link to a Jira browse page, like the issue-link anchors Jira renders keys as; any other link,
+# left as it is; and a Jira key that is not part of a URL, an attribute, a longer word, or a [KEY](...) link
+JIRA_KEY = re.compile(rf'<a\s[^>]*?href="(?P<href>[^"]*/browse/(?P<linked_key>{KEY}))"[^>]*>(?P<text>.*?)</a>'
+                      rf'|<a\b[^>]*>.*?</a>'
+                      rf'|(?<![\w/\[."-])(?P<key>{KEY})(?![\w-])', re.DOTALL)
+# A link written by CrossReferenceRewriter
+GITHUB_LINK = re.compile(rf'<a href="{re.escape(GITHUB_URL)}/[^"/]+/[^"/]+/issues/\d+">({KEY})</a>')
+TAG = re.compile(r'<[^>]*>')
+# Migrated issue titles keep Jira's "[KEY] summary" form
+TITLE_KEY = re.compile(rf'^\[({KEY})\]')
+
+
+def index_from_ledger(ledger):
+    return ledger.imported()
+
+
+def index_from_repositories(client, account, repos):
+    """
+    Build the index from one paginated listing of each repository's issues.
+    """
+    index = {}
+    for repo in repos:
+        for issue in client.paginate(f'/repos/{account}/{repo}/issues', params={'state': 'all'}):
+            match = TITLE_KEY.match(issue['title'])
+            if match and 'pull_request' not in issue:
+                index[match.group(1)] = (repo, issue['number'])
+    return index
+
+
+class CrossReferenceRewriter:
+    def __init__(self, index, account):
+        self._index = index
+        self._account = account
+
+    def rewrite(self, text):
+        return JIRA_KEY.sub(self._link, text)
+
+    def _link(self, match):
+        key = match.group('key') or _linked_key(match)
+        target = self._index.get(key) if key is not None else None
+        if target is None:
+            return match.group(0)
+        repo, number = target
+        return f'<a href="{GITHUB_URL}/{self._account}/{repo}/issues/{number}">{key}</a>'
+
+
+def _linked_key(match):
+    """
+    The key a Jira browse link shows, by key (possibly struck through) or by
+    URL. None for other links, such as the one to the imported issue.
+    """
+    if match.group('linked_key') is None:
+        return None
+    text = TAG.sub('', match.group('text')).strip()
+    return match.group('linked_key') if text in (match.group('linked_key'), match.group('href')) else None
+
+
+def unlink(text):
+    """
+    `text` with the links CrossReferenceRewriter adds or rewrites turned into plain keys.
+    """
+    text = GITHUB_LINK.sub(r'\1', text)
+    return JIRA_KEY.sub(lambda match: _linked_key(match) or match.group(0), text)
+
+
+def links_section(issue):
+    """
+    The issue's Jira links as a list appended to its body, or '' if it has none.
+    """
+    lines = [f'\n<li><b>{link_type}</b>: ' + ', '.join(issue.links(link_type))
+             for link_type in LINK_TYPES if issue.links(link_type)]
+    if issue.epic_link:
+        lines.append(f'\n<li><b>epic</b>: {issue.epic_link}')
+    if not lines:
+        return ''
+    return '\n\n<b>Links</b>:\n<ul>' + ''.join(lines) + '\n</ul>'
+
+
+def rewrite_cross_references(project, client, account, index, workers=4, rewrite_attachments=None, ledger=None):
+    """
+    Rewrite the migrated issues of `project` and return how many were updated.
+    `rewrite_attachments` is applied to each issue first, the same way it was
+    applied before the import, so attachment links are not reverted.
+
+    With a `ledger`, a hash of each issue's rewritten body and comments is
+    recorded there, and issues whose hash is unchanged are skipped. The
+    ledger forgets the hash whenever the issue is imported or updated again.
+    """
+    rewriter = CrossReferenceRewriter(index, account)
+
+    def update(issue):
+        repo, number = index[issue.key]
+        if rewrite_attachments is not None:
+            rewrite_attachments(issue)
+
+        body = rewriter.rewrite(issue.body + links_section(issue))
+        comments = {comment.body: rewriter.rewrite(comment.body) for comment in issue.comments}
+        digest = hashlib.sha1('\0'.join([body, *comments.values()]).encode()).hexdigest()
+        if ledger is not None and ledger.rewrite_hash(issue.key) == digest:
+            return False
+        changed = False
+
+        # Without a recorded rewrite, GitHub has the body as imported or updated, which is issue.body
+        if body != issue.body:
+            client.patch(f'/repos/{account}/{repo}/issues/{number}', json={'body': body},
+                         idempotent=True).raise_for_status()
+            changed = True
+
+        comments = {unlink(old): new for old, new in comments.items() if new != old}
+        if comments:
+            # Imported comments keep their body, apart from links added by an earlier run,
+            # which is how they are matched up with their ids
+            for remote in client.paginate(f'/repos/{account}/{repo}/issues/{number}/comments'):
+                new = comments.get(unlink(remote['body']))
+                if new is not None and new != remote['body']:
+                    client.patch(f'/repos/{account}/{repo}/issues/comments/{remote["id"]}',
+                                 json={'body': new}, idempotent=True).raise_for_status()
+                    changed = True
+        if ledger is not None:
+            ledger.record_rewrite(issue.key, digest)
+        return changed
+
+    migrated = (issue for issue in project.get_issues() if issue.key in index)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(update, migrated))
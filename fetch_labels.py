@@ -1,24 +1,30 @@
 #!/usr/bin/env python3
 import os
+from ingest_cache import DEFAULT_MAX_SIZE, IngestCache
 from project import Project
-from utils import read_xml_files
 
 # Fetch environment variables for Jira project details and file paths
 jira_proj = os.getenv('JIRA_MIGRATION_JIRA_PROJECT_NAME')
 jira_done_id = os.getenv('JIRA_MIGRATION_JIRA_DONE_ID')
 jira_base_url = os.getenv('JIRA_MIGRATION_JIRA_URL')
 file_names = os.getenv('JIRA_MIGRATION_FILE_PATHS')
+ingest_workers = int(os.getenv('JIRA_MIGRATION_INGEST_WORKERS', '1'))
+ingest_cache_path = os.getenv('JIRA_MIGRATION_INGEST_CACHE', 'ingest_cache.db')
+ingest_cache_size = int(os.getenv('JIRA_MIGRATION_INGEST_CACHE_MAX_MB', str(DEFAULT_MAX_SIZE >> 20))) << 20
 
 # Initialize the Project object
 project = Project(jira_proj, jira_done_id, jira_base_url)
 
-# Read the Jira XML files
-all_xml_files = read_xml_files(file_names)
-
-# Add each item (issue) to the project and collect labels
-for f in all_xml_files:
-    for item in f.channel.item:
-        project.add_item(item)
+# Read the Jira XML files and add each item (issue) to the project to collect labels
+# Files unchanged since an earlier run are loaded from the ingest cache
+ingest_cache = IngestCache(ingest_cache_path, ingest_cache_size) if ingest_cache_path else None
+project.add_files(file_names, workers=ingest_workers, cache=ingest_cache)
 
 # Print out all collected labels in alphabetical order
 [print(key) for key in sorted(project.get_labels().keys())]
+
+# Report how the mapping and allowlist treated the labels that were seen
+print(project.label_resolver.summary())
+if ingest_cache is not None:
+    print(f'Ingest cache: {ingest_cache.hits} files loaded, {ingest_cache.misses} transformed')
+    ingest_cache.close()
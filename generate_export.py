@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""
+Generate synthetic Jira XML exports for benchmarks and dry runs.
+
+The exports have the shape fetch_issues.py downloads: rss/channel documents
+named result-N.xml holding up to `per_file` items each. Issues get a random
+mix of types, statuses, labels, components, comments, issue links, subtasks,
+security levels, epic links and attachments, drawn from a seeded generator so the same
+arguments always produce the same files.
+
+    python3 generate_export.py OUTPUT_DIR --issues 10000 --comments 8 --seed 1
+"""
+
+import argparse
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+TYPES = ('Bug', 'Improvement', 'New Feature', 'Task', 'Story', 'Patch')
+STATUSES = (('Open', 1, 2, 'new'), ('In Progress', 3, 4, 'indeterminate'), ('Resolved', 5, 3, 'done'),
+            ('Closed', 6, 3, 'done'))
+PRIORITIES = ('Blocker', 'Critical', 'Major', 'Minor', 'Trivial')
+LINK_TYPES = (('Blocks', 'blocks', 'is blocked by'), ('Duplicate', 'duplicates', 'is duplicated by'),
+              ('Relates', 'is related to', 'is related to'), ('Dependency', 'depends on', 'is depended on by'))
+EPIC_LINK_KEY = 'com.pyxis.greenhopper.jira:gh-epic-link'
+START = datetime(2015, 1, 1, tzinfo=timezone.utc)
+ATTACHMENT_NAMES = ('screenshot.png', 'build.log', 'thread-dump.txt', 'config.xml', 'stacktrace.txt')
+
+WORDS = ('agent', 'build', 'cache', 'config', 'controller', 'crash', 'deploy', 'error', 'executor', 'failure',
+         'groovy', 'job', 'log', 'memory', 'node', 'pipeline', 'plugin', 'queue', 'restart', 'script', 'slow',
+         'step', 'test', 'timeout', 'update', 'upgrade', 'user', 'workspace')
+
+
+def jira_timestamp(moment):
+    return f'{moment:%a}, {moment.day} {moment:%b %Y %H:%M:%S %z}'
+
+
+class ExportGenerator:
+    def __init__(self, project='BENCH', issues=1000, comments=5, links=0.3, labels=3, label_pool=200,
+                 components=1, component_pool=40, security=0.05, epics=0.02, attachments=0.0, seed=0):
+        self.project = project
+        self.issues = issues
+        self.comments = comments
+        self.links = links
+        self.labels = labels
+        self.label_pool = [f'label-{n}' for n in range(label_pool)] + ['Regression', 'Help-Wanted', ' triage ']
+        self.components = components
+        self.component_pool = [f'component-{n}' for n in range(component_pool)]
+        self.security = security
+        self.epics = epics
+        self.attachments = attachments
+        self.random = random.Random(seed)
+        self._epic_keys = []
+
+    def text(self, words):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words))
+
+    def html(self, paragraphs):
+        # Exports carry rendered HTML, with entities the migration has to decode. Jira renders most keys
+        # as issue-link anchors, struck through once resolved, but keys in e.g. code stay plain text
+        return ''.join(f'<p>{self.text(self.random.randint(8, 40))} &amp; {self.random.choice(WORDS)} '
+                       f'&mdash; see {self.key(self.random.randint(1, self.issues))}, '
+                       f'like {self.issue_link(self.random.randint(1, self.issues))}</p>'
+                       for _ in range(paragraphs))
+
+    def issue_link(self, number):
+        key = self.key(number)
+        text = f'<del>{key}</del>' if self.random.random() < 0.5 else key
+        return (f'<a href="https://issues.example.com/browse/{key}" title="{self.text(3)}" class="issue-link" '
+                f'data-issue-key="{key}">{text}</a>')
+
+    def key(self, number):
+        return f'{self.project}-{number}'
+
+    def user(self):
+        number = self.random.randint(1, 500)
+        return f'user{number}', f'User {number}'
+
+    def item(self, number):
+        rnd = self.random
+        key = self.key(number)
+        created = START + timedelta(minutes=rnd.randint(0, 4_000_000))
+        updated = created + timedelta(minutes=rnd.randint(0, 100_000))
+        issue_type = 'Epic' if rnd.random() < self.epics else rnd.choice(TYPES)
+        if issue_type == 'Epic':
+            self._epic_keys.append(key)
+        status, status_id, category_id, category_key = rnd.choice(STATUSES)
+        summary = self.text(rnd.randint(3, 10))
+        reporter = self.user()
+        assignee = self.user() if rnd.random() < 0.7 else ('-1', 'Unassigned')
+
+        # Checked first and only when enabled, so exports without attachments stay as they were
+        attachments = []
+        if self.attachments and rnd.random() < self.attachments:
+            attachments = [(str(number * 10 + n), rnd.choice(ATTACHMENT_NAMES)) for n in range(rnd.randint(1, 3))]
+        description = self.html(rnd.randint(1, 4))
+        if attachments:
+            attachment_id, name = attachments[0]
+            url = f'https://issues.example.com/secure/attachment/{attachment_id}/{name}'
+            description += f'<p>See <a href="{url}">{name}</a></p>'
+
+        parts = [
+            f'<item>\n<title>{escape(f"[{key}] {summary}")}</title>',
+            f'<link>https://issues.example.com/browse/{key}</link>',
+            f'<project id="1" key="{self.project}">Benchmark</project>',
+            f'<description>{escape(description)}</description>',
+            f'<key id="{number}">{key}</key>',
+            f'<summary>{escape(summary)}</summary>',
+            f'<type id="1">{issue_type}</type>',
+            f'<priority id="3">{rnd.choice(PRIORITIES)}</priority>',
+            f'<status id="{status_id}">{status}</status>',
+            f'<statusCategory id="{category_id}" key="{category_key}" colorName="blue"/>',
+            '<resolution id="1">Fixed</resolution>' if category_key == 'done'
+            else '<resolution id="-1">Unresolved</resolution>',
+            f'<assignee username={quoteattr(assignee[0])}>{escape(assignee[1])}</assignee>',
+            f'<reporter username={quoteattr(reporter[0])}>{escape(reporter[1])}</reporter>',
+        ]
+        if rnd.random() < self.security:
+            parts.append('<security id="10000">Security</security>')
+        labels = rnd.sample(self.label_pool, rnd.randint(0, self.labels * 2))
+        parts.append('<labels>' + ''.join(f'<label>{escape(label)}</label>' for label in labels) + '</labels>')
+        parts.append(f'<created>{jira_timestamp(created)}</created>')
+        parts.append(f'<updated>{jira_timestamp(updated)}</updated>')
+        if category_key == 'done':
+            parts.append(f'<resolved>{jira_timestamp(updated)}</resolved>')
+        if rnd.random() < 0.3:
+            parts.append(f'<fixVersion>{rnd.randint(1, 3)}.{rnd.randint(0, 20)}</fixVersion>')
+        for component in rnd.sample(self.component_pool, rnd.randint(0, self.components * 2)):
+            parts.append(f'<component>{component}</component>')
+
+        comment_count = min(int(rnd.expovariate(1 / self.comments)) if self.comments else 0, self.comments * 10)
+        if comment_count:
+            parts.append('<comments>')
+            moment = created
+            for comment in range(comment_count):
+                moment += timedelta(minutes=rnd.randint(1, 10_000))
+                author = self.user()[0]
+                parts.append(f'<comment id="{number * 1000 + comment}" author="{author}" '
+                             f'created="{jira_timestamp(moment)}">{escape(self.html(rnd.randint(1, 2)))}</comment>')
+            parts.append('</comments>')
+
+        if attachments:
+            parts.append('<attachments>' + ''.join(
+                f'<attachment id="{attachment_id}" name="{name}" size="1024" author="{reporter[0]}" '
+                f'created="{jira_timestamp(created)}"/>' for attachment_id, name in attachments)
+                         + '</attachments>')
+
+        if number > 1 and rnd.random() < self.links:
+            name, outward, _ = rnd.choice(LINK_TYPES)
+            parts.append(f'<issuelinks><issuelinktype id="10000"><name>{name}</name>'
+                         f'<outwardlinks description="{outward}"><issuelink>'
+                         f'<issuekey id="{number - 1}">{self.key(rnd.randint(1, number - 1))}</issuekey>'
+                         f'</issuelink></outwardlinks></issuelinktype></issuelinks>')
+        if rnd.random() < 0.05:
+            parts.append(f'<subtasks><subtask id="{number}">{self.key(rnd.randint(1, self.issues))}</subtask></subtasks>')
+
+        parts.append('<customfields>')
+        if issue_type != 'Epic' and self._epic_keys and rnd.random() < 0.3:
+            parts.append(f'<customfield id="customfield_10007" key="{EPIC_LINK_KEY}"><customfieldname>Epic Link'
+                         f'</customfieldname><customfieldvalues><customfieldvalue>{rnd.choice(self._epic_keys)}'
+                         f'</customfieldvalue></customfieldvalues></customfield>')
+        parts.append('</customfields>\n</item>\n')
+        return '\n'.join(parts)
+
+    def write(self, output_dir, per_file=1000):
+        """
+        Write the export into `output_dir` and return the file names.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        file_names = []
+        for start in range(0, self.issues, per_file):
+            end = min(start + per_file, self.issues)
+            file_name = os.path.join(output_dir, f'result-{start}.xml')
+            with open(file_name, 'w', encoding='utf-8') as file:
+                file.write(f'<rss version="0.92">\n<channel>\n<title>Jira</title>\n'
+                           f'<issue start="{start}" end="{end}" total="{self.issues}"/>\n')
+                for number in range(start + 1, end + 1):
+                    file.write(self.item(number))
+                file.write('</channel>\n</rss>\n')
+            file_names.append(file_name)
+        return file_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Jira XML export.')
+    parser.add_argument('output_dir')
+    parser.add_argument('--project', default='BENCH')
+    parser.add_argument('--issues', type=int, default=1000)
+    parser.add_argument('--per-file', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=5, help='mean comments per issue')
+    parser.add_argument('--links', type=float, default=0.3, help='share of issues with a link')
+    parser.add_argument('--labels', type=int, default=3, help='mean labels per issue')
+    parser.add_argument('--components', type=int, default=1, help='mean components per issue')
+    parser.add_argument('--security', type=float, default=0.05, help='share of issues with a security level')
+    parser.add_argument('--epics', type=float, default=0.02, help='share of issues that are epics')
+    parser.add_argument('--attachments', type=float, default=0.0, help='share of issues with attachments')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = ExportGenerator(args.project, args.issues, args.comments, args.links, args.labels,
+                                components=args.components, security=args.security, epics=args.epics,
+                                attachments=args.attachments, seed=args.seed)
+    file_names = generator.write(args.output_dir, args.per_file)
+    print(f'Wrote {args.issues} issues to {len(file_names)} files in {args.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
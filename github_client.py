@@ -0,0 +1,258 @@
+"""
+Shared GitHub REST client used for every call the migration makes.
+
+All requests go through one pooled keep-alive session. Writes are paced by a
+token bucket, and every response's rate-limit headers feed back into it, so a
+run slows down before it is throttled instead of after. Throttled and
+transient failures (429, rate-limit 403s, 5xx, dropped connections) are
+retried according to Retry-After, X-RateLimit-Reset or exponential backoff.
+Latency, status codes, retries and waits are recorded in a metrics.Metrics.
+
+POST and PATCH requests are not idempotent: one that failed with a 5xx, or
+with an error after it was sent, may have been applied all the same, and
+sending it again could import an issue or post a comment twice. Those are
+only retried when rate limited, which GitHub guarantees was not applied.
+Otherwise the 5xx response is returned, or the error raised, and the caller
+checks what GitHub has before trying again (see may_have_applied).
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from metrics import Metrics
+
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+WRITE_METHODS = ('POST', 'PATCH', 'PUT', 'DELETE')
+NON_IDEMPOTENT_METHODS = ('POST', 'PATCH')
+# Seconds to connect and to wait for a response, so a stalled connection cannot hang a worker
+DEFAULT_TIMEOUT = (10, 60)
+
+
+def retry_after_seconds(value):
+    """
+    Seconds to wait according to a Retry-After header, which holds either a
+    number of seconds or an HTTP date. None if it is neither.
+    """
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max((moment - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def was_sent(error):
+    """
+    Whether a request that failed with `error` may have reached the server,
+    i.e. anything but failing to connect.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return not isinstance(reason, ConnectTimeoutError)
+
+
+def may_have_applied(response):
+    """
+    Whether a failed write answered with `response` may have been applied anyway.
+    """
+    return response.status_code >= 500
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate` tokens are added per second up to
+    `capacity`; `acquire` blocks until a token is available.
+    """
+
+    def __init__(self, rate, capacity):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def wait_if_paused(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """
+        Hold back every caller for `seconds`, e.g. until a rate-limit window resets.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+    def adapt(self, remaining, seconds_to_reset):
+        """
+        Spread the remaining quota evenly over the rest of the window, never
+        going faster than the configured base rate.
+        """
+        with self._lock:
+            self.rate = max(min(self.base_rate, remaining / max(seconds_to_reset, 1)), 0.01)
+
+
+class GitHubClient:
+    def __init__(self, accesstoken, api_url=GITHUB_API_URL, concurrency=4, max_retries=5, backoff=1.0,
+                 writes_per_second=1.0, write_burst=10, metrics=None, timeout=DEFAULT_TIMEOUT):
+        self.api_url = api_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.metrics = metrics or Metrics()
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.headers.update({
+            "Authorization": f"token {accesstoken}",
+            "Accept": "application/vnd.github+json",
+        })
+        # At most `concurrency` requests are on the wire at once, whatever the number of caller threads
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._write_bucket = TokenBucket(writes_per_second, write_burst)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request('PATCH', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        """
+        Send a request, retrying throttled and transient failures. `path` is
+        either relative to the API root or an absolute URL returned by the API.
+        The last response is returned even if it is still an error.
+
+        Requests that are not `idempotent`, by default POST and PATCH, are
+        only retried if rate limited or if they could not connect.
+        """
+        if idempotent is None:
+            idempotent = method not in NON_IDEMPOTENT_METHODS
+        url = path if path.startswith('http') else self.api_url + path
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.metrics.count('retries')
+            waiting = time.perf_counter()
+            if method in WRITE_METHODS:
+                self._write_bucket.acquire()
+            else:
+                self._write_bucket.wait_if_paused()
+            with self._slots:
+                started = time.perf_counter()
+                self.metrics.add_time('api_wait', started - waiting)
+                try:
+                    response = self._session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as error:
+                    self.metrics.count('connection_errors')
+                    if attempt == self.max_retries or (not idempotent and was_sent(error)):
+                        raise
+                    response = None
+                else:
+                    self.metrics.observe_request(method, response.status_code, time.perf_counter() - started)
+            if response is None:
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+
+            self._observe_rate_limit(response)
+            delay = self._retry_delay(response, attempt, idempotent)
+            if delay is None or attempt == self.max_retries:
+                return response
+            time.sleep(delay)
+        return response
+
+    def paginate(self, path, params=None, **kwargs):
+        """
+        Yield every item of a paginated listing, following the Link headers.
+        """
+        params = dict(params or {})
+        params.setdefault('per_page', 100)
+        response = self.get(path, params=params, **kwargs)
+        while True:
+            response.raise_for_status()
+            yield from response.json()
+            next_page = response.links.get('next')
+            if next_page is None:
+                return
+            response = self.get(next_page['url'], **kwargs)
+
+    def graphql(self, query, variables=None, idempotent=None):
+        """
+        Run a GraphQL query. Mutations count as not `idempotent` unless told otherwise.
+        """
+        if idempotent is None:
+            idempotent = not query.lstrip().startswith('mutation')
+        response = self.post('/graphql', json={'query': query, 'variables': variables or {}}, idempotent=idempotent)
+        response.raise_for_status()
+        return response.json()
+
+    def _observe_rate_limit(self, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is not None and reset is not None:
+            self._write_bucket.adapt(int(remaining), int(reset) - time.time())
+
+    def _retry_delay(self, response, attempt, idempotent=True):
+        """
+        Seconds to wait before retrying `response`, or None if it should not be retried.
+        """
+        if response.status_code == 403:
+            if response.headers.get('X-RateLimit-Remaining') != '0' and 'rate limit' not in response.text.lower():
+                return None
+        elif response.status_code not in RETRY_STATUS_CODES:
+            return None
+        elif response.status_code != 429 and not idempotent:
+            return None
+
+        retry_after = retry_after_seconds(response.headers.get('Retry-After', ''))
+        if retry_after is not None:
+            delay = retry_after
+        elif response.headers.get('X-RateLimit-Remaining') == '0' and 'X-RateLimit-Reset' in response.headers:
+            delay = max(float(response.headers['X-RateLimit-Reset']) - time.time(), 0) + 1
+        else:
+            delay = self.backoff * 2 ** attempt
+
+        if response.status_code in (403, 429):
+            # Rate limits apply to the whole token, so every thread has to wait
+            self._write_bucket.pause(delay)
+            self.metrics.count('rate_limit_waits')
+            self.metrics.add_time('rate_limit_wait', delay)
+        return delay
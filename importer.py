@@ -1,53 +1,423 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from crossref import index_from_repositories
 import requests
 
+from github_client import GitHubClient, may_have_applied
+from issues import comment_identity
+from ledger import SUBMITTED, IMPORTED, FAILED
+
+# The issue-import API is still served under its preview media type
+IMPORT_MEDIA_TYPE = 'application/vnd.github.golden-comet-preview+json'
+# Failed status polls after which an import is given up as failed; 404 and 410 give up at once
+MAX_POLL_FAILURES = 5
+
+
+class Repository:
+    """
+    What a repository already has, listed once and kept up to date as things
+    are created: milestone title -> number (None if it could not be created),
+    and lower-cased label name -> name (label names ignore case on GitHub).
+    Its issues, Jira key -> (repository, number), are only listed when an
+    earlier run left the outcome of an import unknown. Importers of several
+    projects migrated into one repository share it.
+    """
+
+    def __init__(self):
+        self.milestones = None
+        self.labels = None
+        self.issues = None
+        self.lock = threading.Lock()
+
+
 class Importer:
-    def __init__(self, options, project):
+    def __init__(self, options, project, client=None, ledger=None, max_in_flight=50, poll_interval=1.0,
+                 repository=None):
         self.accesstoken = options.accesstoken
         self.account = options.account
-        self.repo = options.repo
+        # main.py passes the full repository URL, the API only wants the name
+        self.repo = options.repo.rstrip('/').rsplit('/', 1)[-1]
         self.project = project
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+
+        # Importers for different repositories can share one client, and with it the rate limit
+        self._client = client or GitHubClient(self.accesstoken)
+        self.ledger = ledger
+        # Status URL of each submitted import that has not finished yet -> Jira key
+        self._pending = {}
+        # Status URL -> number of polls that did not return a status
+        self._poll_failures = {}
+        # Several pipeline workers can submit to one importer; only one of them polls at a time
+        self._pending_lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        if ledger is not None:
+            # Imports submitted by an interrupted run are polled again rather than resubmitted.
+            # Another project migrated into the same repository has an importer of its own
+            self._pending.update((url, key) for url, key in ledger.pending_imports(self.repo).items()
+                                 if key.rsplit('-', 1)[0] == project.name)
+        # Jira key -> GitHub issue number, or None if the import failed
+        self.results = {}
+        # Jira key -> GitHub issue number of already migrated issues updated by a sync
+        self.updated = {}
+        self._repository = repository or Repository()
+        self._label_selector = None
 
-    def import_milestones(self):
-        # Simulating the milestone import process
-        print(f"Simulating migration of milestones to repository {self.repo}")
+    def import_milestones(self, milestones=None, workers=4):
+        """
+        Create the project's milestones (or just `milestones`) that the
+        repository does not have yet, `workers` at a time. The existing ones
+        are listed once, so later calls only hit the API for new names. A
+        milestone that could not be created is not tried again. Returns the
+        number of milestones created, not counting ones found to exist.
+        """
+        names = self.project.get_milestones() if milestones is None else milestones
+        repository = self._repository
+        with repository.lock:
+            if repository.milestones is None:
+                repository.milestones = self._list_milestones()
+            missing = [name for name in dict.fromkeys(names) if name not in repository.milestones]
+            results = self._create_all(self._create_milestone, missing, workers)
+            repository.milestones.update((name, number) for name, (number, _) in zip(missing, results))
+        return sum(1 for _, created in results if created)
 
-    def import_labels(self, label_selector):
-        # Simulating the label import process
-        print(f"Simulating migration of labels to repository {self.repo}")
+    def import_labels(self, label_selector, labels=None, workers=4):
+        """
+        Create the project's labels (or just `labels`) that the repository
+        does not have yet, coloured by `label_selector`, `workers` at a time.
+        The existing ones are listed once, so later calls only hit the API for
+        new names. Returns the number of labels created, not counting ones
+        found to exist.
+        """
+        names = self.project.get_all_labels() if labels is None else labels
+        repository = self._repository
+        if repository.labels is not None and all(name.lower() in repository.labels for name in names):
+            return 0
+        with repository.lock:
+            self._label_selector = label_selector
+            if repository.labels is None:
+                repository.labels = {label['name'].lower(): label['name'] for label in
+                                     self._client.paginate(f"/repos/{self.account}/{self.repo}/labels")}
+            missing = list({name.lower(): name for name in names if name.lower() not in repository.labels}.values())
+            results = self._create_all(self._create_label, missing, workers)
+            repository.labels.update((name.lower(), name) for name, (done, _) in zip(missing, results) if done)
+        return sum(1 for _, created in results if created)
+
+    def milestone_number(self, name):
+        """
+        GitHub number of milestone `name`, creating it if the repository does
+        not have it yet. None if it could not be created.
+        """
+        milestones = self._repository.milestones
+        if milestones is None or name not in milestones:
+            self.import_milestones([name])
+        return self._repository.milestones.get(name)
 
     def import_issues(self, start_from_issue):
-        # Simulate importing the issues
-        for issue in self.project._project['Issues'][start_from_issue:]:
-            print(f"Simulating migration of issue {issue['key']} to repository {self.repo}")
-            # Debug: Construct and print the API URL
-            issue_url = f"https://api.github.com/repos/{self.account}/{self.repo}/issues"
-            print(f"Debug: Issue API URL = {issue_url}")
-
-            # Debug: Print headers
-            headers = {
-                "Authorization": f"token {self.accesstoken}",
-                "Accept": "application/vnd.github+json",
-            }
-            print(f"Debug: Headers = {headers}")
-
-            # Debug: Print payload
-            payload = {
-                "title": issue["summary"],
-                "body": issue.get("description", "No description provided."),
-                "labels": issue.get("labels", [])
-            }
-            print(f"Debug: Payload = {payload}")
-
-            # Attempt to make the API call
-            response = requests.post(issue_url, json=payload, headers=headers)
-            print(f"Debug: Response Status Code = {response.status_code}")
-            print(f"Debug: Response Content = {response.text}")
-
-            if response.status_code != 201:
-                print(f"Failed to create issue '{issue['key']}': {response.status_code} - {response.text}")
+        changed = []
+        for issue in self.project.get_issues()[int(start_from_issue):]:
+            if self.ledger is not None and self.ledger.is_done(issue.key):
+                if not self.ledger.is_current(issue.key, issue.content_hash) and self.update_fields(issue):
+                    changed.append(issue)
             else:
-                print(f"Successfully created issue '{issue['key']}'")
+                self.submit_issue(issue)
+        self.post_process_comments(changed)
+        return self.wait_for_imports()
+
+    def submit_issue(self, issue):
+        """
+        Submit an issue and its comments as a single import request.
+
+        The import runs asynchronously on GitHub's side; up to `max_in_flight`
+        imports are left pending before we start polling for their outcome.
+        Issues the ledger already records as submitted or imported are skipped,
+        and the key is reserved in the ledger before the import is sent, so
+        a key read twice is only submitted once. An issue whose earlier
+        submission has an unknown outcome is looked up in the repository
+        first. Returns True if the issue was submitted.
+        """
+        if self.ledger is not None:
+            if self.ledger.is_unconfirmed(issue.key):
+                number = self._find_issue(issue.key)
+                if number is not None:
+                    self._record(issue.key, IMPORTED, number)
+                    print(f"Issue '{issue.key}' was already imported as #{number}")
+                    return False
+            if not self.ledger.reserve(issue.key, self.repo, content_hash=issue.content_hash,
+                                       comments=[comment_identity(comment) for comment in issue.comments]):
+                return False
+
+        while len(self._pending) >= self.max_in_flight:
+            self._poll_imports()
+
+        try:
+            response = self._client.post(f"/repos/{self.account}/{self.repo}/import/issues",
+                                         json=self._import_payload(issue), headers={"Accept": IMPORT_MEDIA_TYPE})
+        except requests.RequestException as error:
+            response = error
+        self._client.metrics.count('issues_submitted')
+        if isinstance(response, requests.RequestException) or may_have_applied(response):
+            # The import may have been accepted all the same. The key stays reserved without an import URL,
+            # so the next run looks for the issue in the repository before submitting it again
+            print(f"Import of issue '{issue.key}' may or may not have been accepted: "
+                  f"{getattr(response, 'status_code', response)}")
+            self.results[issue.key] = None
+            self._client.metrics.count('issues_unconfirmed')
+            return False
+        if response.status_code != 202:
+            print(f"Failed to submit issue '{issue.key}': {response.status_code} - {response.text}")
+            self._record(issue.key, FAILED)
+            return False
+
+        import_url = response.json()['url']
+        with self._pending_lock:
+            self._pending[import_url] = issue.key
+        if self.ledger is not None:
+            self.ledger.record(issue.key, self.repo, SUBMITTED, import_url=import_url)
+        return True
+
+    def update_issue(self, issue):
+        """
+        Bring an already imported issue up to date with `issue`: update_fields,
+        then post_comments. Returns True if the issue was updated.
+        """
+        return self.update_fields(issue) and self.post_comments(issue)
+
+    def update_fields(self, issue):
+        """
+        Overwrite the title, body, state and labels of an already imported
+        issue. Its new comments are left to post_comments. Returns True if the
+        issue was updated.
+        """
+        repo, _, number, _ = self.ledger.get(issue.key)
+        fields = {
+            "title": issue.title,
+            "body": issue.body,
+            "state": "closed" if issue.closed else "open",
+            "labels": list(issue.labels),
+        }
+        if issue.milestone_name:
+            fields["milestone"] = self.milestone_number(issue.milestone_name)
+        # Setting the fields again gives the same issue, so this may be resent
+        response = self._client.patch(f"/repos/{self.account}/{repo}/issues/{number}", json=fields, idempotent=True)
+        if response.status_code != 200:
+            print(f"Failed to update issue '{issue.key}' (#{number}): {response.status_code} - {response.text}")
+            return False
+        # The body on GitHub lost its cross-reference links, so the next rewrite has to run again
+        self.ledger.record_rewrite(issue.key, None)
+        return True
+
+    def post_comments(self, issue):
+        """
+        Append the comments of an already imported issue that GitHub does not
+        have yet, oldest first. Comments GitHub already has are left alone,
+        since they cannot be re-imported. The ledger records which comments
+        were posted rather than how many, so a comment deleted in Jira or a
+        subtask note sorting before older comments does not shift the rest.
+
+        Progress is saved after every comment, so an interrupted run carries
+        on after the last comment posted instead of posting it twice. The new
+        content hash is only recorded once every comment is posted, so a
+        failed issue is picked up again by the next sync. Returns True if the
+        issue is up to date.
+        """
+        repo, _, number, _ = self.ledger.get(issue.key)
+        content_hash, known_comments = self.ledger.fingerprint(issue.key)
+        comments = issue.comments_in_order()
+        posted = self.ledger.posted_comments(issue.key)
+        if posted is None:
+            # Recorded before comment identities: the first `known_comments` were posted, or, without even
+            # a count, assume nothing is missing
+            known = comments if known_comments is None else comments[:known_comments]
+            posted = {comment_identity(comment) for comment in known}
+        posted = set(posted)
+
+        for comment in comments:
+            identity = comment_identity(comment)
+            if identity in posted:
+                continue
+            try:
+                response = self._client.post(f"/repos/{self.account}/{repo}/issues/{number}/comments",
+                                             json={"body": comment.body})
+                failure = None if response.status_code == 201 else f"{response.status_code} - {response.text}"
+                unsure = failure is not None and may_have_applied(response)
+            except requests.RequestException as error:
+                failure, unsure = str(error), True
+            # A comment that may have been posted all the same is looked for before giving up on it
+            if unsure and self._has_comment(repo, number, comment.body):
+                failure = None
+            if failure is not None:
+                print(f"Failed to add a comment to issue '{issue.key}' (#{number}): {failure}")
+                return False
+            posted.add(identity)
+            self.ledger.record(issue.key, repo, IMPORTED, number=number, content_hash=content_hash,
+                               comments=posted)
+            self.ledger.flush()
+            self._client.metrics.count('comments_posted')
+
+        self.ledger.record(issue.key, repo, IMPORTED, number=number, content_hash=issue.content_hash,
+                           comments=posted)
+        self.updated[issue.key] = number
+        self._client.metrics.count('issues_updated')
+        print(f"Updated issue '{issue.key}' (#{number})")
+        return True
+
+    def fail(self, key):
+        """
+        Record `key` as failed, after an error that stopped its submission before the import was sent.
+        """
+        self._record(key, FAILED)
+
+    def post_process_comments(self, issues, workers=4):
+        """
+        Run post_comments for each of `issues` on a pool of `workers` threads.
+        The comments of one issue are always posted by one thread, in order,
+        while different issues proceed in parallel. Returns the number of
+        issues brought up to date.
+        """
+        if not issues:
+            return 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(self.post_comments, issues))
+
+    def wait_for_imports(self):
+        """
+        Poll until every submitted import has finished and return the results.
+        """
+        while self._pending:
+            self._poll_imports()
+        if self.ledger is not None:
+            self.ledger.flush()
+        return self.results
+
+    def _poll_imports(self):
+        if not self._poll_lock.acquire(blocking=False):
+            # Another worker is already polling; wait for its round instead of polling twice
+            with self._poll_lock:
+                return
+        try:
+            time.sleep(self.poll_interval)
+            with self._pending_lock:
+                pending = list(self._pending.items())
+            for url, key in pending:
+                try:
+                    response = self._client.get(url, headers={"Accept": IMPORT_MEDIA_TYPE})
+                except requests.RequestException as error:
+                    # Counted like a failed poll, so one unreachable status cannot end the run
+                    print(f"Failed to poll the import of issue '{key}': {error}")
+                    response = None
+                if response is None or response.status_code != 200:
+                    failures = self._poll_failures.get(url, 0) + 1
+                    if (response is None or response.status_code not in (404, 410)) and failures < MAX_POLL_FAILURES:
+                        self._poll_failures[url] = failures
+                        continue
+                    # e.g. a stale status URL resumed from the ledger: give up rather than poll forever
+                    self._record(key, FAILED)
+                    print(f"Failed to get the import status of issue '{key}': "
+                          f"{response.status_code if response is not None else 'unreachable'}")
+                    self._poll_failures.pop(url, None)
+                    with self._pending_lock:
+                        del self._pending[url]
+                    continue
+                status = response.json()
+                if status['status'] == 'imported':
+                    self._record(key, IMPORTED, int(status['issue_url'].rsplit('/', 1)[-1]))
+                    print(f"Successfully imported issue '{key}' as #{self.results[key]}")
+                elif status['status'] == 'failed':
+                    self._record(key, FAILED)
+                    print(f"Failed to import issue '{key}': {status.get('errors')}")
+                else:
+                    continue
+                with self._pending_lock:
+                    del self._pending[url]
+        finally:
+            self._poll_lock.release()
+
+    def _create_all(self, create, names, workers):
+        if not names:
+            return []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(create, names))
+
+    def _has_comment(self, repo, number, body):
+        return any(remote['body'] == body for remote in
+                   self._client.paginate(f"/repos/{self.account}/{repo}/issues/{number}/comments"))
+
+    def _find_issue(self, key):
+        """
+        GitHub number of the issue imported for `key`, if the repository has one.
+        """
+        with self._repository.lock:
+            if self._repository.issues is None:
+                self._repository.issues = index_from_repositories(self._client, self.account, [self.repo])
+        found = self._repository.issues.get(key)
+        return found[1] if found is not None else None
+
+    def _list_milestones(self):
+        return {milestone['title']: milestone['number'] for milestone in
+                self._client.paginate(f"/repos/{self.account}/{self.repo}/milestones", params={"state": "all"})}
+
+    def _create_milestone(self, title):
+        """
+        Return (number or None, whether this request created it).
+        """
+        response = self._client.post(f"/repos/{self.account}/{self.repo}/milestones", json={"title": title})
+        if response.status_code == 422 or may_have_applied(response):
+            # Created since the repository was listed, e.g. by another run, or by this request despite
+            # the error: take the existing one
+            number = self._list_milestones().get(title)
+            if number is not None:
+                created = response.status_code != 422
+                self._client.metrics.count('milestones_created' if created else 'milestones_existing')
+                return number, created
+        if response.status_code != 201:
+            print(f"Failed to create milestone '{title}': {response.status_code} - {response.text}")
+            return None, False
+        print(f"Created milestone '{title}' in repository {self.repo}")
+        self._client.metrics.count('milestones_created')
+        return response.json()['number'], True
+
+    def _create_label(self, name):
+        """
+        Return (whether the repository has the label now, whether this request created it).
+        """
+        response = self._client.post(f"/repos/{self.account}/{self.repo}/labels",
+                                     json={"name": name, "color": self._label_selector.get_colour(name)})
+        # 422 means it exists already, e.g. under a different case
+        if response.status_code == 422:
+            self._client.metrics.count('labels_existing')
+            return True, False
+        if response.status_code != 201:
+            print(f"Failed to create label '{name}': {response.status_code} - {response.text}")
+            return False, False
+        self._client.metrics.count('labels_created')
+        return True, True
+
+    def _record(self, key, status, number=None):
+        self.results[key] = number
+        self._client.metrics.count(f'issues_{status}')
+        if self.ledger is not None:
+            self.ledger.record(key, self.repo, status, number=number)
 
-    def post_process_comments(self):
-        # Simulate post-processing comments
-        print(f"Simulating post-processing of comments in repository {self.repo}")
+    def _import_payload(self, issue):
+        payload = {
+            "issue": {
+                "title": issue.title,
+                "body": issue.body,
+                "created_at": issue.created_at,
+                "updated_at": issue.updated_at,
+                "closed": issue.closed,
+                "labels": list(issue.labels),
+            },
+            "comments": [{"created_at": comment.created_at, "body": comment.body}
+                         for comment in issue.comments_in_order()],
+        }
+        if issue.closed_at:
+            payload["issue"]["closed_at"] = issue.closed_at
+        if issue.milestone_name:
+            milestone = self.milestone_number(issue.milestone_name)
+            if milestone is not None:
+                payload["issue"]["milestone"] = milestone
+        return payload
@@ -0,0 +1,164 @@
+"""
+On-disk cache of the issues and counters Project builds from each export file.
+
+Transforming an export means parsing all of its XML and rendering every
+issue, which dominates simulation and fetch_labels.py runs. The cache keeps
+the result for each file in SQLite, keyed by the SHA-256 of the file's
+contents and by the transform configuration: the project settings and a
+digest of the code that does the transform, so editing that code invalidates
+the cache by itself. A file is only hashed again when its size or
+modification time changed.
+
+Labels are not part of the key. Cached issues keep their raw Jira labels and
+are resolved again on load, so iterating on labels_mapping.txt and
+allowed_labels.txt never re-transforms anything. The import date in each body
+is stored as a placeholder and filled in with today's date on load.
+
+Entries of every configuration are kept, so alternating between projects, or
+between main.py and fetch_labels.py, does not evict anything. Each entry
+records when it was last used, and once the cache outgrows its size limit,
+closing it drops the least recently used entries.
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+# Bump when the cached data changes in a way the code digest does not catch
+CACHE_FORMAT = 1
+# The modules whose code decides what a transformed file looks like
+TRANSFORM_MODULES = ('project.py', 'issues.py', 'renderer.py', 'timestamps.py', 'utils.py')
+IMPORTED_PLACEHOLDER = '\0imported\0'
+# Bytes of cached data kept by default, see IngestCache.evict
+DEFAULT_MAX_SIZE = 2 << 30
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _code_digest():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for module in TRANSFORM_MODULES:
+        with open(os.path.join(directory, module), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class IngestCache:
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        # Used by one thread at a time, but not necessarily the one that opened it (see pipeline.py)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS partials '
+            '(digest TEXT, config TEXT, data BLOB, used REAL, PRIMARY KEY (digest, config))')
+        # Caches written before eviction by age lack the last use
+        if 'used' not in {row[1] for row in self._connection.execute('PRAGMA table_info(partials)')}:
+            self._connection.execute('ALTER TABLE partials ADD COLUMN used REAL')
+        self._connection.commit()
+        # Path -> content digest, for files already looked at in this run
+        self._digests = {}
+        # Files loaded from the cache and files transformed, see has_all
+        self.hits = 0
+        self.misses = 0
+
+    def config_key(self, project):
+        """
+        The part of the cache key that depends on the project rather than the file.
+        """
+        config = (CACHE_FORMAT, _code_digest(), project.name, project.doneStatusCategoryId, project.jiraBaseUrl,
+                  os.getenv('JIRA_MIGRATION_INCLUDE_COMPONENT_IN_LABELS', 'true'))
+        return hashlib.sha256(repr(config).encode()).hexdigest()
+
+    def has(self, path, config):
+        return self._connection.execute('SELECT 1 FROM partials WHERE digest = ? AND config = ?',
+                                        (self._digest(path), config)).fetchone() is not None
+
+    def has_all(self, path, configs):
+        """
+        Whether `path` is cached for every one of `configs`, counted as one hit or miss per file.
+        """
+        found = all(self.has(path, config) for config in configs)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def load(self, path, config, imported_field):
+        """
+        The cached partial project for `path`, or None.
+        """
+        row = self._connection.execute('SELECT data FROM partials WHERE digest = ? AND config = ?',
+                                       (self._digest(path), config)).fetchone()
+        if row is None:
+            return None
+        self._connection.execute('UPDATE partials SET used = ? WHERE digest = ? AND config = ?',
+                                 (time.time(), self._digest(path), config))
+        self._connection.commit()
+        partial = pickle.loads(row[0])
+        for issue in partial['Issues']:
+            issue.body = issue.body.replace(IMPORTED_PLACEHOLDER, imported_field, 1)
+        return partial
+
+    def store(self, path, config, partial, imported_field):
+        issues = list(partial['Issues'])
+        bodies = [issue.body for issue in issues]
+        try:
+            for issue in issues:
+                issue.body = issue.body.replace(imported_field, IMPORTED_PLACEHOLDER, 1)
+            data = pickle.dumps(partial, pickle.HIGHEST_PROTOCOL)
+        finally:
+            for issue, body in zip(issues, bodies):
+                issue.body = body
+        self._connection.execute('INSERT OR REPLACE INTO partials (digest, config, data, used) VALUES (?, ?, ?, ?)',
+                                 (self._digest(path), config, data, time.time()))
+        self._connection.commit()
+
+    def evict(self):
+        """
+        Drop the least recently used entries until the rest fit in `max_size`
+        bytes. Returns the number of entries dropped.
+        """
+        total = 0
+        stale = []
+        for rowid, size in self._connection.execute(
+                'SELECT rowid, length(data) FROM partials ORDER BY used DESC').fetchall():
+            total += size
+            if total > self.max_size:
+                stale.append((rowid,))
+        self._connection.executemany('DELETE FROM partials WHERE rowid = ?', stale)
+        self._connection.commit()
+        return len(stale)
+
+    def close(self):
+        self.evict()
+        self._connection.close()
+
+    def _digest(self, path):
+        if path in self._digests:
+            return self._digests[path]
+        stat = os.stat(path)
+        row = self._connection.execute('SELECT size, mtime_ns, digest FROM files WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            digest = row[2]
+        else:
+            digest = _file_digest(path)
+            self._connection.execute('INSERT OR REPLACE INTO files (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)',
+                                     (path, stat.st_size, stat.st_mtime_ns, digest))
+            self._connection.commit()
+        self._digests[path] = digest
+        return digest
@@ -0,0 +1,194 @@
+"""
+Compact in-memory representation of the issues collected by Project.
+
+An IssueRecord uses __slots__ and only allocates its comment list and link
+lists once something is added to them, since most issues have no links and
+many have no comments. Label strings are interned, so the handful of distinct
+labels are shared across all issues.
+
+IssueStore keeps the records in insertion order. With a spill path it pickles
+each record into a SQLite file as soon as it is added and keeps only the
+Jira keys in memory, for projects too large to hold every rendered body.
+
+Each record carries a content hash of everything that is migrated, so a
+later sync can tell which already migrated issues changed. Comments are
+identified by comment_identity, so a sync can tell which ones were posted.
+"""
+
+import hashlib
+import pickle
+import sqlite3
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+LINK_TYPES = ('duplicates', 'is-duplicated-by', 'is-related-to', 'depends-on', 'blocks')
+
+# `id` is the Jira comment id; the notes added for subtasks and parent tasks have none
+Comment = namedtuple('Comment', 'created_at body id', defaults=(None,))
+Attachment = namedtuple('Attachment', 'id name size')
+
+
+def comment_identity(comment):
+    """
+    A stable identity for `comment`, whatever its position among the others:
+    its Jira id, or for the generated notes a hash of their time and text.
+    """
+    if comment.id:
+        return comment.id
+    return hashlib.sha1(f'{comment.created_at}\0{comment.body}'.encode()).hexdigest()
+
+
+class IssueRecord:
+    __slots__ = ('key', 'title', 'body', 'created_at', 'updated_at', 'closed', 'closed_at', 'labels',
+                 'milestone_name', 'epic_link', 'content_hash', 'security', 'source_labels', '_comments', '_links',
+                 '_attachments')
+
+    def __init__(self, key, title, body, created_at, updated_at, closed, closed_at=None, labels=()):
+        self.key = key
+        self.title = title
+        self.body = body
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.closed = closed
+        self.closed_at = closed_at
+        self.labels = tuple(sys.intern(label) for label in labels)
+        self.milestone_name = None
+        self.epic_link = None
+        self.content_hash = None
+        # Name of the Jira security level, if any
+        self.security = None
+        # (labels derived from components and type, raw Jira labels), so labels can be resolved again
+        self.source_labels = None
+        self._comments = None
+        self._links = None
+        self._attachments = None
+
+    @property
+    def comments(self):
+        return self._comments if self._comments is not None else ()
+
+    def add_comment(self, created_at, body, comment_id=None):
+        if self._comments is None:
+            self._comments = []
+        self._comments.append(Comment(created_at, body, comment_id))
+
+    def comments_in_order(self):
+        """
+        The comments oldest first. Jira comments already come in that order,
+        but the subtask and parent task notes carry the issue's creation time.
+        """
+        return sorted(self.comments, key=lambda comment: datetime.fromisoformat(comment.created_at))
+
+    def rewrite_comments(self, rewrite):
+        """
+        Replace the body of every comment with `rewrite(body)`.
+        """
+        if self._comments is not None:
+            self._comments = [comment._replace(body=rewrite(comment.body)) for comment in self._comments]
+
+    @property
+    def attachments(self):
+        return self._attachments if self._attachments is not None else ()
+
+    def add_attachment(self, attachment_id, name, size=None):
+        if self._attachments is None:
+            self._attachments = []
+        self._attachments.append(Attachment(attachment_id, name, size))
+
+    def links(self, link_type):
+        if self._links is None:
+            return ()
+        return self._links.get(link_type, ())
+
+    def add_link(self, link_type, key):
+        if self._links is None:
+            self._links = {}
+        self._links.setdefault(link_type, []).append(key)
+
+    def compute_hash(self, body=None):
+        """
+        A hash of the migrated content. `body` overrides the rendered body,
+        for bodies carrying parts that change without the issue changing.
+        """
+        digest = hashlib.sha1()
+        parts = [self.title, self.body if body is None else body, str(self.closed), self.closed_at,
+                 self.milestone_name, self.epic_link]
+        parts.extend(self.labels)
+        for comment in self.comments:
+            parts.extend((comment.created_at, comment.body))
+        for link_type in LINK_TYPES:
+            parts.append(link_type)
+            parts.extend(self.links(link_type))
+        # Only issues with attachments hash them, so the hashes of all other issues stay as they were
+        for attachment in self.attachments:
+            parts.extend((attachment.id, attachment.name))
+        for part in parts:
+            digest.update((part or '').encode())
+            # Separator, so moving text from one part to the next changes the hash
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+
+class IssueStore:
+    def __init__(self, spill_path=None):
+        self._keys = []
+        self._records = None
+        self._connection = None
+        if spill_path is None:
+            self._records = []
+        else:
+            # Filled from the pipeline's ingest thread, read back from the main thread afterwards
+            self._connection = sqlite3.connect(spill_path, check_same_thread=False)
+            # Scratch storage, rebuilt on every run, so durability does not matter
+            self._connection.execute('PRAGMA journal_mode=OFF')
+            self._connection.execute('PRAGMA synchronous=OFF')
+            self._connection.execute('DROP TABLE IF EXISTS issues')
+            self._connection.execute('CREATE TABLE issues (position INTEGER PRIMARY KEY, data BLOB)')
+
+    def append(self, record):
+        if self._records is not None:
+            self._records.append(record)
+        else:
+            self._connection.execute('INSERT INTO issues (position, data) VALUES (?, ?)',
+                                     (len(self._keys), pickle.dumps(record, pickle.HIGHEST_PROTOCOL)))
+        self._keys.append(record.key)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def keys(self):
+        return list(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        if self._records is not None:
+            return iter(self._records)
+        return (pickle.loads(row[0]) for row in
+                self._connection.execute('SELECT data FROM issues ORDER BY position'))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if self._records is not None:
+            return self._records[index]
+        if index < 0:
+            index += len(self._keys)
+        if not 0 <= index < len(self._keys):
+            raise IndexError('issue index out of range')
+        row = self._connection.execute('SELECT data FROM issues WHERE position = ?', (index,)).fetchone()
+        return pickle.loads(row[0])
+
+    def __getstate__(self):
+        # Only in-memory stores cross process boundaries, e.g. from parallel ingest workers
+        return {'_keys': self._keys, '_records': list(self), '_connection': None}
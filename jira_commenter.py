@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+"""
+Comment on each migrated Jira issue with a link to its GitHub issue.
+
+The Jira key -> GitHub issue mapping is read from jira-keys-to-github-id.txt
+(one KEY:NUMBER per line, e.g. "INFRA-545:415") or, when that file does not
+exist, from the migration ledger. Comments are posted concurrently through
+one pooled session. Throttled (429/503) and failed requests are retried,
+honouring Retry-After. Before posting, the issue's comments are checked for
+an existing back-link, and every finished key is appended to a progress file,
+so rerunning the commenter never comments twice.
+
+Configuration comes from the environment:
+
+    JIRA_MIGRATION_JIRA_URL, JIRA_MIGRATION_JIRA_USER, JIRA_MIGRATION_JIRA_PASSWORD
+    JIRA_MIGRATION_GITHUB_ISSUES_URL  e.g. https://github.com/jenkins-infra/helpdesk/issues
+                                      (only needed with the mapping file)
+    JIRA_MIGRATION_RELATED_PROJECT_NAME  e.g. Jenkins Infrastructure project
+    JIRA_MIGRATION_RELATED_PROJECT_URL   e.g. https://www.jenkins.io/projects/infrastructure/
+                                         (optional, the project named in the comment as the one the issues relate to)
+"""
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from crossref import GITHUB_URL
+from github_client import DEFAULT_TIMEOUT, retry_after_seconds
+from ledger import MigrationLedger
+
+MAPPING_FILE = 'jira-keys-to-github-id.txt'
+PROGRESS_FILE = 'jira-commenter.progress'
+
+COMMENT_TEMPLATE = (
+    'For your information, [all {project} issues|{jira}/projects/{project}/issues/]{related} have been transferred '
+    'to Github: {issues_url}\n\n'
+    'Here is the direct link to this issue in Github: {issues_url}/{number}\n'
+    'And here is the link to a search for related issues: {issues_url}?q=%22{key}%22\n\n'
+    '(Note: this is an automated bulk comment)')
+RELATED_TEMPLATE = ' related to the [{name}|{url}]'
+
+
+def read_mapping_file(path, issues_url):
+    """
+    Jira key -> (GitHub issues URL, issue number) from a KEY:NUMBER file.
+    """
+    mapping = {}
+    with open(path) as file:
+        for line in file:
+            if ':' in line:
+                key, number = line.strip().split(':', 1)
+                mapping[key] = (issues_url.rstrip('/'), int(number))
+    return mapping
+
+
+def mapping_from_ledger(ledger, account):
+    return {key: (f'{GITHUB_URL}/{account}/{repo}/issues', number)
+            for key, (repo, number) in ledger.imported().items()}
+
+
+class JiraCommenter:
+    def __init__(self, jira_url, user, password, progress_path=PROGRESS_FILE, workers=8, max_retries=5,
+                 backoff=1.0, related_project=None):
+        self.jira_url = jira_url.rstrip('/')
+        # (name, URL) of the project the issues relate to, or None to leave it out of the comment
+        self.related = RELATED_TEMPLATE.format(name=related_project[0], url=related_project[1]) \
+            if related_project else ''
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.auth = (user, password)
+        self._session.headers.update({'Content-Type': 'application/json', 'Accept': 'application/json'})
+
+        self._progress_path = progress_path
+        self._progress_lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(progress_path):
+            with open(progress_path) as file:
+                self.done = {line.strip() for line in file if line.strip()}
+
+    def comment_all(self, mapping):
+        """
+        Back-link every issue in `mapping` not yet done; returns the keys that failed.
+        """
+        pending = [(key, target) for key, target in mapping.items() if key not in self.done]
+        print(f'{len(mapping)} issues, {len(mapping) - len(pending)} already commented')
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for count, (key, ok) in enumerate(executor.map(lambda entry: self._comment(*entry), pending), start=1):
+                if not ok:
+                    failed.append(key)
+                if count % 100 == 0 or count == len(pending):
+                    print(f'Processed {count} of {len(pending)} issues, {len(failed)} failed')
+        return failed
+
+    def _comment(self, key, target):
+        issues_url, number = target
+        body = COMMENT_TEMPLATE.format(project=key.split('-')[0], jira=self.jira_url, related=self.related,
+                                       issues_url=issues_url, number=number, key=key)
+        # The direct link, not followed by another digit so #41 does not match #415
+        marker = re.compile(re.escape(f'{issues_url}/{number}') + r'(?!\d)')
+        comment_url = f'{self.jira_url}/rest/api/2/issue/{key}/comment'
+
+        # Check and post together, so a retry after an ambiguous failure cannot comment twice
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._session.get(comment_url, params={'maxResults': 1000}, timeout=DEFAULT_TIMEOUT)
+                if response.status_code == 200:
+                    if any(marker.search(comment['body']) for comment in response.json().get('comments', [])):
+                        self._mark_done(key)
+                        return key, True
+                    response = self._session.post(comment_url, json={'body': body}, timeout=DEFAULT_TIMEOUT)
+                if response.status_code == 201:
+                    self._mark_done(key)
+                    return key, True
+                if response.status_code not in (429, 500, 502, 503, 504):
+                    print(f'Failed to comment on {key}: {response.status_code} - {response.text}')
+                    return key, False
+                delay = retry_after_seconds(response.headers.get('Retry-After', ''))
+                if delay is None:
+                    delay = self.backoff * 2 ** attempt
+            except (requests.ConnectionError, requests.Timeout):
+                delay = self.backoff * 2 ** attempt
+            time.sleep(delay)
+
+        print(f'Failed to comment on {key}: giving up after {self.max_retries} retries')
+        return key, False
+
+    def _mark_done(self, key):
+        with self._progress_lock:
+            self.done.add(key)
+            with open(self._progress_path, 'a') as file:
+                file.write(key + '\n')
+
+
+if __name__ == '__main__':
+    jira_url = os.getenv('JIRA_MIGRATION_JIRA_URL', 'https://issues.jenkins.io')
+    related_project = None
+    if os.getenv('JIRA_MIGRATION_RELATED_PROJECT_NAME'):
+        related_project = (os.getenv('JIRA_MIGRATION_RELATED_PROJECT_NAME'),
+                           os.getenv('JIRA_MIGRATION_RELATED_PROJECT_URL'))
+    commenter = JiraCommenter(jira_url, os.getenv('JIRA_MIGRATION_JIRA_USER'),
+                              os.getenv('JIRA_MIGRATION_JIRA_PASSWORD'),
+                              workers=int(os.getenv('JIRA_MIGRATION_JIRA_COMMENT_WORKERS', '8')),
+                              related_project=related_project)
+
+    if os.path.exists(MAPPING_FILE):
+        mapping = read_mapping_file(MAPPING_FILE, os.getenv('JIRA_MIGRATION_GITHUB_ISSUES_URL'))
+    else:
+        ledger = MigrationLedger(os.getenv('JIRA_MIGRATION_LEDGER', 'migration_ledger.db'))
+        mapping = mapping_from_ledger(ledger, os.getenv('GITHUB_ACCOUNT'))
+
+    failed = commenter.comment_all(mapping)
+    print(f'Complete, {len(failed)} failed' + (': ' + ', '.join(failed) if failed else ''))
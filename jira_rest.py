@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+"""
+Fetch Jira issues through the REST search API instead of the XML export.
+
+The searchrequest-xml view returns every field of every issue, custom fields
+and all. The REST search only returns the fields listed in FIELDS, the ones
+Project reads, plus the rendered HTML of the description and comments. Each
+issue is turned into an <item> element shaped like the XML export, and every
+page is written as an rss/channel document (rest-N.xml), so Project, main.py
+and the other tools read these pages exactly like exported ones.
+
+Comments come back inline with the issue; only an issue with more comments
+than the search returned needs one extra request for the rest. Pages already
+on disk are skipped, like with the XML export.
+
+Jira may return fewer issues per page than asked for; Cloud caps maxResults
+well below 100 for some fields. The first request finds out the page size
+the server actually uses, and every page is checked to be complete, so a
+capped page fails the fetch instead of silently dropping issues.
+"""
+
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from lxml import etree
+
+from fetch_issues import FILE_PATH, create_session
+
+SEARCH_PATH = '/rest/api/2/search'
+MAX_RESULTS = 100  # Jira's default cap for the REST search
+EPIC_LINK_KEY = 'com.pyxis.greenhopper.jira:gh-epic-link'
+
+# Everything Project reads from an item, and nothing else
+FIELDS = ('summary', 'description', 'issuetype', 'priority', 'status', 'resolution', 'resolutiondate',
+          'assignee', 'reporter', 'labels', 'created', 'updated', 'fixVersions', 'components', 'comment',
+          'issuelinks', 'subtasks', 'parent', 'security', 'project', 'attachment')
+
+
+def search_fields(epic_link_field=None):
+    """
+    The `fields` parameter, with the site specific epic link custom field if known.
+    """
+    return ','.join(FIELDS + ((epic_link_field,) if epic_link_field else ()))
+
+
+def page_path(output_dir, start):
+    return f'{output_dir}/rest-{start}.xml'
+
+
+def search(session, server, jql, start, max_results=MAX_RESULTS, fields='', expand='renderedFields'):
+    response = session.get(server + SEARCH_PATH, params={'jql': jql, 'startAt': start, 'maxResults': max_results,
+                                                         'fields': fields, 'expand': expand})
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_total_results(session, server, jql, max_results=MAX_RESULTS, fields='', expand=''):
+    """
+    Return the number of issues and the page size the server allows, which may be less than `max_results`.
+    The cap can depend on the fields and expansions, so they should be the ones the pages use.
+    """
+    result = search(session, server, jql, 0, max_results=max_results, fields=fields, expand=expand)
+    return result['total'], max(min(max_results, result.get('maxResults', max_results)), 1)
+
+
+def fetch_remaining_comments(session, server, issue):
+    """
+    Complete the issue's comments if the search response truncated them.
+    """
+    comment = issue['fields'].get('comment') or {}
+    if comment.get('total', 0) <= len(comment.get('comments', [])):
+        return
+    response = session.get(f"{server}/rest/api/2/issue/{issue['key']}/comment",
+                           params={'maxResults': comment['total'], 'expand': 'renderedBody'})
+    response.raise_for_status()
+    comments = response.json()['comments']
+    comment['comments'] = comments
+    issue.setdefault('renderedFields', {})['comment'] = {
+        'comments': [{'body': entry.get('renderedBody', entry['body'])} for entry in comments]}
+
+
+def _username(user):
+    # Jira Server identifies users by name, Jira Cloud only by account id
+    return user.get('name') or user.get('accountId') or user.get('displayName')
+
+
+def _user(item, tag, user):
+    if user is None:
+        etree.SubElement(item, tag, username='-1').text = 'Unassigned'
+    else:
+        etree.SubElement(item, tag, username=_username(user)).text = user.get('displayName') or _username(user)
+
+
+def _links(item, issuelinks):
+    if not issuelinks:
+        return
+    by_type = defaultdict(lambda: {'outward': [], 'inward': []})
+    types = {}
+    for link in issuelinks:
+        link_type = link['type']
+        types[link_type['name']] = link_type
+        if 'outwardIssue' in link:
+            by_type[link_type['name']]['outward'].append(link['outwardIssue']['key'])
+        if 'inwardIssue' in link:
+            by_type[link_type['name']]['inward'].append(link['inwardIssue']['key'])
+
+    element = etree.SubElement(item, 'issuelinks')
+    for name, directions in by_type.items():
+        link_type = etree.SubElement(element, 'issuelinktype', id=str(types[name].get('id', '')))
+        etree.SubElement(link_type, 'name').text = name
+        for direction in ('outward', 'inward'):
+            if directions[direction]:
+                links = etree.SubElement(link_type, direction + 'links', description=types[name][direction])
+                for key in directions[direction]:
+                    etree.SubElement(etree.SubElement(links, 'issuelink'), 'issuekey').text = key
+
+
+def issue_to_item(issue, epic_link_field=None):
+    """
+    Build an <item> element with the same shape as the XML export's.
+    """
+    fields = issue['fields']
+    rendered = issue.get('renderedFields') or {}
+    key = issue['key']
+
+    item = etree.Element('item')
+    etree.SubElement(item, 'title').text = f"[{key}] {fields['summary']}"
+    project = fields.get('project') or {}
+    etree.SubElement(item, 'project', key=project.get('key', key.split('-')[0])).text = project.get('name')
+    etree.SubElement(item, 'description').text = rendered.get('description') or ''
+    etree.SubElement(item, 'key', id=str(issue.get('id', ''))).text = key
+    etree.SubElement(item, 'summary').text = fields['summary']
+    etree.SubElement(item, 'type').text = fields['issuetype']['name']
+    if fields.get('priority'):
+        etree.SubElement(item, 'priority').text = fields['priority']['name']
+    status = fields['status']
+    etree.SubElement(item, 'status').text = status['name']
+    etree.SubElement(item, 'statusCategory', id=str(status['statusCategory']['id']),
+                     key=status['statusCategory'].get('key', ''))
+    etree.SubElement(item, 'resolution').text = (fields.get('resolution') or {}).get('name', 'Unresolved')
+    _user(item, 'assignee', fields.get('assignee'))
+    _user(item, 'reporter', fields.get('reporter'))
+    if fields.get('security'):
+        etree.SubElement(item, 'security').text = fields['security']['name']
+
+    labels = etree.SubElement(item, 'labels')
+    for label in fields.get('labels') or ():
+        etree.SubElement(labels, 'label').text = label
+
+    etree.SubElement(item, 'created').text = fields['created']
+    etree.SubElement(item, 'updated').text = fields['updated']
+    if fields.get('resolutiondate'):
+        etree.SubElement(item, 'resolved').text = fields['resolutiondate']
+    for version in fields.get('fixVersions') or ():
+        etree.SubElement(item, 'fixVersion').text = version['name']
+    for component in fields.get('components') or ():
+        etree.SubElement(item, 'component').text = component['name']
+
+    comments = (fields.get('comment') or {}).get('comments') or []
+    if comments:
+        rendered_comments = ((rendered.get('comment') or {}).get('comments')) or []
+        element = etree.SubElement(item, 'comments')
+        for position, comment in enumerate(comments):
+            body = rendered_comments[position]['body'] if position < len(rendered_comments) else comment['body']
+            etree.SubElement(element, 'comment', id=str(comment.get('id', '')), author=_username(comment['author']),
+                             created=comment['created']).text = body
+
+    if fields.get('attachment'):
+        attachments = etree.SubElement(item, 'attachments')
+        for attachment in fields['attachment']:
+            author = _username(attachment['author']) if attachment.get('author') else ''
+            etree.SubElement(attachments, 'attachment', id=str(attachment['id']), name=attachment['filename'],
+                             size=str(attachment.get('size', '')), author=author, created=attachment.get('created', ''))
+
+    _links(item, fields.get('issuelinks'))
+
+    if fields.get('subtasks'):
+        subtasks = etree.SubElement(item, 'subtasks')
+        for subtask in fields['subtasks']:
+            etree.SubElement(subtasks, 'subtask', id=str(subtask.get('id', ''))).text = subtask['key']
+    if fields.get('parent'):
+        etree.SubElement(item, 'parent', id=str(fields['parent'].get('id', ''))).text = fields['parent']['key']
+
+    customfields = etree.SubElement(item, 'customfields')
+    epic_link = fields.get(epic_link_field) if epic_link_field else None
+    if epic_link:
+        customfield = etree.SubElement(customfields, 'customfield', id=epic_link_field, key=EPIC_LINK_KEY)
+        etree.SubElement(customfield, 'customfieldname').text = 'Epic Link'
+        etree.SubElement(etree.SubElement(customfield, 'customfieldvalues'), 'customfieldvalue').text = epic_link
+    return item
+
+
+def page_document(issues, start, total, epic_link_field=None):
+    """
+    Serialize one page of issues as an rss/channel document.
+    """
+    rss = etree.Element('rss', version='0.92')
+    channel = etree.SubElement(rss, 'channel')
+    etree.SubElement(channel, 'title').text = 'Jira'
+    etree.SubElement(channel, 'issue', start=str(start), end=str(start + len(issues)), total=str(total))
+    for issue in issues:
+        channel.append(issue_to_item(issue, epic_link_field))
+    return etree.tostring(rss, xml_declaration=True, encoding='UTF-8')
+
+
+def fetch_page(session, server, jql, start, output_dir, total, epic_link_field=None, max_results=MAX_RESULTS):
+    """
+    Download and convert the page starting at `start` unless it is already on
+    disk. Returns True if the page was downloaded, False if it was skipped.
+    """
+    path = page_path(output_dir, start)
+    if os.path.exists(path):
+        return False
+
+    result = search(session, server, jql, start, max_results, search_fields(epic_link_field))
+    issues = result['issues']
+    # Anything short of a full page before the end would leave a gap nobody notices
+    expected = min(max_results, total - start)
+    if result.get('startAt', start) != start or len(issues) < expected:
+        raise ValueError(f"Page at {start} returned {len(issues)} issues from {result.get('startAt', start)}, "
+                         f"expected {expected}; the server allows {result.get('maxResults')} per page")
+    for issue in issues:
+        fetch_remaining_comments(session, server, issue)
+        if issue['fields'].get('security'):
+            print(f"Issue {issue['key']} has a security level: {issue['fields']['security']['name']}")
+    document = page_document(issues, start, total, epic_link_field)
+
+    tmp_path = path + '.part'
+    with open(tmp_path, 'wb') as doc:
+        doc.write(document)
+    os.replace(tmp_path, path)
+    return True
+
+
+def fetch_issues(server, jql, output_dir=FILE_PATH, workers=4, session=None, epic_link_field=None,
+                 max_results=MAX_RESULTS):
+    """
+    Fetch every page of the query into `output_dir` using `workers` concurrent
+    requests. Pages already present are skipped.
+    """
+    session = session or create_session(workers)
+    os.makedirs(output_dir, exist_ok=True)
+
+    total_results, max_results = fetch_total_results(session, server, jql, max_results,
+                                                     search_fields(epic_link_field), 'renderedFields')
+    starts = list(range(0, total_results, max_results))
+    pending = [start for start in starts if not os.path.exists(page_path(output_dir, start))]
+    print(f'{total_results} issues in {len(starts)} pages, {len(starts) - len(pending)} already fetched')
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_page, session, server, jql, start, output_dir, total_results,
+                                   epic_link_field, max_results): start for start in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            future.result()
+            print(f'Fetched page {futures[future] // max_results + 1} ({done} of {len(pending)} to fetch)')
+
+    print('Complete')
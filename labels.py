@@ -0,0 +1,74 @@
+"""
+Resolution of Jira labels to the GitHub labels they migrate to.
+
+The label mapping and the allowlist are loaded into hash indexes once. Each
+distinct raw label is normalized (stripped and lowercased), mapped and checked
+against the allowlist the first time it is seen, and the outcome is cached for
+every later issue. The resolver counts how many label occurrences were kept,
+remapped or dropped.
+"""
+
+from collections import Counter
+
+from utils import fetch_allowed_labels, fetch_labels_mapping
+
+KEPT = 'kept'
+REMAPPED = 'remapped'
+DROPPED = 'dropped'
+
+
+class LabelResolver:
+    def __init__(self, labels_mapping=None, allowed_labels=None):
+        """
+        `allowed_labels` of None disables filtering; an empty collection drops every label.
+        """
+        self._mapping = {self.normalize(key): self.normalize(value) for key, value in (labels_mapping or {}).items()}
+        self._allowed = None
+        if allowed_labels is not None:
+            self._allowed = frozenset(self.normalize(label) for label in allowed_labels if label.strip())
+        # Raw label -> (resolved label or None, outcome)
+        self._cache = {}
+        self.stats = Counter()
+
+    @classmethod
+    def from_files(cls):
+        return cls(fetch_labels_mapping(), fetch_allowed_labels())
+
+    def copy(self):
+        """
+        A resolver with the same mapping and allowlist and fresh counters.
+        """
+        resolver = LabelResolver()
+        resolver._mapping = self._mapping
+        resolver._allowed = self._allowed
+        return resolver
+
+    @staticmethod
+    def normalize(label):
+        return label.strip().lower()
+
+    def resolve(self, label):
+        """
+        Return the GitHub label for a raw Jira label, or None if it is dropped.
+        """
+        try:
+            resolved, outcome = self._cache[label]
+        except KeyError:
+            resolved, outcome = self._cache[label] = self._resolve(label)
+        self.stats[outcome] += 1
+        return resolved
+
+    def resolve_all(self, labels):
+        resolved = (self.resolve(label) for label in labels if label is not None)
+        return [label for label in resolved if label is not None]
+
+    def _resolve(self, label):
+        normalized = self.normalize(label)
+        mapped = self._mapping.get(normalized, normalized)
+        if self._allowed is not None and mapped not in self._allowed:
+            return None, DROPPED
+        return mapped, REMAPPED if mapped != normalized else KEPT
+
+    def summary(self):
+        return (f'{self.stats[KEPT]} labels kept, {self.stats[REMAPPED]} remapped, '
+                f'{self.stats[DROPPED]} dropped')
@@ -0,0 +1,219 @@
+"""
+Durable record of which Jira issues have been migrated, and where to.
+
+The ledger is a small SQLite database mapping each Jira key to its target
+repository, its import status and, once known, its GitHub issue number. It is
+loaded into memory on open, so checking whether a key is done is a dict
+lookup. Outcomes are committed in batches to keep the number of fsyncs low;
+`flush` and `close` commit whatever is outstanding. Submissions are committed
+straight away, because losing one would mean importing the issue twice. An
+issue is reserved as submitted before its import is even sent, so two
+workers handed the same key cannot both import it, and an entry still
+without an import URL tells a later run that the outcome is unknown.
+
+For incremental syncs the ledger also keeps the content hash each issue was
+migrated with and the identities of the comments GitHub has (see
+issues.comment_identity), so comments added or removed anywhere in Jira are
+told apart from the ones already posted, and a small key/value table holding the
+sync watermarks (see fetch_issues.py). The cross-reference rewrite of each
+issue is recorded as a hash (see crossref.py); recording anything else about
+an issue drops it, since the issue on GitHub may have changed.
+"""
+
+import sqlite3
+import threading
+import time
+
+SUBMITTED = 'submitted'
+IMPORTED = 'imported'
+FAILED = 'failed'
+
+
+def _split(comment_ids):
+    if comment_ids is None:
+        return None
+    return frozenset(comment_ids.split('\n')) if comment_ids else frozenset()
+
+
+class MigrationLedger:
+    def __init__(self, path, batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode this only syncs on checkpoints, a commit still survives a crashed process
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS issues ('
+            'key TEXT PRIMARY KEY, repo TEXT, status TEXT, number INTEGER, import_url TEXT, updated REAL, '
+            'content_hash TEXT, comments INTEGER, comment_ids TEXT)')
+        # Ledgers written before incremental syncs lack the last columns, later ones only the comment identities
+        columns = {row[1] for row in self._connection.execute('PRAGMA table_info(issues)')}
+        for column, column_type in (('content_hash', 'TEXT'), ('comments', 'INTEGER'), ('comment_ids', 'TEXT')):
+            if column not in columns:
+                self._connection.execute(f'ALTER TABLE issues ADD COLUMN {column} {column_type}')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS rewrites (key TEXT PRIMARY KEY, hash TEXT)')
+        self._connection.commit()
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        # Keys reserved by this run, see reserve
+        self._reserved = set()
+        self._entries = {row[0]: row[1:-1] + (_split(row[-1]),) for row in self._connection.execute(
+            'SELECT key, repo, status, number, import_url, content_hash, comments, comment_ids FROM issues')}
+        self._rewrites = dict(self._connection.execute('SELECT key, hash FROM rewrites'))
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def is_done(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] == IMPORTED
+
+    def get(self, key):
+        """
+        Return (repo, status, number, import_url) for `key`, or None.
+        """
+        entry = self._entries.get(key)
+        return entry[:4] if entry is not None else None
+
+    def fingerprint(self, key):
+        """
+        Return (content hash, comment count) `key` was last migrated with; both are None if unknown.
+        """
+        entry = self._entries.get(key)
+        return entry[4:6] if entry is not None else (None, None)
+
+    def posted_comments(self, key):
+        """
+        Identities of the comments of `key` that GitHub has, or None if the
+        entry predates them and only has a comment count.
+        """
+        entry = self._entries.get(key)
+        return entry[6] if entry is not None else None
+
+    def is_current(self, key, content_hash):
+        """
+        Whether `key` is imported and unchanged since.
+        """
+        return self.is_done(key) and self._entries[key][4] == content_hash
+
+    def number(self, key):
+        entry = self._entries.get(key)
+        return entry[2] if entry is not None else None
+
+    def imported(self):
+        """
+        Jira key -> (repo, GitHub issue number) for every imported issue.
+        """
+        return {key: (entry[0], entry[2]) for key, entry in self._entries.items() if entry[1] == IMPORTED}
+
+    def is_unconfirmed(self, key):
+        """
+        Whether an earlier run reserved `key` but never learnt whether its import was accepted.
+        """
+        entry = self._entries.get(key)
+        return (entry is not None and entry[1] == SUBMITTED and not entry[3]
+                and key not in self._reserved)
+
+    def reserve(self, key, repo, content_hash=None, comments=None):
+        """
+        Record `key` as submitted to `repo` before its import is sent, unless
+        it is migrated, submitted, or reserved already; unconfirmed entries
+        can be reserved again. Returns True if the caller may submit it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if key in self._reserved or (entry is not None and entry[1] != FAILED
+                                         and not (entry[1] == SUBMITTED and not entry[3])):
+                return False
+            self._reserved.add(key)
+        self.record(key, repo, SUBMITTED, content_hash=content_hash, comments=comments)
+        return True
+
+    def pending_imports(self, repo):
+        """
+        Imports submitted to `repo` in an earlier run whose outcome was never recorded.
+        """
+        return {entry[3]: key for key, entry in self._entries.items()
+                if entry[0] == repo and entry[1] == SUBMITTED and entry[3]}
+
+    def forget_repo(self, repo):
+        """
+        Drop every entry for `repo`, e.g. after its issues were deleted.
+        """
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry[0] == repo]
+            for key in keys:
+                del self._entries[key]
+                self._rewrites.pop(key, None)
+            self._connection.execute('DELETE FROM issues WHERE repo = ?', (repo,))
+            self._connection.executemany('DELETE FROM rewrites WHERE key = ?', [(key,) for key in keys])
+            self._commit()
+
+    def record(self, key, repo, status, number=None, import_url=None, content_hash=None, comments=None):
+        """
+        Record the status of `key`. `comments` are the identities of the
+        comments GitHub has. The content hash and comments are each kept from
+        the previous entry unless given.
+        """
+        with self._lock:
+            previous = self._entries.get(key)
+            if content_hash is None and previous is not None:
+                content_hash = previous[4]
+            if comments is not None:
+                comments = frozenset(comments)
+                count = len(comments)
+            elif previous is not None:
+                count, comments = previous[5:]
+            else:
+                count = None
+            self._entries[key] = (repo, status, number, import_url, content_hash, count, comments)
+            self._connection.execute(
+                'INSERT OR REPLACE INTO issues '
+                '(key, repo, status, number, import_url, updated, content_hash, comments, comment_ids) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, repo, status, number, import_url, time.time(), content_hash, count,
+                 '\n'.join(sorted(comments)) if comments is not None else None))
+            if self._rewrites.pop(key, None) is not None:
+                self._connection.execute('DELETE FROM rewrites WHERE key = ?', (key,))
+            self._uncommitted += 1
+            if status == SUBMITTED or self._uncommitted >= self.batch_size:
+                self._commit()
+
+    def rewrite_hash(self, key):
+        """
+        Hash of the cross-reference rewrite last applied to `key`, or None.
+        """
+        return self._rewrites.get(key)
+
+    def record_rewrite(self, key, rewrite_hash):
+        with self._lock:
+            self._rewrites[key] = rewrite_hash
+            self._connection.execute('INSERT OR REPLACE INTO rewrites (key, hash) VALUES (?, ?)',
+                                     (key, rewrite_hash))
+            self._uncommitted += 1
+            if self._uncommitted >= self.batch_size:
+                self._commit()
+
+    def get_meta(self, name):
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_meta(self, name, value):
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)', (name, value))
+            self._commit()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.flush()
+        self._connection.close()
@@ -6,21 +6,24 @@ Handles both simulation and actual migration modes.
 """
 
 from collections import namedtuple
+from datetime import datetime
 import os.path
+import threading
 import requests
-from project import Project
-from importer import Importer
-from utils import read_xml_files
-
-# Debug: Print environment variables to verify configuration
-print(f"Debug: GITHUB_ACCOUNT = {os.getenv('GITHUB_ACCOUNT')}")
-print(f"Debug: GITHUB_ACCESS_TOKEN = {os.getenv('JIRA_MIGRATION_GITHUB_ACCESS_TOKEN')}")
-print(f"Debug: DEFAULT_REPO = {os.getenv('DEFAULT_REPO')}")
-print(f"Debug: SECURITY_REPO = {os.getenv('SECURITY_REPO')}")
+from project import Project, ProjectSet
+from importer import Importer, Repository
+from labelcolourselector import LabelColourSelector
+from github_client import GitHubClient
+from ledger import MigrationLedger
+from crossref import index_from_ledger, rewrite_cross_references
+from attachments import AttachmentMirror, create_session
+from ingest_cache import DEFAULT_MAX_SIZE, IngestCache
+from metrics import Metrics
+from pipeline import Pipeline
+from utils import fetch_projects_mapping
 
 # Set migration mode based on environment variable, default to "simulation"
 migration_mode = os.getenv('MIGRATION_MODE', 'simulation')
-print(f"Debug: migration_mode is set to '{migration_mode}'")
 
 if migration_mode == 'simulation':
     print("Running in simulation mode. No changes will be made.")
@@ -43,51 +46,90 @@ jira_proj = os.getenv('JIRA_MIGRATION_JIRA_PROJECT_NAME')  # Jira project name f
 jira_base_url = os.getenv('JIRA_MIGRATION_JIRA_URL')  # Jira base URL from environment
 pat = os.getenv('JIRA_MIGRATION_GITHUB_ACCESS_TOKEN')  # GitHub PAT from environment
 
-# Hardcoded values for Done status and Start from issue
+# Hardcoded value for Done status
 jira_done_id = '3'  # Hardcoded to '3' for Done status
-start_from_issue = '0'  # Hardcoded to start from issue '0'
 
 # Options for the default repository
 Options = namedtuple("Options", "accesstoken account repo")
 
-# Project setup
-project = Project(jira_proj, jira_done_id, jira_base_url)
-
-# Track whether milestones and labels have already been imported for each repo
-milestones_imported = {SECURITY_REPO_URL: False, DEFAULT_REPO_URL: False}
-labels_imported = {SECURITY_REPO_URL: False, DEFAULT_REPO_URL: False}
-
-def create_github_issue(repo_owner_repo, title, body, access_token):
-    """
-    Creates an issue in the specified GitHub repository.
-    
-    Parameters:
-        repo_owner_repo (str): The GitHub repository in "{owner}/{repo}" format.
-        title (str): The title of the issue.
-        body (str): The body/description of the issue.
-        access_token (str): The GitHub access token for authentication.
-    
-    Returns:
-        bool: True if the issue was created successfully, False otherwise.
-    """
-    api_url = f"https://api.github.com/repos/{repo_owner_repo}/issues"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-    data = {
-        "title": title,
-        "body": body
-    }
-
-    response = requests.post(api_url, headers=headers, json=data)
-    
-    if response.status_code == 201:
-        print(f"Issue '{title}' created successfully.")
-        return True
-    else:
-        print(f"Failed to create issue '{title}': {response.status_code} - {response.text}")
-        return False
+# Phase timings, API statistics and counters of this run
+metrics = Metrics()
+metrics_file = os.getenv('JIRA_MIGRATION_METRICS_FILE', 'migration_metrics.json')
+prometheus_textfile = os.getenv('JIRA_MIGRATION_PROMETHEUS_TEXTFILE')
+
+# One GitHub client for the whole run, so all writes share the connection pool and rate limit
+github_client = GitHubClient(
+    pat,
+    concurrency=int(os.getenv('JIRA_MIGRATION_GITHUB_CONCURRENCY', '4')),
+    max_retries=int(os.getenv('JIRA_MIGRATION_GITHUB_MAX_RETRIES', '5')),
+    writes_per_second=float(os.getenv('JIRA_MIGRATION_GITHUB_WRITES_PER_SECOND', '1.0')),
+    metrics=metrics,
+)
+
+# Durable record of migrated issues, so an interrupted migration resumes where it stopped
+ledger = MigrationLedger(os.getenv('JIRA_MIGRATION_LEDGER', 'migration_ledger.db'))
+
+# Jira project key -> (default repository URL, security repository URL). With a projects file, every
+# project in it is migrated in one run, reading the export once; otherwise just the configured project
+projects_file = os.getenv('JIRA_MIGRATION_PROJECTS_FILE')
+if projects_file:
+    project_repos = fetch_projects_mapping(projects_file)
+else:
+    project_repos = {jira_proj: (DEFAULT_REPO_URL, SECURITY_REPO_URL)}
+
+# Project setup: one per Jira project, each with its own issues, counters and spill store
+spill_path = os.getenv('JIRA_MIGRATION_ISSUE_SPILL_PATH')
+projects = {}
+for name in project_repos:
+    project_spill_path = f'{spill_path}.{name}' if spill_path and len(project_repos) > 1 else spill_path
+    projects[name] = Project(name, jira_done_id, jira_base_url, spill_path=project_spill_path, metrics=metrics)
+
+# Export files transformed by an earlier run are loaded from the cache instead of being parsed again
+ingest_cache_path = os.getenv('JIRA_MIGRATION_INGEST_CACHE', 'ingest_cache.db')
+ingest_cache_size = int(os.getenv('JIRA_MIGRATION_INGEST_CACHE_MAX_MB', str(DEFAULT_MAX_SIZE >> 20))) << 20
+ingest_cache = IngestCache(ingest_cache_path, ingest_cache_size) if ingest_cache_path else None
+ingest_workers = int(os.getenv('JIRA_MIGRATION_INGEST_WORKERS', '1'))
+
+# Pipeline settings: worker threads of the routing stage, import worker threads per repository,
+# and how many issues may wait between two stages
+route_workers = int(os.getenv('JIRA_MIGRATION_ROUTE_WORKERS', '1'))
+import_workers = int(os.getenv('JIRA_MIGRATION_IMPORT_WORKERS', '4'))
+comment_workers = int(os.getenv('JIRA_MIGRATION_COMMENT_WORKERS', '4'))
+queue_size = int(os.getenv('JIRA_MIGRATION_PIPELINE_QUEUE_SIZE', '100'))
+
+# Attachments are mirrored into a directory published at a URL, one for the default repositories and one
+# for the security repositories, so attachments of security issues never end up next to public ones.
+# Issues without a mirror keep the Jira links. Mirrors are keyed by whether they hold security issues
+attachment_workers = int(os.getenv('JIRA_MIGRATION_ATTACHMENT_WORKERS', '8'))
+jira_auth = None
+if os.getenv('JIRA_MIGRATION_JIRA_USER'):
+    jira_auth = (os.getenv('JIRA_MIGRATION_JIRA_USER'), os.getenv('JIRA_MIGRATION_JIRA_PASSWORD'))
+attachment_session = create_session(attachment_workers, auth=jira_auth)
+mirrors = {}
+for security, prefix in ((False, 'JIRA_MIGRATION_ATTACHMENT'), (True, 'JIRA_MIGRATION_SECURITY_ATTACHMENT')):
+    if migration_mode == 'migration' and os.getenv(f'{prefix}_DIR') and os.getenv(f'{prefix}_URL'):
+        mirrors[security] = AttachmentMirror(jira_base_url, os.getenv(f'{prefix}_DIR'), os.getenv(f'{prefix}_URL'),
+                                             session=attachment_session)
+
+
+def mirror_for(issue):
+    return mirrors.get(issue.security is not None)
+
+
+def rewrite_attachments(issue):
+    mirror = mirror_for(issue)
+    if mirror is not None:
+        mirror.rewrite(issue)
+
+
+# One importer, import queue and comment queue per project and repository, keyed by (project name, repository),
+# created when the project's first issue is routed to the repository
+importers = {}
+# Repository name -> the milestones and labels it has, see importer.Repository
+repositories = {}
+import_queues = {}
+comment_queues = {}
+repos_lock = threading.Lock()
 
 print("Performing assessment...")
 # Assessment phase: Simulate gathering and validation of all issues
@@ -99,70 +141,202 @@ print("Verification complete")
 
 print(f"Starting migration ({migration_mode} mode)...")
 
-# The migration status will be logged to 'migration_simulation.log' for review
+# The migration status will be logged to 'migration_simulation.log' for review.
+# The log is appended to, so the history of earlier (possibly interrupted) runs is kept.
 log_file_name = "migration_simulation.log"
-with open(log_file_name, "w") as log_file:
-    log_file.write("Migration Simulation Log\n")
+# Whatever happens, the ledger is committed and the mirrors, cache and metrics are closed and reported,
+# so an aborted run resumes where it stopped and still shows what it did
+try:
+    with open(log_file_name, "a") as log_file:
+        log_file.write(f"Migration Simulation Log ({migration_mode} run started {datetime.now().isoformat()})\n")
 
-    # Process all items and check for security levels
-    all_xml_files = read_xml_files(file_names)
-    for f in all_xml_files:
-        for item in f.channel.item:
-            project.add_item(item)
+        # Issues that could not be migrated or updated; the sync watermark only moves forward without any
+        failed_updates = []
 
+        pipeline = Pipeline(metrics)
+        label_selectors = {name: LabelColourSelector(project) for name, project in projects.items()}
+
+        def open_repo(project, repo):
+            """
+            Set up `repo` on the first issue of `project` routed to it: the project's milestones and labels,
+            its importer, and its import and comment stages.
+            """
+            target = (project.name, repo)
+            opts = Options(accesstoken=pat, account=ac, repo=repo)
+            # Projects migrated into the same repository share what it has, so nothing is created twice
+            importers[target] = Importer(opts, project, github_client, ledger,
+                                         repository=repositories.setdefault(repo, Repository()))
+            if migration_mode == 'migration':
+                # Only what the repository lacks is created. Milestones and labels of issues read
+                # later are created as those issues are migrated, which also covers a failure here
+                try:
+                    print(f"Importing {project.name} milestones to repository {repo}")
+                    created = importers[target].import_milestones()
+                    log_file.write(f"Milestones of {project.name} imported to repository {repo}: {created} created.\n")
+                    print(f"Importing {project.name} labels to repository {repo}")
+                    created = importers[target].import_labels(label_selectors[project.name])
+                    log_file.write(f"Labels of {project.name} imported to repository {repo}: {created} created.\n")
+                except requests.RequestException as error:
+                    print(f"Failed to set up repository {repo} for {project.name}: {error}")
+                    log_file.write(f"Failed to set up repository {repo} for {project.name}: {error}\n")
+            else:
+                print(f"Simulating import of milestones to repository {repo}")
+                log_file.write(f"Milestones imported to repository {repo}.\n")
+                print(f"Simulating import of labels to repository {repo}")
+                log_file.write(f"Labels imported to repository {repo}.\n")
+
+            import_queues[target] = pipeline.queue(queue_size)
+            comment_queues[target] = pipeline.queue(queue_size)
+            pipeline.stage('import', lambda issue: migrate(target, issue), import_queues[target],
+                           workers=import_workers, on_done=lambda: pipeline.close(comment_queues[target]))
+            # Each issue's comments are posted by one worker, in order; different issues are posted in parallel
+            pipeline.stage('comments', lambda issue: post_comments(target, issue), comment_queues[target],
+                           workers=comment_workers)
+
+        def route(ingested):
+            project, issue = ingested
+            default_repo, security_repo = project_repos[project.name]
+            metrics.count('issues')
             # Check if the issue has a security level and assign the appropriate repository
-            if hasattr(item, 'security'):
-                log_file.write(f"Issue {item.key}: Assigned to security repository.\n")
-                opts = Options(accesstoken=pat, account=ac, repo=SECURITY_REPO_URL)
+            if issue.security is not None:
+                log_file.write(f"Issue {issue.key}: Assigned to security repository.\n")
+                repo = security_repo
             else:
-                log_file.write(f"Issue {item.key}: Assigned to default repository.\n")
-                opts = Options(accesstoken=pat, account=ac, repo=DEFAULT_REPO_URL)
+                log_file.write(f"Issue {issue.key}: Assigned to default repository.\n")
+                repo = default_repo
+            target = (project.name, repo)
 
-            importer = Importer(opts, project)
+            with repos_lock:
+                if target not in importers:
+                    open_repo(project, repo)
 
-            # Import milestones only once per repository
-            if not milestones_imported[opts.repo]:
-                if migration_mode == 'migration':
-                    print(f"Importing milestones to repository {opts.repo}")
-                    # Code to actually import milestones here
-                else:
-                    print(f"Simulating import of milestones to repository {opts.repo}")
-                    log_file.write(f"Milestones imported to repository {opts.repo}.\n")
-                milestones_imported[opts.repo] = True
-
-            # Import labels only once per repository
-            if not labels_imported[opts.repo]:
-                if migration_mode == 'migration':
-                    print(f"Importing labels to repository {opts.repo}")
-                    # Code to actually import labels here
+            mirror = mirror_for(issue) if issue.attachments else None
+            # Issues whose attachments could not all be mirrored last time are updated again
+            if (migration_mode == 'migration' and ledger.is_current(issue.key, issue.content_hash)
+                    and (mirror is None or mirror.is_mirrored(issue))):
+                log_file.write(f"Issue {issue.key}: Already migrated to repository {repo} "
+                               f"as #{ledger.number(issue.key)}, unchanged, skipped.\n")
+                metrics.count('issues_unchanged')
+            elif migration_mode == 'migration' and mirror is not None:
+                pipeline.put('route', attachment_queue, (target, issue))
+            elif migration_mode == 'migration':
+                pipeline.put('route', import_queues[target], issue)
+            else:
+                log_file.write(f"Issue {issue.key}: Simulated migration to repository {repo}.\n")
+
+        def migrate(target, issue):
+            # A request that failed for good fails this issue only, the next run picks it up again
+            try:
+                migrate_issue(target, issue)
+            except requests.RequestException as error:
+                print(f"Failed to migrate issue {issue.key}: {error}")
+                metrics.count('issues_errored')
+                if ledger.is_done(issue.key):
+                    log_file.write(f"Issue {issue.key}: Failed to update #{ledger.number(issue.key)}: {error}\n")
+                    failed_updates.append(issue.key)
                 else:
-                    print(f"Simulating import of labels to repository {opts.repo}")
-                    log_file.write(f"Labels imported to repository {opts.repo}.\n")
-                labels_imported[opts.repo] = True
+                    # Submissions catch the errors of their import request, so this one was never sent
+                    importers[target].fail(issue.key)
 
-            # Migrate each issue based on the selected mode
-            if migration_mode == 'migration':
-                print(f"Migrating issue {item.key} to repository {opts.repo}")
-                # Get issue title and body for migration, converted to string to avoid serialization issues
-                issue_title = f"Issue {item.key}: {str(item.title)}"
-                issue_body = str(item.description) if item.description else "No description provided."
-                
-                # Ensure repo_owner_repo is formatted correctly as "owner/repo_name"
-                repo_owner_repo = f"{ac}/{opts.repo}"
-                
-                # Call create_github_issue function
-                created = create_github_issue(
-                    repo_owner_repo,
-                    issue_title,
-                    issue_body,
-                    opts.accesstoken
-                )
-                if created:
-                    log_file.write(f"Issue {item.key}: Migrated to repository {opts.repo}.\n")
+        def migrate_issue(target, issue):
+            importer = importers[target]
+            importer.import_labels(label_selectors[importer.project.name], issue.labels)
+            if ledger.is_done(issue.key):
+                print(f"Updating issue {issue.key}, changed since it was migrated as #{ledger.number(issue.key)}")
+                # Changed in Jira since the last sync: update the existing GitHub issue in place,
+                # its new comments are appended by the comment stage
+                if importer.update_fields(issue):
+                    pipeline.put('import', comment_queues[target], issue)
                 else:
-                    log_file.write(f"Issue {item.key}: Failed to migrate to repository {opts.repo}.\n")
+                    log_file.write(f"Issue {issue.key}: Failed to update #{ledger.number(issue.key)}.\n")
+                    failed_updates.append(issue.key)
+            else:
+                print(f"Migrating issue {issue.key} to repository {target[1]}")
+                # The issue and its comments are submitted as one import, the outcome is collected below
+                importer.submit_issue(issue)
+
+        def post_comments(target, issue):
+            try:
+                updated = importers[target].post_comments(issue)
+            except requests.RequestException as error:
+                print(f"Failed to add comments to issue {issue.key}: {error}")
+                metrics.count('issues_errored')
+                updated = False
+            if updated:
+                log_file.write(f"Issue {issue.key}: Updated #{ledger.number(issue.key)}.\n")
             else:
-                log_file.write(f"Issue {item.key}: Simulated migration to repository {opts.repo}.\n")
+                log_file.write(f"Issue {issue.key}: Failed to add comments to #{ledger.number(issue.key)}.\n")
+                failed_updates.append(issue.key)
+
+        def mirror_attachments(routed_issue):
+            target, issue = routed_issue
+            if not mirror_for(issue).mirror(issue):
+                log_file.write(f"Issue {issue.key}: Not every attachment could be mirrored.\n")
+            pipeline.put('attachments', import_queues[target], issue)
+
+        def close_import_queues():
+            with repos_lock:
+                for import_queue in import_queues.values():
+                    pipeline.close(import_queue)
+
+        # Issues are streamed one file at a time from the ingest stage, which reads each file once for all
+        # projects, through routing and, if they have attachments to mirror, the attachment stage, into the
+        # import stages
+        routed = pipeline.queue(queue_size)
+        attachment_queue = pipeline.queue(queue_size)
+        pipeline.source('ingest', ProjectSet(projects.values(), metrics=metrics).iter_files(
+            file_names, workers=ingest_workers, cache=ingest_cache), routed)
+        pipeline.stage('route', route, routed, workers=route_workers,
+                       on_done=lambda: pipeline.close(attachment_queue) if mirrors else close_import_queues())
+        if mirrors:
+            pipeline.stage('attachments', mirror_attachments, attachment_queue, workers=attachment_workers,
+                           on_done=close_import_queues)
+        pipeline.join()
+        failures = len(failed_updates)
+
+        # Wait for the imports still in flight and record where each issue ended up
+        with metrics.phase('import'):
+            for (_, repo), importer in importers.items():
+                for key, number in importer.wait_for_imports().items():
+                    if number is not None:
+                        log_file.write(f"Issue {key}: Migrated to repository {repo} as #{number}.\n")
+                    else:
+                        log_file.write(f"Issue {key}: Failed to migrate to repository {repo}.\n")
+                        failures += 1
+
+        # Now that every issue has a number, turn Jira keys in bodies and comments into links
+        if migration_mode == 'migration':
+            with metrics.phase('crossref'):
+                # One index for every project, so references across projects become links as well
+                index = index_from_ledger(ledger)
+                rewritten = sum(rewrite_cross_references(project, github_client, ac, index,
+                                                         rewrite_attachments=rewrite_attachments, ledger=ledger)
+                                for project in projects.values())
+            log_file.write(f"Cross-references rewritten in {rewritten} issues.\n")
+
+            # Everything fetched has been migrated, so the next delta fetch can start from when this fetch began
+            fetch_started = ledger.get_meta('fetch_started')
+            if fetch_started and not failures:
+                ledger.set_meta('last_sync', fetch_started)
+                log_file.write(f"Synced up to {fetch_started}.\n")
+finally:
+    ledger.close()
+    for security, mirror in mirrors.items():
+        kind = 'security' if security else 'default'
+        print(f"Attachments mirrored for {kind} repositories: {mirror.downloaded} downloaded, "
+              f"{mirror.deduplicated} duplicates, {mirror.failed} failed")
+        metrics.count('attachments_downloaded', mirror.downloaded)
+        metrics.count('attachments_deduplicated', mirror.deduplicated)
+        metrics.count('attachments_failed', mirror.failed)
+        mirror.close()
+    if ingest_cache is not None:
+        print(f"Ingest cache: {ingest_cache.hits} files loaded, {ingest_cache.misses} transformed")
+        ingest_cache.close()
+
+    metrics.write_json(metrics_file)
+    if prometheus_textfile:
+        metrics.write_prometheus(prometheus_textfile)
+    print(metrics.report())
 
 print(f"{migration_mode.capitalize()} process completed.")
 print(f"Detailed logs can be found in '{log_file_name}'")
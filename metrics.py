@@ -0,0 +1,148 @@
+"""
+Run metrics for migrations: phase timers, counters and GitHub API statistics.
+
+One Metrics object is shared by the Project, the GitHub client and the
+importers of a run. It accumulates the time spent in each phase (read,
+transform, route, import, ...), event counters (issues, retries, rate-limit
+waits, ...), and a latency histogram and status code count of every GitHub
+API response. At the end of the run it is written as a JSON summary and,
+optionally, as a Prometheus textfile for node_exporter's textfile collector.
+
+Phase times from ingest worker processes are added up, so with several
+workers read and transform can exceed the wall-clock time of the run.
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the API latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROMETHEUS_PREFIX = 'jira_migration'
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = defaultdict(float)
+        self.counters = Counter()
+        self.statuses = Counter()
+        # Method -> count per latency bucket, the last one for anything slower
+        self._latency = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+        self._latency_sum = defaultdict(float)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.phases[name] += seconds
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe_request(self, method, status, seconds):
+        with self._lock:
+            self.statuses[status] += 1
+            self._latency[method][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self._latency_sum[method] += seconds
+
+    def merge_phases(self, phases):
+        """
+        Add phase times measured elsewhere, e.g. in an ingest worker process.
+        """
+        with self._lock:
+            for name, seconds in phases.items():
+                self.phases[name] += seconds
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            issues = self.counters['issues']
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'issues': issues,
+                'issues_per_second': round(issues / elapsed, 3) if elapsed else 0.0,
+                'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+                'counters': dict(self.counters),
+                'github': {
+                    'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+                    'latency': {method: {
+                        'count': sum(buckets),
+                        'mean_seconds': round(self._latency_sum[method] / sum(buckets), 4),
+                        'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], buckets)),
+                    } for method, buckets in self._latency.items()},
+                },
+            }
+
+    def write_json(self, path):
+        _write_atomically(path, json.dumps(self.summary(), indent=2) + '\n')
+
+    def write_prometheus(self, path):
+        """
+        Write the metrics in the Prometheus text exposition format.
+        """
+        summary = self.summary()
+        prefix = PROMETHEUS_PREFIX
+        lines = [
+            f'# HELP {prefix}_elapsed_seconds Wall-clock duration of the run.',
+            f'# TYPE {prefix}_elapsed_seconds gauge',
+            f"{prefix}_elapsed_seconds {summary['elapsed_seconds']}",
+            f'# HELP {prefix}_issues_per_second Issues processed per second of the run.',
+            f'# TYPE {prefix}_issues_per_second gauge',
+            f"{prefix}_issues_per_second {summary['issues_per_second']}",
+            f'# HELP {prefix}_phase_seconds Time spent in each phase.',
+            f'# TYPE {prefix}_phase_seconds gauge',
+        ]
+        lines.extend(f'{prefix}_phase_seconds{{phase="{name}"}} {seconds}'
+                     for name, seconds in summary['phases'].items())
+        lines.extend([f'# HELP {prefix}_events_total Events counted during the run.',
+                      f'# TYPE {prefix}_events_total counter'])
+        lines.extend(f'{prefix}_events_total{{event="{name}"}} {count}'
+                     for name, count in summary['counters'].items())
+        lines.extend([f'# HELP {prefix}_github_responses_total GitHub API responses by status code.',
+                      f'# TYPE {prefix}_github_responses_total counter'])
+        lines.extend(f'{prefix}_github_responses_total{{status="{status}"}} {count}'
+                     for status, count in summary['github']['statuses'].items())
+        lines.extend([f'# HELP {prefix}_github_request_seconds GitHub API request latency.',
+                      f'# TYPE {prefix}_github_request_seconds histogram'])
+        with self._lock:
+            latency = {method: (list(buckets), self._latency_sum[method]) for method, buckets in self._latency.items()}
+        for method, (buckets, total) in latency.items():
+            cumulative = 0
+            for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], buckets):
+                cumulative += count
+                lines.append(f'{prefix}_github_request_seconds_bucket{{method="{method}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_github_request_seconds_sum{{method="{method}"}} {round(total, 6)}')
+            lines.append(f'{prefix}_github_request_seconds_count{{method="{method}"}} {cumulative}')
+        _write_atomically(path, '\n'.join(lines) + '\n')
+
+    def report(self):
+        """
+        One line for the console.
+        """
+        summary = self.summary()
+        phases = ', '.join(f'{name} {seconds:.1f}s' for name, seconds in summary['phases'].items())
+        return (f"{summary['issues']} issues in {summary['elapsed_seconds']:.1f}s "
+                f"({summary['issues_per_second']:.1f}/s); {phases}; "
+                f"{sum(self.statuses.values())} API calls, {self.counters['retries']} retries, "
+                f"{self.counters['rate_limit_waits']} rate-limit waits")
+
+
+def _write_atomically(path, text):
+    # Readers such as the textfile collector never see a half-written file
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w') as file:
+        file.write(text)
+    os.replace(tmp_path, path)
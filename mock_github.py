@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+
+"""
+A small in-memory stand-in for the parts of the GitHub REST API the migration
+uses, for dry runs and for exercising the client without touching GitHub.
+
+It implements the issue-import endpoints, issue and comment listing,
+creation and editing, label listing, creation and deletion, milestone
+listing and creation, and the few GraphQL query shapes the
+tools send (aliased issue reads and updateIssue/deleteIssue mutations), and
+reports rate-limit headers. It can also be told to throttle,
+answering every `throttle_every`-th request with a secondary rate-limit 403
+and a Retry-After header, or to apply every `fail_every`-th POST or PATCH
+and answer it with a 502 all the same, like a gateway timing out.
+
+Run it standalone and point the migration at it with GITHUB_API_URL:
+
+    python3 mock_github.py 8000
+    GITHUB_API_URL=http://127.0.0.1:8000 python3 main.py
+"""
+
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlparse
+
+
+class MockGitHub:
+    def __init__(self, rate_limit=5000, throttle_every=0, retry_after=1, import_polls=1, fail_every=0):
+        self.rate_limit = rate_limit
+        self.throttle_every = throttle_every
+        self.fail_every = fail_every
+        self._writes = 0
+        self.retry_after = retry_after
+        # Number of status polls an import stays pending for
+        self.import_polls = import_polls
+
+        self.requests = []
+        self.issues = {}
+        self.labels = {}
+        self.milestones = {}
+        self._last_numbers = {}
+        self.imports = {}
+        self._comment_ids = 0
+        self._remaining = rate_limit
+        self._reset = int(time.time()) + 3600
+        self._lock = threading.Lock()
+        self._server = None
+
+        self.routes = [
+            ('POST', r'/repos/([^/]+)/([^/]+)/import/issues', self._create_import),
+            ('GET', r'/repos/([^/]+)/([^/]+)/import/issues/(\d+)', self._get_import),
+            ('GET', r'/repos/([^/]+)/([^/]+)/issues', self._list_issues),
+            ('GET', r'/repos/([^/]+)/([^/]+)/issues/(\d+)', self._get_issue),
+            ('PATCH', r'/repos/([^/]+)/([^/]+)/issues/(\d+)', self._edit_issue),
+            ('GET', r'/repos/([^/]+)/([^/]+)/issues/(\d+)/comments', self._list_comments),
+            ('POST', r'/repos/([^/]+)/([^/]+)/issues/(\d+)/comments', self._create_comment),
+            ('PATCH', r'/repos/([^/]+)/([^/]+)/issues/comments/(\d+)', self._edit_comment),
+            ('GET', r'/repos/([^/]+)/([^/]+)/labels', self._list_labels),
+            ('POST', r'/repos/([^/]+)/([^/]+)/labels', self._create_label),
+            ('DELETE', r'/repos/([^/]+)/([^/]+)/labels/([^/]+)', self._delete_label),
+            ('GET', r'/repos/([^/]+)/([^/]+)/milestones', self._list_milestones),
+            ('POST', r'/repos/([^/]+)/([^/]+)/milestones', self._create_milestone),
+            ('POST', r'/graphql', self._graphql),
+        ]
+
+    def start(self, port=0):
+        """
+        Serve in a background thread and return the base URL.
+        """
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; without this, delayed ACKs stall every response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                mock._dispatch(self, 'GET')
+
+            def do_POST(self):
+                mock._dispatch(self, 'POST')
+
+            def do_PATCH(self):
+                mock._dispatch(self, 'PATCH')
+
+            def do_DELETE(self):
+                mock._dispatch(self, 'DELETE')
+
+        return Handler
+
+    def _dispatch(self, handler, method):
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = json.loads(handler.rfile.read(length)) if length else None
+        parsed = urlparse(handler.path)
+
+        with self._lock:
+            self.requests.append((method, parsed.path))
+            throttled = self.throttle_every and len(self.requests) % self.throttle_every == 0
+            if not throttled:
+                self._remaining = max(self._remaining - 1, 0)
+            headers = {
+                'X-RateLimit-Limit': str(self.rate_limit),
+                'X-RateLimit-Remaining': str(self._remaining),
+                'X-RateLimit-Reset': str(self._reset),
+            }
+
+        if throttled:
+            headers['Retry-After'] = str(self.retry_after)
+            return self._send(handler, 403, {'message': 'You have exceeded a secondary rate limit.'}, headers)
+
+        for route_method, pattern, action in self.routes:
+            match = re.fullmatch(pattern, parsed.path)
+            if route_method == method and match:
+                with self._lock:
+                    status, payload, extra_headers = action(handler, parsed, body, *match.groups())
+                    if method in ('POST', 'PATCH'):
+                        self._writes += 1
+                        if self.fail_every and self._writes % self.fail_every == 0:
+                            status, payload, extra_headers = 502, {'message': 'Bad Gateway'}, {}
+                headers.update(extra_headers)
+                return self._send(handler, status, payload, headers)
+        return self._send(handler, 404, {'message': 'Not Found'}, headers)
+
+    def _send(self, handler, status, payload, headers):
+        data = json.dumps(payload).encode() if payload is not None else b''
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _repo_issues(self, owner, repo):
+        return self.issues.setdefault(f'{owner}/{repo}', {})
+
+    def _add_issue(self, owner, repo, issue, comments=()):
+        issues = self._repo_issues(owner, repo)
+        # Like GitHub, numbers are never reused, even after a deletion
+        number = self._last_numbers[f'{owner}/{repo}'] = self._last_numbers.get(f'{owner}/{repo}', 0) + 1
+        issues[number] = dict(issue, number=number, node_id=f'I_{owner}/{repo}_{number}',
+                              state='closed' if issue.get('closed') else 'open', comments=[])
+        for comment in comments:
+            self._comment_ids += 1
+            issues[number]['comments'].append(dict(comment, id=self._comment_ids))
+        return number
+
+    def _page(self, handler, parsed, items):
+        """
+        Slice `items` according to page/per_page and build the Link header.
+        """
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        per_page = int(query.get('per_page', 30))
+        page = int(query.get('page', 1))
+        headers = {}
+        if page * per_page < len(items):
+            query['page'] = page + 1
+            headers['Link'] = f'<http://{handler.headers["Host"]}{parsed.path}?{urlencode(query)}>; rel="next"'
+        return items[(page - 1) * per_page:page * per_page], headers
+
+    def _find_node(self, node_id):
+        # Node ids look like I_owner/repo_number
+        repo, number = node_id[2:].rsplit('_', 1)
+        return self.issues.get(repo, {}).get(int(number))
+
+    def _find_comment(self, comment_id):
+        for issues in self.issues.values():
+            for issue in issues.values():
+                for comment in issue['comments']:
+                    if comment['id'] == comment_id:
+                        return comment
+        return None
+
+    def _list_issues(self, handler, parsed, body, owner, repo):
+        issues = [{key: value for key, value in issue.items() if key != 'comments'}
+                  for issue in self._repo_issues(owner, repo).values()]
+        page, headers = self._page(handler, parsed, issues)
+        return 200, page, headers
+
+    def _get_issue(self, handler, parsed, body, owner, repo, number):
+        issue = self._repo_issues(owner, repo).get(int(number))
+        if issue is None:
+            return 404, {'message': 'Not Found'}, {}
+        return 200, {key: value for key, value in issue.items() if key != 'comments'}, {}
+
+    def _edit_issue(self, handler, parsed, body, owner, repo, number):
+        issue = self._repo_issues(owner, repo).get(int(number))
+        if issue is None:
+            return 404, {'message': 'Not Found'}, {}
+        issue.update(body)
+        return 200, {key: value for key, value in issue.items() if key != 'comments'}, {}
+
+    def _list_comments(self, handler, parsed, body, owner, repo, number):
+        issue = self._repo_issues(owner, repo).get(int(number))
+        if issue is None:
+            return 404, {'message': 'Not Found'}, {}
+        page, headers = self._page(handler, parsed, issue['comments'])
+        return 200, page, headers
+
+    def _create_comment(self, handler, parsed, body, owner, repo, number):
+        issue = self._repo_issues(owner, repo).get(int(number))
+        if issue is None:
+            return 404, {'message': 'Not Found'}, {}
+        self._comment_ids += 1
+        comment = dict(body, id=self._comment_ids)
+        issue['comments'].append(comment)
+        return 201, comment, {}
+
+    def _edit_comment(self, handler, parsed, body, owner, repo, comment_id):
+        comment = self._find_comment(int(comment_id))
+        if comment is None:
+            return 404, {'message': 'Not Found'}, {}
+        comment.update(body)
+        return 200, comment, {}
+
+    def _repo_labels(self, owner, repo):
+        return self.labels.setdefault(f'{owner}/{repo}', {})
+
+    def _list_labels(self, handler, parsed, body, owner, repo):
+        page, headers = self._page(handler, parsed, list(self._repo_labels(owner, repo).values()))
+        return 200, page, headers
+
+    def _create_label(self, handler, parsed, body, owner, repo):
+        labels = self._repo_labels(owner, repo)
+        if any(name.lower() == body['name'].lower() for name in labels):
+            return 422, {'message': 'Validation Failed', 'errors': [{'code': 'already_exists'}]}, {}
+        labels[body['name']] = {'name': body['name'], 'color': body.get('color', 'ededed')}
+        return 201, labels[body['name']], {}
+
+    def _delete_label(self, handler, parsed, body, owner, repo, name):
+        if self._repo_labels(owner, repo).pop(unquote(name), None) is None:
+            return 404, {'message': 'Not Found'}, {}
+        return 204, None, {}
+
+    def _list_milestones(self, handler, parsed, body, owner, repo):
+        page, headers = self._page(handler, parsed, list(self.milestones.get(f'{owner}/{repo}', {}).values()))
+        return 200, page, headers
+
+    def _create_milestone(self, handler, parsed, body, owner, repo):
+        milestones = self.milestones.setdefault(f'{owner}/{repo}', {})
+        if body['title'] in milestones:
+            return 422, {'message': 'Validation Failed', 'errors': [{'code': 'already_exists'}]}, {}
+        milestones[body['title']] = {'title': body['title'], 'number': len(milestones) + 1, 'state': 'open'}
+        return 201, milestones[body['title']], {}
+
+    def _graphql(self, handler, parsed, body):
+        query, variables = body['query'], body.get('variables') or {}
+        data = {}
+        repository = re.search(r'repository\(owner: \$owner, name: \$name\)', query)
+        if repository:
+            repo = f"{variables['owner']}/{variables['name']}"
+            issues = self.issues.get(repo, {})
+            data['repository'] = {}
+            for alias, number in re.findall(r'(\w+): issue\(number: (\d+)\)', query):
+                issue = issues.get(int(number))
+                data['repository'][alias] = None if issue is None else {
+                    'id': f'I_{repo}_{number}', 'number': int(number), 'body': issue.get('body', '')}
+        for alias, id_var, body_var in re.findall(
+                r'(\w+): updateIssue\(input: \{id: \$(\w+), body: \$(\w+)\}\)', query):
+            issue = self._find_node(variables[id_var])
+            issue['body'] = variables[body_var]
+            data[alias] = {'issue': {'number': issue['number']}}
+        for alias, id_var in re.findall(r'(\w+): deleteIssue\(input: \{issueId: \$(\w+)\}\)', query):
+            repo, number = variables[id_var][2:].rsplit('_', 1)
+            self.issues.get(repo, {}).pop(int(number), None)
+            data[alias] = {'clientMutationId': None}
+        return 200, {'data': data}, {}
+
+    def _create_import(self, handler, parsed, body, owner, repo):
+        import_id = len(self.imports) + 1
+        self.imports[import_id] = {'repo': f'{owner}/{repo}', 'payload': body, 'polls': 0}
+        if not self.import_polls:
+            # Imported straight away, whether or not anybody polls for it
+            self.imports[import_id]['number'] = self._add_issue(owner, repo, body['issue'], body.get('comments', []))
+        url = f'http://{handler.headers["Host"]}/repos/{owner}/{repo}/import/issues/{import_id}'
+        return 202, {'id': import_id, 'status': 'pending', 'url': url}, {}
+
+    def _get_import(self, handler, parsed, body, owner, repo, import_id):
+        record = self.imports.get(int(import_id))
+        if record is None:
+            return 404, {'message': 'Not Found'}, {}
+        record['polls'] += 1
+        if record['polls'] <= self.import_polls:
+            return 200, {'id': int(import_id), 'status': 'pending'}, {}
+        if 'number' not in record:
+            record['number'] = self._add_issue(owner, repo, record['payload']['issue'],
+                                               record['payload'].get('comments', []))
+        issue_url = f'http://{handler.headers["Host"]}/repos/{owner}/{repo}/issues/{record["number"]}'
+        return 200, {'id': int(import_id), 'status': 'imported', 'issue_url': issue_url}, {}
+
+
+if __name__ == '__main__':
+    mock = MockGitHub()
+    print(f'Mock GitHub API listening on {mock.start(int(sys.argv[1]) if len(sys.argv) > 1 else 8000)}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
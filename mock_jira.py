@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+"""
+A small stand-in for the Jira REST search API and XML search view, serving recorded issues.
+
+Point it at one or more recorded search responses (the JSON bodies of
+/rest/api/2/search calls made with expand=renderedFields) and it answers
+search requests from them: pages follow startAt/maxResults, only the
+requested `fields` are returned, and renderedFields only with the expand.
+With `max_page_size`, maxResults is capped like Jira Cloud does.
+The comments of an issue are served from /rest/api/2/issue/KEY/comment,
+truncated in search results to `comments_per_issue` like Jira Cloud does.
+Attachment contents given as `attachments` (id -> bytes) are served from
+/secure/attachment/ID/NAME. The JQL is ignored. Comments posted to
+/rest/api/2/issue/KEY/comment are added to the issue; with `throttle_every`,
+every so many of those posts are answered with a 429 whose Retry-After is an
+HTTP date.
+
+Point it at XML exports (e.g. from generate_export.py) instead and their
+items are served by the XML search view fetch_issues.py downloads, paged by
+pager/start and tempMax.
+
+    python3 mock_jira.py 8080 recorded-search.json [more.json ...]
+    JIRA_MIGRATION_FETCH_BACKEND=rest JIRA_MIGRATION_JIRA_URL=http://127.0.0.1:8080 python3 fetch_issues.py
+    python3 mock_jira.py 8080 export/result-0.xml [more.xml ...]
+    JIRA_MIGRATION_JIRA_URL=http://127.0.0.1:8080 python3 fetch_issues.py
+"""
+
+import copy
+import json
+import re
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+XML_SEARCH_PATH = '/sr/jira.issueviews:searchrequest-xml/temp/SearchRequest.xml'
+
+
+class MockJira:
+    def __init__(self, issues, comments_per_issue=None, attachments=None, xml_items=None, throttle_every=0,
+                 max_page_size=None):
+        self.issues = list(issues)
+        self.max_page_size = max_page_size
+        self.throttle_every = throttle_every
+        self._posts = 0
+        # Raw <item> elements served by the XML search view
+        self.xml_items = list(xml_items or [])
+        self.comments_per_issue = comments_per_issue
+        self.attachments = dict(attachments or {})
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    @classmethod
+    def from_files(cls, paths, **kwargs):
+        issues = []
+        xml_items = []
+        for path in paths:
+            with open(path) as file:
+                if path.endswith('.xml'):
+                    xml_items.extend(re.findall(r'<item>.*?</item>', file.read(), flags=re.DOTALL))
+                    continue
+                recorded = json.load(file)
+            issues.extend(recorded['issues'] if isinstance(recorded, dict) else recorded)
+        return cls(issues, xml_items=xml_items, **kwargs)
+
+    def start(self, port=0):
+        """
+        Serve in a background thread and return the base URL.
+        """
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; without this, delayed ACKs stall every response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                mock._dispatch(self)
+
+            def do_POST(self):
+                mock._post(self)
+
+        return Handler
+
+    def _dispatch(self, handler):
+        parsed = urlparse(handler.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        with self._lock:
+            self.requests.append((parsed.path, query))
+
+        if parsed.path == '/rest/api/2/search':
+            return self._send(handler, 200, self._search(query))
+        if parsed.path == XML_SEARCH_PATH:
+            return self._send_bytes(handler, self._xml_search(query), 'text/xml; charset=UTF-8')
+        match = re.fullmatch(r'/secure/attachment/(\d+)/.*', parsed.path)
+        if match and match.group(1) in self.attachments:
+            return self._send_bytes(handler, self.attachments[match.group(1)])
+        match = re.fullmatch(r'/rest/api/2/issue/([^/]+)/comment', parsed.path)
+        if match:
+            issue = next((issue for issue in self.issues if issue['key'] == match.group(1)), None)
+            if issue is not None:
+                return self._send(handler, 200, self._comments(issue, query))
+        return self._send(handler, 404, {'errorMessages': ['Not Found']})
+
+    def _post(self, handler):
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = json.loads(handler.rfile.read(length)) if length else {}
+        parsed = urlparse(handler.path)
+        match = re.fullmatch(r'/rest/api/2/issue/([^/]+)/comment', parsed.path)
+        issue = next((issue for issue in self.issues if match and issue['key'] == match.group(1)), None)
+        with self._lock:
+            self.requests.append((parsed.path, body))
+            if issue is None:
+                return self._send(handler, 404, {'errorMessages': ['Issue Does Not Exist']})
+            self._posts += 1
+            if self.throttle_every and self._posts % self.throttle_every == 0:
+                return self._send(handler, 429, {'errorMessages': ['Rate limit exceeded']},
+                                  {'Retry-After': formatdate(time.time() + 1, usegmt=True)})
+            comments = issue['fields'].setdefault('comment', {'comments': [], 'total': 0})
+            comment = {'id': str(10000 + self._posts), 'body': body.get('body', ''),
+                       'author': {'name': 'migration'}, 'created': time.strftime('%Y-%m-%dT%H:%M:%S.000+0000')}
+            comments['comments'].append(comment)
+            comments['total'] = len(comments['comments'])
+        return self._send(handler, 201, comment)
+
+    def _send(self, handler, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _send_bytes(self, handler, data, content_type='application/octet-stream'):
+        handler.send_response(200)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _search(self, query):
+        start = int(query.get('startAt', 0))
+        max_results = int(query.get('maxResults', 50))
+        if self.max_page_size is not None:
+            max_results = min(max_results, self.max_page_size)
+        fields = [field for field in query.get('fields', '').split(',') if field]
+        rendered = 'renderedFields' in query.get('expand', '')
+        return {'startAt': start, 'maxResults': max_results, 'total': len(self.issues),
+                'issues': [self._project(issue, fields, rendered)
+                           for issue in self.issues[start:start + max_results]]}
+
+    def _xml_search(self, query):
+        start = int(query.get('pager/start', 0))
+        items = self.xml_items[start:start + int(query.get('tempMax', 1000))]
+        return (f'<rss version="0.92">\n<channel>\n<title>Jira</title>\n'
+                f'<issue start="{start}" end="{start + len(items)}" total="{len(self.xml_items)}"/>\n'
+                + ''.join(item + '\n' for item in items) + '</channel>\n</rss>\n').encode('utf-8')
+
+    def _project(self, issue, fields, rendered):
+        result = {'id': issue.get('id'), 'key': issue['key'],
+                  'fields': {name: copy.deepcopy(value) for name, value in issue['fields'].items()
+                             if not fields or name in fields}}
+        if rendered:
+            result['renderedFields'] = {name: copy.deepcopy(value)
+                                        for name, value in (issue.get('renderedFields') or {}).items()
+                                        if not fields or name in fields}
+        if self.comments_per_issue is not None:
+            for section in (result['fields'], result.get('renderedFields') or {}):
+                if section.get('comment'):
+                    section['comment']['comments'] = section['comment']['comments'][:self.comments_per_issue]
+        return result
+
+    def _comments(self, issue, query):
+        comments = copy.deepcopy((issue['fields'].get('comment') or {}).get('comments') or [])
+        rendered = ((issue.get('renderedFields') or {}).get('comment') or {}).get('comments') or []
+        if 'renderedBody' in query.get('expand', ''):
+            for comment, rendered_comment in zip(comments, rendered):
+                comment['renderedBody'] = rendered_comment['body']
+        return {'startAt': 0, 'total': len(comments), 'comments': comments}
+
+
+if __name__ == '__main__':
+    mock = MockJira.from_files(sys.argv[2:])
+    print(f'Mock Jira API listening on {mock.start(int(sys.argv[1]))} with '
+          f'{len(mock.issues) or len(mock.xml_items)} issues')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,152 @@
+"""
+Staged migration pipeline.
+
+The migration runs as a chain of stages connected by bounded queues: ingest
+(reading and transforming the export, see Project.iter_files), routing each
+issue to its repository, and submitting it to GitHub. Every stage runs in its
+own threads with its own worker count, so parsing carries on while imports
+wait on the network, and a full queue holds back the stage feeding it instead
+of piling up issues in memory.
+
+    pipeline = Pipeline(metrics)
+    issues = pipeline.queue(100)
+    pipeline.source('ingest', project.iter_files(file_names), issues)
+    pipeline.stage('import', importer.submit_issue, issues, workers=4)
+    pipeline.join()
+
+If a worker raises, every stage stops and join() re-raises the exception, so
+handlers deal with the failures of single items themselves (see main.py) and
+only let programming errors through.
+"""
+
+import queue
+import threading
+import time
+
+from metrics import Metrics
+
+# Put into a queue after its last item
+_DONE = object()
+# Seconds between checks for a failed stage while blocked on a queue
+_CHECK_INTERVAL = 0.1
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class Pipeline:
+    def __init__(self, metrics=None):
+        self.metrics = metrics or Metrics()
+        self._threads = []
+        self._threads_lock = threading.Lock()
+        self._error = None
+        self._failed = threading.Event()
+
+    def queue(self, size):
+        return queue.Queue(size)
+
+    def source(self, name, items, outbox):
+        """
+        Feed `items` into `outbox` from a thread of its own, then close `outbox`.
+        """
+        def run():
+            for item in items:
+                self.put(name, outbox, item)
+
+        self._start(name, [run], lambda: self.close(outbox))
+
+    def stage(self, name, handler, inbox, workers=1, on_done=None):
+        """
+        Call `handler` on every item of `inbox` from `workers` threads. Time
+        spent in `handler` is recorded as phase `name`. `on_done` is called
+        once the last worker has finished, typically to close the queues the
+        handler feeds.
+        """
+        def run():
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    # Let the other workers of the stage see it as well
+                    inbox.put(_DONE)
+                    return
+                with self.metrics.phase(name):
+                    handler(item)
+
+        self._start(name, [run] * workers, on_done)
+
+    def put(self, name, outbox, item):
+        """
+        Put `item` into `outbox`, blocking while it is full. Time spent
+        blocked is recorded as phase `<name>_blocked`.
+        """
+        blocked = time.perf_counter()
+        self._put(outbox, item)
+        waited = time.perf_counter() - blocked
+        if waited > 0.001:
+            self.metrics.add_time(f'{name}_blocked', waited)
+
+    def close(self, outbox):
+        """
+        Tell the stage reading `outbox` that no more items will come.
+        """
+        self._put(outbox, _DONE)
+
+    def join(self):
+        """
+        Wait until every stage has finished, including stages started while
+        waiting, and re-raise the first exception of a failed stage.
+        """
+        joined = 0
+        while True:
+            with self._threads_lock:
+                if joined == len(self._threads):
+                    break
+                thread = self._threads[joined]
+            thread.join()
+            joined += 1
+        if self._error is not None:
+            raise self._error
+
+    def _put(self, outbox, item):
+        while True:
+            if self._failed.is_set():
+                raise _Cancelled()
+            try:
+                return outbox.put(item, timeout=_CHECK_INTERVAL)
+            except queue.Full:
+                continue
+
+    def _get(self, inbox):
+        while True:
+            if self._failed.is_set():
+                raise _Cancelled()
+            try:
+                return inbox.get(timeout=_CHECK_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def _start(self, name, targets, on_done):
+        remaining = [len(targets)]
+        remaining_lock = threading.Lock()
+
+        def run(target):
+            try:
+                target()
+                with remaining_lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last and on_done is not None:
+                    on_done()
+            except _Cancelled:
+                pass
+            except BaseException as error:
+                if self._error is None:
+                    self._error = error
+                self._failed.set()
+
+        with self._threads_lock:
+            for number, target in enumerate(targets):
+                thread = threading.Thread(target=run, args=(target,), name=f'{name}-{number}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""
+Add the list of epic children to each migrated epic.
+
+Children are grouped by epic locally from the epic links Project extracts
+from the Jira export, and Jira keys are resolved to GitHub issue numbers
+through the migration ledger (or one listing of the repository when there is
+no ledger). The current epic bodies are read with batched GraphQL queries
+and each epic body is written exactly once, with batched GraphQL mutations.
+
+Usage (the arguments match the post_process_issues.sh it replaces):
+
+    python3 post_process_epics.py OWNER REPO [START_FROM]
+
+Children numbered below START_FROM are skipped, so an interrupted run can be
+resumed. Children already listed on an epic are never added twice.
+"""
+
+import os
+import sys
+from collections import defaultdict
+
+from crossref import index_from_ledger, index_from_repositories
+from github_client import GitHubClient
+from ledger import MigrationLedger
+from project import Project
+
+EPIC_CHILDREN_HEADER = 'Epic children:'
+
+READ_QUERY = 'query($owner: String!, $name: String!) { repository(owner: $owner, name: $name) { %s } }'
+READ_FIELD = 'e%d: issue(number: %d) { id number body }'
+UPDATE_MUTATION = 'mutation(%s) { %s }'
+UPDATE_FIELD = 'u%d: updateIssue(input: {id: $id%d, body: $body%d}) { issue { number } }'
+
+
+def group_children(project, index, repo, start_from=0):
+    """
+    Epic issue number -> sorted child issue numbers, for epics and children migrated to `repo`.
+    """
+    children = defaultdict(set)
+    for issue in project.get_issues():
+        if not issue.epic_link:
+            continue
+        child = index.get(issue.key)
+        epic = index.get(issue.epic_link)
+        if child is None or epic is None or child[0] != repo or epic[0] != repo:
+            # Not migrated, or the epic lives in another repository
+            continue
+        if child[1] < start_from:
+            continue
+        children[epic[1]].add(child[1])
+    return {epic: sorted(numbers) for epic, numbers in children.items()}
+
+
+def add_children(body, children):
+    """
+    Append the children missing from the body's epic children list.
+    """
+    body = body or ''
+    missing = [number for number in children if f'- #{number}\n' not in body + '\n']
+    if not missing:
+        return body
+    if EPIC_CHILDREN_HEADER not in body:
+        body += '\n' + EPIC_CHILDREN_HEADER + '\n'
+    return body + ''.join(f'\n- #{number}' for number in missing)
+
+
+def read_issues(client, owner, repo, numbers, batch_size=50):
+    """
+    Issue number -> (node id, body), fetched `batch_size` issues per GraphQL query.
+    """
+    issues = {}
+    for start in range(0, len(numbers), batch_size):
+        batch = numbers[start:start + batch_size]
+        fields = ' '.join(READ_FIELD % (position, number) for position, number in enumerate(batch))
+        result = client.graphql(READ_QUERY % fields, {'owner': owner, 'name': repo})
+        repository = (result.get('data') or {}).get('repository') or {}
+        for issue in repository.values():
+            if issue is not None:
+                issues[issue['number']] = (issue['id'], issue['body'])
+    return issues
+
+
+def update_bodies(client, bodies, batch_size=20):
+    """
+    Write {node id: body} with one GraphQL mutation per `batch_size` issues.
+    """
+    updates = list(bodies.items())
+    for start in range(0, len(updates), batch_size):
+        batch = updates[start:start + batch_size]
+        declarations = ', '.join(f'$id{position}: ID!, $body{position}: String!' for position in range(len(batch)))
+        fields = ' '.join(UPDATE_FIELD % (position, position, position) for position in range(len(batch)))
+        variables = {}
+        for position, (node_id, body) in enumerate(batch):
+            variables[f'id{position}'] = node_id
+            variables[f'body{position}'] = body
+        # Setting a body is the same however often it is done, so the mutation may be resent
+        result = client.graphql(UPDATE_MUTATION % (declarations, fields), variables, idempotent=True)
+        if result.get('errors'):
+            print(f"Failed to update some epics: {result['errors']}")
+
+
+def post_process_epics(project, client, owner, repo, index, start_from=0):
+    """
+    Add children to every epic in `repo` and return the number of epics updated.
+    """
+    children = group_children(project, index, repo, start_from)
+    print(f'Found {sum(len(numbers) for numbers in children.values())} children for {len(children)} epics')
+
+    epics = read_issues(client, owner, repo, sorted(children))
+    bodies = {}
+    for number, (node_id, body) in epics.items():
+        new_body = add_children(body, children[number])
+        if new_body != body:
+            bodies[node_id] = new_body
+            print(f'Adding {len(children[number])} children to epic #{number}')
+
+    update_bodies(client, bodies)
+    return len(bodies)
+
+
+if __name__ == '__main__':
+    owner = sys.argv[1] if len(sys.argv) > 1 else os.getenv('GITHUB_ACCOUNT')
+    repo = sys.argv[2] if len(sys.argv) > 2 else os.getenv('DEFAULT_REPO')
+    start_from = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    project = Project(os.getenv('JIRA_MIGRATION_JIRA_PROJECT_NAME'), os.getenv('JIRA_MIGRATION_JIRA_DONE_ID', '3'),
+                      os.getenv('JIRA_MIGRATION_JIRA_URL'))
+    project.add_files(os.getenv('JIRA_MIGRATION_FILE_PATHS'),
+                      workers=int(os.getenv('JIRA_MIGRATION_INGEST_WORKERS', '1')))
+    client = GitHubClient(os.getenv('JIRA_MIGRATION_GITHUB_ACCESS_TOKEN'))
+
+    ledger_path = os.getenv('JIRA_MIGRATION_LEDGER', 'migration_ledger.db')
+    if os.path.exists(ledger_path):
+        index = index_from_ledger(MigrationLedger(ledger_path))
+    else:
+        index = index_from_repositories(client, owner, [repo])
+
+    updated = post_process_epics(project, client, owner, repo, index, start_from)
+    print(f'Updated {updated} epics')
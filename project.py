@@ -1,24 +1,45 @@
 import os
+import sys
 from collections import defaultdict
-from html.entities import name2codepoint
-from dateutil.parser import parse
-from datetime import datetime
-import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-from utils import fetch_allowed_labels, convert_label
+from renderer import IssueRenderer
+from timestamps import convert_to_iso, convert_timestamps
+from issues import IssueRecord, IssueStore, LINK_TYPES
+from labels import LabelResolver
+from metrics import Metrics
+from utils import expand_xml_paths, iter_xml_file_items
+
+
+def _project_key(item):
+    try:
+        return item.project.get('key')
+    except AttributeError:
+        return item.key.text.split('-')[0]
+
+
+def _ingest_file(specs, label_resolvers, file_name):
+    # Transform one export into a partial project per Jira project, possibly in a worker process
+    projects = ProjectSet([Project(*spec, label_resolver=label_resolver)
+                           for spec, label_resolver in zip(specs, label_resolvers)])
+    projects.add_file(file_name)
+    partials = {name: (project._project, project.label_resolver.stats) for name, project in projects.projects.items()}
+    return partials, projects.metrics.phases
 
 
 class Project:
 
-    def __init__(self, name, doneStatusCategoryId, jiraBaseUrl):
+    def __init__(self, name, doneStatusCategoryId, jiraBaseUrl, label_resolver=None, spill_path=None, metrics=None):
         self.name = name
         self.doneStatusCategoryId = doneStatusCategoryId
         self.jiraBaseUrl = jiraBaseUrl
         self._project = {'Milestones': defaultdict(int), 'Components': defaultdict(
-            int), 'Labels': defaultdict(int), 'Types': defaultdict(int), 'Issues': []}
+            int), 'Labels': defaultdict(int), 'Types': defaultdict(int), 'Issues': IssueStore(spill_path)}
 
-        # Removed fetching of labels_mapping since it's no longer required
-        self.approved_labels = fetch_allowed_labels()
+        self.label_resolver = label_resolver or LabelResolver.from_files()
+        self._renderer = IssueRenderer(jiraBaseUrl)
+        self.metrics = metrics or Metrics()
 
     def get_milestones(self):
         return self._project['Milestones']
@@ -45,25 +66,75 @@ class Project:
         return merge
 
     def add_item(self, item):
+        """
+        Transform an item into an IssueRecord and add it to the project.
+        Returns the record, or None if the item belongs to another project.
+        """
         itemProject = self._projectFor(item)
         if itemProject != self.name:
             print('Skipping item ' + item.key.text + ' for project ' +
                   itemProject + ' current project: ' + self.name)
-            return
+            return None
 
-        self._append_item_to_project(item)
+        issue = self._create_issue(item)
 
-        self._add_milestone(item)
+        self._add_milestone(item, issue)
 
         self._add_labels(item)
 
-        self._add_subtasks(item)
+        self._add_subtasks(item, issue)
+
+        self._add_parenttask(item, issue)
+
+        self._add_comments(item, issue)
 
-        self._add_parenttask(item)
+        self._add_attachments(item, issue)
 
-        self._add_comments(item)
+        self._add_relationships(item, issue)
+
+        issue.content_hash = issue.compute_hash(self._stable_body(issue.body))
+
+        # Stored only once complete, so a spilling store never needs to write a record twice
+        self._project['Issues'].append(issue)
+        return issue
+
+    def add_files(self, file_names, workers=1, cache=None):
+        """
+        Add every item from the ';'-separated list of files and directories.
+
+        With more than one worker, the files are spread across a process pool.
+        Each worker builds the issues and counters for one file, and the
+        partial results are merged back in file order, so the outcome is the
+        same as adding the items one by one. With an IngestCache, files
+        transformed in an earlier run are loaded from it instead.
+        """
+        if workers <= 1 and cache is None:
+            for file_name in expand_xml_paths(file_names):
+                self.add_file(file_name)
+            return
+
+        for _ in self.iter_files(file_names, workers, cache):
+            pass
 
-        self._add_relationships(item)
+    def add_file(self, file_name):
+        """
+        Add every item of one export, timing parsing as 'read' and add_item as 'transform'.
+        """
+        ProjectSet([self], metrics=self.metrics).add_file(file_name)
+
+    def iter_files(self, file_names, workers=1, cache=None):
+        """
+        Like add_files, but yield each added issue. Issues are yielded one
+        file at a time, once the whole file has been transformed.
+        """
+        for _, issue in ProjectSet([self], metrics=self.metrics).iter_files(file_names, workers, cache):
+            yield issue
+
+    def _merge(self, partial):
+        for counter in ('Milestones', 'Components', 'Labels', 'Types'):
+            for key, count in partial[counter].items():
+                self._project[counter][key] += count
+        self._project['Issues'].extend(partial['Issues'])
 
     def prettify(self):
         def hist(h):
@@ -83,80 +154,66 @@ class Project:
         print('Total Issues to Import: %d' % len(self._project['Issues']))
 
     def _projectFor(self, item):
-        try:
-            result = item.project.get('key')
-        except AttributeError:
-            result = item.key.text.split('-')[0]
-        return result
+        return _project_key(item)
 
-    def _append_item_to_project(self, item):
+    def _create_issue(self, item):
         closed = str(item.statusCategory.get('id')) == self.doneStatusCategoryId
-        closed_at = ''
-        if closed:
-            try:
-                closed_at = self._convert_to_iso(item.resolved.text)
-            except AttributeError:
-                pass
-
-        body = self._htmlentitydecode(item.description.text)
-        body = body + '\n\n---\n<details><summary><i>Originally reported by <a title="' + str(item.reporter) + '" href="' + self.jiraBaseUrl + '/secure/ViewProfile.jspa?name=' + item.reporter.get('username') + '">' + item.reporter.get('username') + '</a>, imported from: <a href="' + self.jiraBaseUrl + '/browse/' + item.key.text + '" target="_blank">' + item.title.text[item.title.text.index("]") + 2:len(item.title.text)] + '</a></i></summary>'
-        body = body + '\n<i><ul>'
-        if item.assignee != 'Unassigned':
-            body = body + '\n<li><b>assignee</b>: <a title="' + str(item.assignee) + '" href="' + self.jiraBaseUrl + '/secure/ViewProfile.jspa?name=' + item.assignee.get('username') + '">' + item.assignee.get('username') + '</a>'
         try:
-            body = body + '\n<li><b>status</b>: ' + item.status
+            resolved_text = item.resolved.text
         except AttributeError:
-            pass
-        try:
-            body = body + '\n<li><b>priority</b>: ' + item.priority
-        except AttributeError:
-            pass
-        try:
-            body = body + '\n<li><b>resolution</b>: ' + item.resolution
-        except AttributeError:
-            pass
-        try:
-            body = body + '\n<li><b>resolved</b>: ' + self._convert_to_iso(item.resolved.text)
-        except AttributeError:
-            pass
-        body = body + '\n<li><b>imported</b>: ' + datetime.today().strftime('%Y-%m-%d')
-        body = body + '\n</ul></i>\n</details>'
+            resolved_text = None
+        created, updated, resolved = convert_timestamps(item.created.text, item.updated.text, resolved_text)
+        closed_at = resolved if closed else None
 
-        labels = []
-        if hasattr(item, 'component'):
+        assignee = None
+        if item.assignee != 'Unassigned':
+            assignee = (str(item.assignee), item.assignee.get('username'))
+
+        body = self._renderer.render_body(
+            item.description.text,
+            (str(item.reporter), item.reporter.get('username')),
+            item.key.text,
+            item.title.text[item.title.text.index("]") + 2:len(item.title.text)],
+            assignee=assignee,
+            status=self._child_text(item, 'status'),
+            priority=self._child_text(item, 'priority'),
+            resolution=self._child_text(item, 'resolution'),
+            resolved=resolved)
+
+        derived_labels = []
+        if hasattr(item, 'component') and os.getenv('JIRA_MIGRATION_INCLUDE_COMPONENT_IN_LABELS', 'true') == 'true':
             for component in item.component:
-                if os.getenv('JIRA_MIGRATION_INCLUDE_COMPONENT_IN_LABELS', 'true') == 'true':
-                    labels.append('jira-component:' + component.text.lower())
-                    labels.append(component.text.lower())
+                derived_labels.append('jira-component:' + component.text.lower())
+                derived_labels.append(component.text.lower())
+
+        type_label = self._jira_type_mapping(item.type.text.lower())
+        if type_label is not None:
+            derived_labels.append(type_label)
 
-        labels.append(self._jira_type_mapping(item.type.text.lower()))
-        
-        for label in item.labels.findall('label'):
-            converted_label = convert_label(label.text.strip().lower(), {}, self.approved_labels)  # labels_mapping removed
-            if converted_label is not None:
-                labels.append(converted_label)
+        jira_labels = [label.text for label in item.labels.findall('label')]
 
+        issue = IssueRecord(item.key.text, item.title.text, body, created, updated, closed,
+                            closed_at=closed_at, labels=self._resolve_labels(derived_labels, jira_labels))
+        issue.source_labels = (tuple(sys.intern(label) for label in derived_labels),
+                               tuple(label and sys.intern(label) for label in jira_labels))
+        issue.security = self._child_text(item, 'security')
+        return issue
+
+    def _resolve_labels(self, derived_labels, jira_labels):
+        labels = list(derived_labels)
+        labels.extend(self.label_resolver.resolve_all(jira_labels))
         labels.append('imported-jira-issue')
+        return dict.fromkeys(labels)
+
+    def _relabel(self, issue):
+        labels = tuple(self._resolve_labels(*issue.source_labels))
+        if labels != issue.labels:
+            issue.labels = tuple(sys.intern(label) for label in labels)
+            issue.content_hash = issue.compute_hash(self._stable_body(issue.body))
 
-        unique_labels = list(set(labels))
-
-        self._project['Issues'].append({'title': item.title.text,
-                                        'key': item.key.text,
-                                        'body': body,
-                                        'created_at': self._convert_to_iso(item.created.text),
-                                        'closed_at': closed_at,
-                                        'updated_at': self._convert_to_iso(item.updated.text),
-                                        'closed': closed,
-                                        'labels': unique_labels,
-                                        'comments': [],
-                                        'duplicates': [],
-                                        'is-duplicated-by': [],
-                                        'is-related-to': [],
-                                        'depends-on': [],
-                                        'blocks': []
-                                        })
-        if not self._project['Issues'][-1]['closed_at']:
-            del self._project['Issues'][-1]['closed_at']
+    def _stable_body(self, body):
+        # The body without the import date, which changes from day to day
+        return body.replace(self._renderer.imported_field, '', 1)
 
     def _jira_type_mapping(self, issue_type):
         if issue_type == 'bug':
@@ -175,89 +232,78 @@ class Project:
             return 'epic'
 
     def _convert_to_iso(self, timestamp):
-        dt = parse(timestamp)
-        return dt.isoformat()
+        return convert_to_iso(timestamp)
 
-    def _add_milestone(self, item):
+    def _add_milestone(self, item, issue):
         try:
             self._project['Milestones'][item.fixVersion.text] += 1
-            self._project['Issues'][-1]['milestone_name'] = item.fixVersion.text.strip()
+            issue.milestone_name = item.fixVersion.text.strip()
         except AttributeError:
             pass
 
     def _add_labels(self, item):
+        # Only the project-wide counters; the issue's own labels were resolved in _create_issue
         try:
             self._project['Components'][item.component.text] += 1
-            tmp_l = item.component.text.strip()
-            if tmp_l == 'Bug':
-                tmp_l = 'bug'
-
-            self._project['Issues'][-1]['labels'].append(tmp_l)
         except AttributeError:
             pass
-        
+
         try:
             for label in item.labels.label:
                 self._project['Labels'][label.text] += 1
-                tmp_l = label.text.strip()
-                if tmp_l == 'Bug':
-                    tmp_l = 'bug'
-
-                self._project['Issues'][-1]['labels'].append(tmp_l)
         except AttributeError:
             pass
 
         try:
             self._project['Types'][item.type.text] += 1
-            tmp_l = item.type.text.strip()
-            if tmp_l == 'Bug':
-                tmp_l = 'bug'
-
-            self._project['Issues'][-1]['labels'].append(tmp_l)
         except AttributeError:
             pass
 
-    def _add_subtasks(self, item):
+    def _add_subtasks(self, item, issue):
         try:
             subtaskList = ''
             for subtask in item.subtasks.subtask:
                 subtaskList = subtaskList + '- ' + subtask + '\n'
             if subtaskList != '':
-                self._project['Issues'][-1]['comments'].append(
-                    {"created_at": self._convert_to_iso(item.created.text),
-                     "body": 'Subtasks:\n\n' + subtaskList})
+                issue.add_comment(self._convert_to_iso(item.created.text), 'Subtasks:\n\n' + subtaskList)
         except AttributeError:
             pass
 
-    def _add_parenttask(self, item):
+    def _add_parenttask(self, item, issue):
         try:
             parentTask = item.parent.text
             if parentTask != '':
-                self._project['Issues'][-1]['comments'].append(
-                    {"created_at": self._convert_to_iso(item.created.text),
-                     "body": 'Subtask of parent task ' + parentTask})
+                issue.add_comment(self._convert_to_iso(item.created.text), 'Subtask of parent task ' + parentTask)
         except AttributeError:
             pass
 
-    def _add_comments(self, item):
+    def _add_comments(self, item, issue):
         try:
-            for comment in item.comments.comment:
-                self._project['Issues'][-1]['comments'].append(
-                    {"created_at": self._convert_to_iso(comment.get('created')),
-                     "body": '<i><a href="' + self.jiraBaseUrl + '/secure/ViewProfile.jspa?name=' + comment.get('author') + '">' + comment.get('author') + '</a>:</i>\n' + self._htmlentitydecode(comment.text)
-                     })
+            comments = list(item.comments.comment)
         except AttributeError:
-            pass
+            return
+        created = convert_timestamps(*(comment.get('created') for comment in comments))
+        for comment, created_at in zip(comments, created):
+            issue.add_comment(created_at, self._renderer.render_comment(comment.get('author'), comment.text),
+                              comment.get('id') or None)
+
+    def _add_attachments(self, item, issue):
+        try:
+            attachments = list(item.attachments.attachment)
+        except AttributeError:
+            return
+        for attachment in attachments:
+            issue.add_attachment(attachment.get('id'), attachment.get('name'), attachment.get('size'))
 
-    def _add_relationships(self, item):
+    def _add_relationships(self, item, issue):
         try:
             for issuelinktype in item.issuelinks.issuelinktype:
                 for outwardlink in issuelinktype.outwardlinks:
                     for issuelink in outwardlink.issuelink:
                         for issuekey in issuelink.issuekey:
                             tmp_outward = outwardlink.get("description").replace(' ', '-')
-                            if tmp_outward in self._project['Issues'][-1]:
-                                self._project['Issues'][-1][tmp_outward].append(issuekey.text)
+                            if tmp_outward in LINK_TYPES:
+                                issue.add_link(tmp_outward, issuekey.text)
         except AttributeError:
             pass
         except KeyError:
@@ -268,8 +314,8 @@ class Project:
                     for issuelink in inwardlink.issuelink:
                         for issuekey in issuelink.issuekey:
                             tmp_inward = inwardlink.get("description").replace(' ', '-')
-                            if tmp_inward in self._project['Issues'][-1]:
-                                self._project['Issues'][-1][tmp_inward].append(issuekey.text)
+                            if tmp_inward in LINK_TYPES:
+                                issue.add_link(tmp_inward, issuekey.text)
         except AttributeError:
             pass
         except KeyError:
@@ -277,12 +323,120 @@ class Project:
 
         for customfield in item.customfields.findall('customfield'):
             if customfield.get('key') == 'com.pyxis.greenhopper.jira:gh-epic-link':
-                epic_key = customfield.customfieldvalues.customfieldvalue
-                self._project['Issues'][-1]['epic-link'] = epic_key
-
-    def _htmlentitydecode(self, s):
-        if s is None:
-            return ''
-        s = s.replace(' ' * 8, '')
-        return re.sub('&(%s);' % '|'.join(name2codepoint),
-                      lambda m: chr(name2codepoint[m.group(1)]), s)
+                epic_key = customfield.customfieldvalues.customfieldvalue.text
+                issue.epic_link = epic_key
+
+    @staticmethod
+    def _child_text(item, name):
+        try:
+            return str(getattr(item, name))
+        except AttributeError:
+            return None
+
+
+class ProjectSet:
+    """
+    Several Jira projects read from one shared export in a single pass.
+
+    Every item is handed to the Project its key belongs to, so each project
+    keeps its own issues, milestone, component, label and type counters, and
+    label resolver, while every file is parsed only once however many
+    projects it holds. Items of projects outside the set are skipped.
+    """
+
+    def __init__(self, projects, metrics=None):
+        self.projects = {project.name: project for project in projects}
+        self.metrics = metrics or Metrics()
+
+    def add_item(self, item):
+        """
+        Add an item to its project and return the record, or None if its project is not in the set.
+        """
+        project = self.projects.get(_project_key(item))
+        if project is None:
+            print('Skipping item ' + item.key.text + ' for project ' +
+                  _project_key(item) + ' current project: ' + ', '.join(self.projects))
+            return None
+        return project.add_item(item)
+
+    def add_file(self, file_name):
+        """
+        Add every item of one export, timing parsing as 'read' and add_item as 'transform'.
+        """
+        items = iter_xml_file_items(file_name)
+        while True:
+            with self.metrics.phase('read'):
+                item = next(items, None)
+            if item is None:
+                return
+            with self.metrics.phase('transform'):
+                self.add_item(item)
+
+    def add_files(self, file_names, workers=1, cache=None):
+        """
+        Add every item from the ';'-separated list of files and directories,
+        see Project.add_files.
+        """
+        for _ in self.iter_files(file_names, workers, cache):
+            pass
+
+    def iter_files(self, file_names, workers=1, cache=None):
+        """
+        Add every item from the ';'-separated list of files and directories
+        and yield a (project, issue) pair for each added issue. Issues are
+        yielded one file at a time, once the whole file has been transformed,
+        project by project.
+
+        With more than one worker, the files are spread across a process pool.
+        Each worker transforms one file for every project, and the partial
+        results are merged back in file order, so the outcome is the same as
+        adding the items one by one. With an IngestCache, files transformed
+        in an earlier run are loaded from it instead, per project.
+        """
+        projects = list(self.projects.values())
+        paths = expand_xml_paths(file_names)
+        configs = None
+        if cache is not None:
+            configs = [cache.config_key(project) for project in projects]
+        missing = [path for path in paths if cache is None or not cache.has_all(path, configs)]
+
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(missing) > 1 else None
+        try:
+            specs = [(project.name, project.doneStatusCategoryId, project.jiraBaseUrl) for project in projects]
+            arguments = (repeat(specs), [self._label_resolvers() for _ in missing], missing)
+            transformed = executor.map(_ingest_file, *arguments) if executor else map(_ingest_file, *arguments)
+            for path in paths:
+                partials = None
+                if path not in missing:
+                    with self.metrics.phase('read'):
+                        partials = [cache.load(path, config, project._renderer.imported_field)
+                                    for project, config in zip(projects, configs)]
+                if partials is not None and None not in partials:
+                    # Labels are resolved again, so the current mapping and allowlist apply
+                    for project, partial in zip(projects, partials):
+                        for issue in partial['Issues']:
+                            project._relabel(issue)
+                else:
+                    if path in missing:
+                        results, phases = next(transformed)
+                    else:
+                        # Dropped from the cache since has() was checked
+                        results, phases = _ingest_file(specs, self._label_resolvers(), path)
+                    self.metrics.merge_phases(phases)
+                    partials = []
+                    for index, project in enumerate(projects):
+                        partial, label_stats = results[project.name]
+                        project.label_resolver.stats.update(label_stats)
+                        if cache is not None:
+                            cache.store(path, configs[index], partial, project._renderer.imported_field)
+                        partials.append(partial)
+                for project, partial in zip(projects, partials):
+                    project._merge(partial)
+                    for issue in partial['Issues']:
+                        yield project, issue
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _label_resolvers(self):
+        return [project.label_resolver.copy() for project in self.projects.values()]
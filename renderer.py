@@ -0,0 +1,69 @@
+"""
+Rendering of the bodies of migrated issues and comments.
+
+The HTML entity decoder and the body templates are compiled once at import
+time and every body is assembled with a single join, instead of rebuilding a
+regex over all entity names and concatenating strings piece by piece for
+each description and comment.
+"""
+
+import re
+from datetime import date
+from html.entities import name2codepoint
+
+# Any &name; reference; names that are not HTML entities are left untouched
+_ENTITY = re.compile(r'&(\w+);')
+
+_USER_LINK = '<a title="{name}" href="{profile_url}{username}">{username}</a>'
+_SUMMARY = ('\n\n---\n<details><summary><i>Originally reported by {reporter}, '
+            'imported from: <a href="{browse_url}{key}" target="_blank">{summary}</a></i></summary>\n<i><ul>')
+_FIELD = '\n<li><b>{name}</b>: {value}'
+_FOOTER = '\n</ul></i>\n</details>'
+_COMMENT = '<i><a href="{profile_url}{author}">{author}</a>:</i>\n{text}'
+
+
+def _decode_entity(match):
+    codepoint = name2codepoint.get(match.group(1))
+    return chr(codepoint) if codepoint is not None else match.group(0)
+
+
+def htmlentitydecode(s):
+    if s is None:
+        return ''
+    s = s.replace(' ' * 8, '')
+    if '&' not in s:
+        return s
+    return _ENTITY.sub(_decode_entity, s)
+
+
+class IssueRenderer:
+    def __init__(self, jira_base_url):
+        self._profile_url = jira_base_url + '/secure/ViewProfile.jspa?name='
+        self._browse_url = jira_base_url + '/browse/'
+        # The only part of a body that changes from day to day; content hashes leave it out
+        self.imported_field = _FIELD.format(name='imported', value=date.today().isoformat())
+
+    def render_body(self, description, reporter, key, summary, assignee=None, status=None, priority=None,
+                    resolution=None, resolved=None):
+        """
+        Render an issue body. `reporter` and `assignee` are (display name,
+        username) pairs; fields left as None are omitted.
+        """
+        parts = [htmlentitydecode(description),
+                 _SUMMARY.format(reporter=self._user_link(*reporter), browse_url=self._browse_url,
+                                 key=key, summary=summary)]
+        if assignee is not None:
+            parts.append(_FIELD.format(name='assignee', value=self._user_link(*assignee)))
+        for name, value in (('status', status), ('priority', priority), ('resolution', resolution),
+                            ('resolved', resolved)):
+            if value is not None:
+                parts.append(_FIELD.format(name=name, value=value))
+        parts.append(self.imported_field)
+        parts.append(_FOOTER)
+        return ''.join(parts)
+
+    def render_comment(self, author, text):
+        return _COMMENT.format(profile_url=self._profile_url, author=author, text=htmlentitydecode(text))
+
+    def _user_link(self, name, username):
+        return _USER_LINK.format(name=name, profile_url=self._profile_url, username=username)
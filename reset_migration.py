@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+Delete every issue and label from a repository between test migrations.
+
+Caution: make sure anything you want to keep is managed in code, i.e.
+existing labels that may be used for pull requests.
+
+Issues and labels are listed with full pagination. Issues are deleted with
+batched GraphQL deleteIssue mutations and labels with REST deletes, both
+spread over a bounded worker pool. All calls go through the shared GitHub
+client, which backs off on rate limits. If a migration ledger exists, its
+entries for the repository are dropped as well so the next migration starts
+from scratch.
+
+Usage (the argument matches the reset-migration.sh it replaces):
+
+    python3 reset_migration.py OWNER/REPO
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+
+from github_client import GitHubClient
+from ledger import MigrationLedger
+
+DELETE_MUTATION = 'mutation(%s) { %s }'
+DELETE_FIELD = 'd%d: deleteIssue(input: {issueId: $id%d}) { clientMutationId }'
+
+
+def list_issue_ids(client, owner, repo):
+    return [issue['node_id'] for issue in client.paginate(f'/repos/{owner}/{repo}/issues', params={'state': 'all'})
+            if 'pull_request' not in issue]
+
+
+def list_labels(client, owner, repo):
+    return [label['name'] for label in client.paginate(f'/repos/{owner}/{repo}/labels')]
+
+
+def delete_issues(client, node_ids):
+    """
+    Delete the issues in one GraphQL mutation and return how many were deleted.
+    """
+    declarations = ', '.join(f'$id{position}: ID!' for position in range(len(node_ids)))
+    fields = ' '.join(DELETE_FIELD % (position, position) for position in range(len(node_ids)))
+    # Deleting an issue twice does no harm, so the mutation may be resent
+    result = client.graphql(DELETE_MUTATION % (declarations, fields),
+                            {f'id{position}': node_id for position, node_id in enumerate(node_ids)}, idempotent=True)
+    if result.get('errors'):
+        print(f"Failed to delete some issues: {result['errors']}")
+    return sum(1 for value in (result.get('data') or {}).values() if value is not None)
+
+
+def delete_label(client, owner, repo, name):
+    response = client.delete(f'/repos/{owner}/{repo}/labels/{quote(name, safe="")}')
+    if response.status_code not in (204, 404):
+        print(f"Failed to delete label '{name}': {response.status_code} - {response.text}")
+        return 0
+    return 1
+
+
+def reset_repository(client, owner, repo, workers=10, batch_size=25):
+    node_ids = list_issue_ids(client, owner, repo)
+    print(f'Deleting {len(node_ids)} issues from {owner}/{repo}')
+    batches = [node_ids[start:start + batch_size] for start in range(0, len(node_ids), batch_size)]
+    deleted = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in as_completed([executor.submit(delete_issues, client, batch) for batch in batches]):
+            deleted += future.result()
+            print(f'Deleted {deleted} of {len(node_ids)} issues')
+
+    labels = list_labels(client, owner, repo)
+    print(f'Deleting {len(labels)} labels from {owner}/{repo}')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        removed = sum(executor.map(lambda name: delete_label(client, owner, repo, name), labels))
+    print(f'Deleted {removed} of {len(labels)} labels')
+    return deleted, removed
+
+
+if __name__ == '__main__':
+    owner, repo = sys.argv[1].split('/')
+    workers = int(os.getenv('JIRA_MIGRATION_GITHUB_CONCURRENCY', '10'))
+    client = GitHubClient(os.getenv('JIRA_MIGRATION_GITHUB_ACCESS_TOKEN'), concurrency=workers,
+                          writes_per_second=float(os.getenv('JIRA_MIGRATION_GITHUB_WRITES_PER_SECOND', '1.0')))
+
+    reset_repository(client, owner, repo, workers=workers)
+
+    ledger_path = os.getenv('JIRA_MIGRATION_LEDGER', 'migration_ledger.db')
+    if os.path.exists(ledger_path):
+        ledger = MigrationLedger(ledger_path)
+        ledger.forget_repo(repo)
+        ledger.close()
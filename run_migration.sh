@@ -60,7 +60,7 @@ fi
 # If XML_PATH is not provided, auto-detect XML files in the current directory
 if [ -z "$XML_PATH" ]; then
     echo "No XML path provided. Searching for XML files in the current directory..."
-    XML_FILES=$(find "$(pwd)" -maxdepth 1 -name "*.xml")
+    XML_FILES=$(find "$(pwd)" -maxdepth 1 \( -name "*.xml" -o -name "*.xml.gz" \))
     if [ -z "$XML_FILES" ]; then
         echo "No XML files found in the current directory. Please ensure the XML file is in the same directory as this script."
         exit 1
@@ -77,9 +77,9 @@ echo "XML Paths: $XML_PATH"
 echo "Done Status ID: $JIRA_DONE_ID"
 echo "Start from: $START_FROM"
 
-# Request GitHub PAT from user input and display it for confirmation
-read -p "Enter your GitHub Personal Access Token (PAT): " GITHUB_PAT
-echo "GitHub PAT: $GITHUB_PAT"  # Display PAT to ensure it's correctly entered
+# Request GitHub PAT from user input without echoing it to the terminal
+read -s -p "Enter your GitHub Personal Access Token (PAT): " GITHUB_PAT
+echo
 
 # Set environment variables
 export JIRA_MIGRATION_JIRA_PROJECT_NAME="$JIRA_PROJECT"
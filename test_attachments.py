@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from attachments import AttachmentMirror
+from conftest import make_issue
+from mock_jira import MockJira
+
+MIRROR_URL = 'https://example.github.io/mirror'
+LOG = b'build failed\n' * 10000
+
+
+@pytest.fixture
+def jira():
+    mock = MockJira([], attachments={'1': LOG, '2': LOG, '3': b'\x89PNG screenshot'})
+    mock.start()
+    yield mock
+    mock.stop()
+
+
+@pytest.fixture
+def mirror_dir(tmp_path):
+    return str(tmp_path / 'mirror')
+
+
+def open_mirror(jira, mirror_dir):
+    return AttachmentMirror(jira.url, mirror_dir, MIRROR_URL, workers=2)
+
+
+def issue_with(key, *attachments, body=''):
+    issue = make_issue(key, body=body)
+    for attachment_id, name in attachments:
+        issue.add_attachment(attachment_id, name)
+    return issue
+
+
+def stored_files(mirror_dir):
+    return sorted(os.path.relpath(os.path.join(directory, name), mirror_dir)
+                  for directory, _, names in os.walk(mirror_dir) for name in names
+                  if not directory.endswith('.partial') and not name.startswith('.manifest'))
+
+
+def test_identical_attachments_are_stored_once(jira, mirror_dir):
+    mirror = open_mirror(jira, mirror_dir)
+    first = issue_with('TEST-1', ('1', 'build.log'), ('3', 'screen.png'))
+    second = issue_with('TEST-2', ('2', 'build-again.log'))
+
+    assert mirror.mirror(first) and mirror.mirror(second)
+
+    assert (mirror.downloaded, mirror.deduplicated, mirror.failed) == (2, 1, 0)
+    assert len(stored_files(mirror_dir)) == 2
+    assert mirror.url('1') == mirror.url('2')
+    with open(os.path.join(mirror_dir, stored_files(mirror_dir)[0]), 'rb') as file:
+        assert file.read() in (LOG, b'\x89PNG screenshot')
+    assert os.listdir(os.path.join(mirror_dir, '.partial')) == []
+    mirror.close()
+
+
+def test_a_restarted_run_downloads_nothing_mirrored_already(jira, mirror_dir):
+    mirror = open_mirror(jira, mirror_dir)
+    mirror.mirror(issue_with('TEST-1', ('1', 'build.log'), ('3', 'screen.png')))
+    url = mirror.url('1')
+    mirror.close()
+    jira.requests.clear()
+
+    restarted = open_mirror(jira, mirror_dir)
+    assert restarted.mirror(issue_with('TEST-1', ('1', 'build.log'), ('3', 'screen.png')))
+
+    assert jira.requests == []
+    assert restarted.url('1') == url
+    restarted.close()
+
+
+def test_rewriting_again_leaves_the_issue_unchanged(jira, mirror_dir):
+    mirror = open_mirror(jira, mirror_dir)
+    body = (f'<p>See <a href="{jira.url}/secure/attachment/1/build.log">the log</a> and '
+            f'<img src="/secure/thumbnail/3/_thumb_3.png"></p>')
+    issue = issue_with('TEST-1', ('1', 'build.log'), ('3', 'screen.png'), body=body)
+    issue.add_comment('2020-01-01T01:00:00', f'Also in {jira.url}/secure/attachment/3/screen.png', '1')
+
+    mirror.mirror(issue)
+    rewritten, comments = issue.body, issue.comments
+    mirror.mirror(issue)
+    mirror.rewrite(issue)
+
+    assert issue.body == rewritten
+    assert issue.comments == comments
+    assert '/secure/' not in issue.body and '/secure/' not in issue.comments[0].body
+    assert issue.body.count('<summary>Attachments</summary>') == 1
+    assert issue.body.count(mirror.url('1')) == 2
+    mirror.close()
+
+
+def test_failed_downloads_keep_their_jira_links(jira, mirror_dir):
+    mirror = open_mirror(jira, mirror_dir)
+    issue = issue_with('TEST-1', ('1', 'build.log'), ('9', 'missing.txt'),
+                       body=f'{jira.url}/secure/attachment/9/missing.txt')
+
+    assert not mirror.mirror(issue)
+
+    assert mirror.failed == 1
+    assert issue.body.startswith(f'{jira.url}/secure/attachment/9/missing.txt')
+    assert 'missing.txt</a>' not in issue.body
+    assert not mirror.is_mirrored(issue)
+    assert os.listdir(os.path.join(mirror_dir, '.partial')) == []
+
+    jira.attachments['9'] = b'found later'
+    assert mirror.mirror(issue)
+    assert mirror.url('9') in issue.body and '/secure/' not in issue.body
+    mirror.close()
+
+
+def test_names_cannot_escape_the_mirror_directory(jira, mirror_dir):
+    mirror = open_mirror(jira, mirror_dir)
+
+    mirror.mirror(issue_with('TEST-1', ('3', '../../etc/passwd')))
+
+    stored, = stored_files(mirror_dir)
+    assert stored.endswith(os.sep + 'passwd') and not stored.startswith('..')
+    mirror.close()
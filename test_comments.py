@@ -0,0 +1,115 @@
+import sqlite3
+
+import pytest
+
+from conftest import Options, Project, make_issue, requests_to
+from importer import Importer
+from ledger import IMPORTED, MigrationLedger
+
+COMMENTS = r'/repos/([^/]+)/([^/]+)/issues/(\d+)/comments'
+
+
+@pytest.fixture
+def importer(client, ledger):
+    return Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+
+
+def import_issue(importer, *comments):
+    importer.submit_issue(make_issue('TEST-1', comments))
+    importer.wait_for_imports()
+
+
+def remote_comments(github):
+    return [comment['body'] for comment in github.issues['acct/repo'][1]['comments']]
+
+
+def test_only_new_comments_are_posted(github, importer, ledger):
+    import_issue(importer, ('1', 'First'), ('2', 'Second'))
+    issue = make_issue('TEST-1', [('1', 'First'), ('2', 'Second'), ('3', 'Third')])
+
+    assert importer.post_process_comments([issue]) == 1
+
+    assert remote_comments(github) == ['First', 'Second', 'Third']
+    assert ledger.posted_comments('TEST-1') == {'1', '2', '3'}
+    assert ledger.is_current('TEST-1', issue.content_hash)
+
+
+def test_a_deleted_comment_does_not_shift_the_others(github, importer, ledger):
+    import_issue(importer, ('1', 'First'), ('2', 'Second'), ('3', 'Third'))
+    issue = make_issue('TEST-1', [('1', 'First'), ('3', 'Third'), ('4', 'Fourth')])
+
+    importer.post_process_comments([issue])
+
+    assert remote_comments(github) == ['First', 'Second', 'Third', 'Fourth']
+    assert ledger.posted_comments('TEST-1') == {'1', '2', '3', '4'}
+
+
+def test_an_interrupted_issue_resumes_after_the_last_comment_posted(github, client, importer, ledger, reopen):
+    import_issue(importer, ('1', 'First'))
+    issue = make_issue('TEST-1', [('1', 'First'), ('2', 'Second'), ('3', 'Third'), ('4', 'Fourth')])
+    # The third comment fails without being posted
+    github.routes.insert(0, ('POST', COMMENTS, lambda handler, parsed, body, *groups: (
+        (500, {'message': 'Server Error'}, {}) if body['body'] == 'Third'
+        else github._create_comment(handler, parsed, body, *groups))))
+
+    assert importer.post_process_comments([issue]) == 0
+    assert remote_comments(github) == ['First', 'Second']
+    ledger = reopen(ledger)
+    assert ledger.posted_comments('TEST-1') == {'1', '2'}
+    assert not ledger.is_current('TEST-1', issue.content_hash)
+
+    del github.routes[0]
+    rerun = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+    assert rerun.post_process_comments([issue]) == 1
+
+    assert remote_comments(github) == ['First', 'Second', 'Third', 'Fourth']
+    assert ledger.posted_comments('TEST-1') == {'1', '2', '3', '4'}
+    assert ledger.is_current('TEST-1', issue.content_hash)
+    # One comment posted and one refused, then the two left
+    assert requests_to(github, 'POST', '/issues/1/comments') == 4
+
+
+def test_comments_posted_despite_an_error_are_not_posted_again(github, importer, ledger):
+    import_issue(importer)
+    github.fail_every = 2
+    issue = make_issue('TEST-1', [(str(n), f'Comment {n}') for n in range(1, 7)])
+
+    assert importer.post_process_comments([issue]) == 1
+    assert importer.post_process_comments([issue]) == 1
+
+    assert remote_comments(github) == [f'Comment {n}' for n in range(1, 7)]
+    assert requests_to(github, 'POST', '/issues/1/comments') == 6
+
+
+def test_notes_without_a_jira_id_are_identified_by_time_and_text(github, importer, ledger):
+    import_issue(importer, ('1', 'First'))
+    issue = make_issue('TEST-1', [('1', 'First')])
+    # A subtask note, dated like the issue, sorts before the Jira comments
+    issue.add_comment('2019-12-31T00:00:00', 'Subtask TEST-2 was added')
+    issue.content_hash = issue.compute_hash()
+
+    importer.post_process_comments([issue])
+    importer.post_process_comments([issue])
+
+    assert remote_comments(github) == ['First', 'Subtask TEST-2 was added']
+    assert len(ledger.posted_comments('TEST-1')) == 2
+
+
+def test_entries_with_only_a_comment_count_post_the_comments_beyond_it(github, client, tmp_path):
+    github._add_issue('acct', 'repo', {'title': '[TEST-1] Issue'}, comments=[{'body': 'First'}, {'body': 'Second'}])
+    # A ledger written before comment identities were recorded
+    with sqlite3.connect(tmp_path / 'old.db') as connection:
+        connection.execute('CREATE TABLE issues (key TEXT PRIMARY KEY, repo TEXT, status TEXT, number INTEGER, '
+                           'import_url TEXT, updated REAL, content_hash TEXT, comments INTEGER)')
+        connection.execute("INSERT INTO issues VALUES ('TEST-1', 'repo', 'imported', 1, NULL, 0, 'old', 2)")
+    connection.close()
+    ledger = MigrationLedger(str(tmp_path / 'old.db'))
+    importer = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+    issue = make_issue('TEST-1', [('1', 'First'), ('2', 'Second'), ('3', 'Third')])
+
+    importer.post_process_comments([issue])
+
+    assert remote_comments(github) == ['First', 'Second', 'Third']
+    assert ledger.get('TEST-1')[1] == IMPORTED
+    assert ledger.posted_comments('TEST-1') == {'1', '2', '3'}
+    ledger.close()
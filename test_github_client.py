@@ -0,0 +1,93 @@
+import socket
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from conftest import Options, Project, make_issue, requests_to
+from github_client import GitHubClient, retry_after_seconds
+from importer import Importer
+from ledger import IMPORTED, SUBMITTED
+
+
+def test_retry_after_is_read_as_seconds_or_as_a_date():
+    assert retry_after_seconds('3') == 3.0
+    assert retry_after_seconds('-1') == 0.0
+    assert 8 < retry_after_seconds(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert retry_after_seconds(formatdate(time.time() - 10, usegmt=True)) == 0.0
+    assert retry_after_seconds('soon') is None
+
+
+def test_secondary_rate_limits_are_waited_out_and_retried(github, client):
+    github.throttle_every = 3
+    github.retry_after = 0
+
+    responses = [client.get('/repos/acct/repo/labels') for _ in range(4)]
+    created = client.post('/repos/acct/repo/labels', json={'name': 'bug'})
+
+    assert [response.status_code for response in responses] == [200] * 4
+    assert created.status_code == 201
+    # Requests 3 and 6 were throttled and sent again
+    assert len(github.requests) == 7
+    assert client.metrics.counters['rate_limit_waits'] == 2
+    assert list(github.labels['acct/repo']) == ['bug']
+
+
+def test_server_errors_are_retried_for_reads(github, client):
+    failures = iter([True, True])
+    github.routes.insert(0, ('GET', r'/flaky', lambda *args: (502, {}, {}) if next(failures, False) else (200, [], {})))
+
+    assert client.get('/flaky').status_code == 200
+    assert requests_to(github, 'GET', '/flaky') == 3
+    assert client.metrics.counters['retries'] == 2
+
+
+def test_writes_are_not_resent_after_a_server_error(github, client):
+    github.fail_every = 1
+
+    response = client.post('/repos/acct/repo/labels', json={'name': 'bug'})
+
+    assert response.status_code == 502
+    assert requests_to(github, 'POST', '/labels') == 1
+    assert list(github.labels['acct/repo']) == ['bug']
+
+
+def test_writes_that_could_not_connect_are_retried():
+    with socket.socket() as closed:
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+    client = GitHubClient('token', api_url=f'http://127.0.0.1:{port}', max_retries=2, backoff=0.01)
+
+    with pytest.raises(requests.ConnectionError):
+        client.post('/repos/acct/repo/labels', json={'name': 'bug'})
+    assert client.metrics.counters['connection_errors'] == 3
+
+
+def test_import_with_an_unknown_outcome_is_looked_up_instead_of_resent(github, client, ledger, reopen):
+    github.fail_every = 1
+    importer = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+
+    assert not importer.submit_issue(make_issue('TEST-1'))
+    assert ledger.get('TEST-1') == ('repo', SUBMITTED, None, None)
+    assert client.metrics.counters['issues_unconfirmed'] == 1
+
+    # The next run finds the issue GitHub imported despite the 502
+    github.fail_every = 0
+    ledger = reopen(ledger)
+    rerun = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+    assert not rerun.submit_issue(make_issue('TEST-1'))
+
+    assert ledger.get('TEST-1')[1:3] == (IMPORTED, 1)
+    assert requests_to(github, 'POST', '/import/issues') == 1
+    assert len(github.issues['acct/repo']) == 1
+
+
+def test_import_with_an_unknown_outcome_is_resent_if_github_lacks_it(github, client, ledger, reopen):
+    ledger.reserve('TEST-1', 'repo')
+    ledger = reopen(ledger)
+    importer = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+
+    assert importer.submit_issue(make_issue('TEST-1'))
+    assert importer.wait_for_imports() == {'TEST-1': 1}
+    assert requests_to(github, 'POST', '/import/issues') == 1
@@ -0,0 +1,95 @@
+import socket
+
+import pytest
+
+from conftest import Options, Project, make_issue, requests_to
+from importer import MAX_POLL_FAILURES, Importer
+from ledger import FAILED, IMPORTED, SUBMITTED
+
+
+@pytest.fixture
+def importer(client, ledger):
+    return Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+
+
+def test_issues_are_imported_with_their_comments(github, importer, ledger):
+    issues = [make_issue(f'TEST-{n}', comments=[(f'{n}0', 'First'), (f'{n}1', 'Second')]) for n in range(1, 4)]
+    for issue in issues:
+        assert importer.submit_issue(issue)
+
+    results = importer.wait_for_imports()
+
+    assert results == {'TEST-1': 1, 'TEST-2': 2, 'TEST-3': 3}
+    assert requests_to(github, 'POST', '/import/issues') == 3
+    assert [comment['body'] for comment in github.issues['acct/repo'][2]['comments']] == ['First', 'Second']
+    assert all(ledger.get(issue.key)[1:3] == ('imported', results[issue.key]) for issue in issues)
+    assert ledger.posted_comments('TEST-2') == {'20', '21'}
+
+
+def test_submitted_issues_are_not_submitted_again(github, importer, ledger):
+    issue = make_issue('TEST-1')
+    assert importer.submit_issue(issue)
+    assert not importer.submit_issue(issue)
+    importer.wait_for_imports()
+    assert not importer.submit_issue(issue)
+
+    assert requests_to(github, 'POST', '/import/issues') == 1
+
+
+def test_pending_imports_are_polled_until_imported(github, client, ledger):
+    github.import_polls = 2
+    importer = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+    importer.submit_issue(make_issue('TEST-1'))
+    assert ledger.get('TEST-1')[1] == SUBMITTED
+
+    assert importer.wait_for_imports() == {'TEST-1': 1}
+    assert requests_to(github, 'GET', '/import/issues/1') == 3
+
+
+def test_imports_of_an_interrupted_run_are_resumed(github, client, ledger):
+    github.import_polls = 1
+    Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0) \
+        .submit_issue(make_issue('TEST-1'))
+
+    # A new run, after the first stopped without polling
+    resumed = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+
+    assert resumed.wait_for_imports() == {'TEST-1': 1}
+    assert ledger.get('TEST-1')[1:3] == (IMPORTED, 1)
+    assert requests_to(github, 'POST', '/import/issues') == 1
+
+
+def test_stale_import_url_is_given_up_at_once(github, client, ledger):
+    ledger.record('TEST-1', 'repo', SUBMITTED, import_url=f'{github.url}/repos/acct/repo/import/issues/99')
+
+    importer = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+
+    assert importer.wait_for_imports() == {'TEST-1': None}
+    assert ledger.get('TEST-1')[1] == FAILED
+    assert requests_to(github, 'GET', '/import/issues/99') == 1
+
+
+def test_failing_import_status_is_given_up_after_max_poll_failures(github, client, ledger):
+    github.routes.insert(0, ('GET', r'/repos/([^/]+)/([^/]+)/import/issues/(\d+)',
+                             lambda *args: (500, {'message': 'Server Error'}, {})))
+    client.max_retries = 0
+    importer = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+    importer.submit_issue(make_issue('TEST-1'))
+
+    assert importer.wait_for_imports() == {'TEST-1': None}
+    assert ledger.get('TEST-1')[1] == FAILED
+    assert requests_to(github, 'GET', '/import/issues/1') == MAX_POLL_FAILURES
+
+
+def test_unreachable_import_status_is_given_up_after_max_poll_failures(github, client, ledger):
+    # A port nothing listens on any more, so every poll fails to connect
+    with socket.socket() as closed:
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+    ledger.record('TEST-1', 'repo', SUBMITTED, import_url=f'http://127.0.0.1:{port}/repos/acct/repo/import/issues/1')
+    client.max_retries = 0
+    importer = Importer(Options('token', 'acct', 'repo'), Project('TEST'), client, ledger, poll_interval=0)
+
+    assert importer.wait_for_imports() == {'TEST-1': None}
+    assert ledger.get('TEST-1')[1] == FAILED
+    assert client.metrics.counters['connection_errors'] == MAX_POLL_FAILURES
@@ -0,0 +1,88 @@
+import pytest
+
+from jira_commenter import JiraCommenter
+from mock_jira import MockJira
+
+ISSUES_URL = 'https://github.com/acct/repo/issues'
+
+
+@pytest.fixture
+def jira():
+    mock = MockJira([{'key': f'TEST-{n}', 'fields': {}} for n in range(1, 6)])
+    mock.start()
+    yield mock
+    mock.stop()
+
+
+def back_links(jira, key):
+    issue = next(issue for issue in jira.issues if issue['key'] == key)
+    return [comment['body'] for comment in (issue['fields'].get('comment') or {}).get('comments', [])
+            if ISSUES_URL in comment['body']]
+
+
+def posts(jira):
+    return sum(1 for _, sent in jira.requests if 'body' in sent)
+
+
+def commenter(jira, tmp_path):
+    return JiraCommenter(jira.url, 'user', 'password', progress_path=str(tmp_path / 'progress'), workers=4,
+                         backoff=0.01)
+
+
+def test_every_issue_is_commented_once(jira, tmp_path):
+    mapping = {f'TEST-{n}': (ISSUES_URL, 40 + n) for n in range(1, 6)}
+
+    assert commenter(jira, tmp_path).comment_all(mapping) == []
+
+    assert posts(jira) == 5
+    assert all(len(back_links(jira, key)) == 1 for key in mapping)
+    assert f'{ISSUES_URL}/41\n' in back_links(jira, 'TEST-1')[0]
+    assert sorted((tmp_path / 'progress').read_text().split()) == sorted(mapping)
+
+
+def test_a_rerun_skips_the_issues_in_the_progress_file(jira, tmp_path):
+    mapping = {f'TEST-{n}': (ISSUES_URL, 40 + n) for n in range(1, 6)}
+    commenter(jira, tmp_path).comment_all(dict(list(mapping.items())[:2]))
+    sent = len(jira.requests)
+
+    assert commenter(jira, tmp_path).comment_all(mapping) == []
+
+    # Only the three issues left are checked and commented on
+    assert len(jira.requests) - sent == 6
+    assert posts(jira) == 5
+
+
+def test_a_rerun_without_progress_finds_the_existing_back_links(jira, tmp_path):
+    mapping = {f'TEST-{n}': (ISSUES_URL, 40 + n) for n in range(1, 6)}
+    commenter(jira, tmp_path).comment_all(mapping)
+    (tmp_path / 'progress').unlink()
+
+    assert commenter(jira, tmp_path).comment_all(mapping) == []
+
+    assert posts(jira) == 5
+    assert all(len(back_links(jira, key)) == 1 for key in mapping)
+
+
+def test_a_link_to_another_issue_is_not_taken_for_the_back_link(jira, tmp_path):
+    commenter(jira, tmp_path).comment_all({'TEST-1': (ISSUES_URL, 415)})
+    (tmp_path / 'progress').unlink()
+
+    commenter(jira, tmp_path).comment_all({'TEST-1': (ISSUES_URL, 41)})
+
+    assert len(back_links(jira, 'TEST-1')) == 2
+
+
+def test_throttled_comments_are_retried_after_the_retry_after_date(jira, tmp_path):
+    jira.throttle_every = 2
+    mapping = {f'TEST-{n}': (ISSUES_URL, 40 + n) for n in range(1, 4)}
+
+    assert commenter(jira, tmp_path).comment_all(mapping) == []
+
+    assert all(len(back_links(jira, key)) == 1 for key in mapping)
+    # Every second post was throttled: 3 accepted, 2 answered with a 429
+    assert posts(jira) == 5
+
+
+def test_unknown_issues_fail_without_retrying(jira, tmp_path):
+    assert commenter(jira, tmp_path).comment_all({'NOPE-1': (ISSUES_URL, 1)}) == ['NOPE-1']
+    assert len(jira.requests) == 1
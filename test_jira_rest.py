@@ -0,0 +1,88 @@
+import re
+
+import pytest
+
+from fetch_issues import create_session
+from jira_rest import FIELDS, SEARCH_PATH, fetch_issues, fetch_page
+from mock_jira import MockJira
+
+
+def jira_issue(n, comments=0):
+    return {
+        'id': str(10000 + n), 'key': f'TEST-{n}',
+        'fields': {
+            'summary': f'Issue {n}', 'issuetype': {'name': 'Bug'},
+            'status': {'name': 'Open', 'statusCategory': {'id': 2, 'key': 'new'}},
+            'created': '2020-01-01T00:00:00.000+0000', 'updated': '2020-01-02T00:00:00.000+0000',
+            'comment': {'total': comments, 'comments': [
+                {'id': str(n * 100 + c), 'body': f'Comment {c}', 'author': {'name': 'someone'},
+                 'created': f'2020-01-01T00:{c:02d}:00.000+0000'} for c in range(comments)]},
+        },
+        'renderedFields': {'description': f'<p>Description of {n}</p>'},
+    }
+
+
+@pytest.fixture
+def jira(request):
+    mock = MockJira([jira_issue(n) for n in range(75)], **getattr(request, 'param', {}))
+    mock.start()
+    yield mock
+    mock.stop()
+
+
+def searches(jira):
+    return [query for path, query in jira.requests if path == SEARCH_PATH]
+
+
+def fetched_keys(directory):
+    return sorted(key for path in directory.iterdir()
+                  for key in re.findall(r'<key id="\d+">(.*?)</key>', path.read_text()))
+
+
+def test_pages_are_fetched_with_only_the_fields_read(jira, tmp_path):
+    fetch_issues(jira.url, 'project = TEST', output_dir=str(tmp_path), workers=2, session=create_session(2),
+                 max_results=25)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['rest-0.xml', 'rest-25.xml', 'rest-50.xml']
+    assert fetched_keys(tmp_path) == sorted(f'TEST-{n}' for n in range(75))
+    # One request for the total, one per page
+    assert len(searches(jira)) == 4
+    assert all(query['fields'] == ','.join(FIELDS) for query in searches(jira))
+
+
+@pytest.mark.parametrize('jira', [{'max_page_size': 30}], indirect=True)
+def test_the_page_size_follows_the_server_cap(jira, tmp_path):
+    fetch_issues(jira.url, 'project = TEST', output_dir=str(tmp_path), workers=2, session=create_session(2))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['rest-0.xml', 'rest-30.xml', 'rest-60.xml']
+    assert fetched_keys(tmp_path) == sorted(f'TEST-{n}' for n in range(75))
+    assert [int(query['maxResults']) for query in searches(jira)] == [100, 30, 30, 30]
+
+
+@pytest.mark.parametrize('jira', [{'max_page_size': 30}], indirect=True)
+def test_a_short_page_fails_instead_of_dropping_issues(jira, tmp_path):
+    with pytest.raises(ValueError, match='returned 30 issues'):
+        fetch_page(create_session(1), jira.url, 'project = TEST', 0, str(tmp_path), 75, max_results=50)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_pages_on_disk_are_not_fetched_again(jira, tmp_path):
+    fetch_issues(jira.url, 'project = TEST', output_dir=str(tmp_path), session=create_session(4), max_results=50)
+    (tmp_path / 'rest-50.xml').unlink()
+    jira.requests.clear()
+
+    fetch_issues(jira.url, 'project = TEST', output_dir=str(tmp_path), session=create_session(4), max_results=50)
+
+    assert [int(query['startAt']) for query in searches(jira)] == [0, 50]
+    assert fetched_keys(tmp_path) == sorted(f'TEST-{n}' for n in range(75))
+
+
+@pytest.mark.parametrize('jira', [{'comments_per_issue': 2}], indirect=True)
+def test_truncated_comments_are_completed(jira, tmp_path):
+    jira.issues[3] = jira_issue(3, comments=5)
+
+    fetch_issues(jira.url, 'project = TEST', output_dir=str(tmp_path), session=create_session(1))
+
+    assert [path for path, _ in jira.requests if path != SEARCH_PATH] == ['/rest/api/2/issue/TEST-3/comment']
+    assert (tmp_path / 'rest-0.xml').read_text().count('<comment ') == 5
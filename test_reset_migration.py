@@ -0,0 +1,37 @@
+from conftest import requests_to
+from ledger import IMPORTED
+from reset_migration import reset_repository
+
+
+def test_every_issue_and_label_is_deleted_in_batches(github, client):
+    for n in range(230):
+        github._add_issue('acct', 'repo', {'title': f'[TEST-{n}] Issue'})
+    github._add_issue('acct', 'repo', {'title': 'A pull request', 'pull_request': {}})
+    github._add_issue('acct', 'other', {'title': '[OTHER-1] Issue'})
+    for n in range(120):
+        github.labels.setdefault('acct/repo', {})[f'label-{n}'] = {'name': f'label-{n}', 'color': 'ededed'}
+
+    assert reset_repository(client, 'acct', 'repo', workers=4, batch_size=25) == (230, 120)
+
+    assert [issue['title'] for issue in github.issues['acct/repo'].values()] == ['A pull request']
+    assert github.labels['acct/repo'] == {}
+    assert len(github.issues['acct/other']) == 1
+    # Three pages of issues and two of labels
+    assert requests_to(github, 'GET', '/repos/acct/repo/issues') == 3
+    assert requests_to(github, 'GET', '/repos/acct/repo/labels') == 2
+    assert requests_to(github, 'POST', '/graphql') == 10
+    assert sum(1 for method, _ in github.requests if method == 'DELETE') == 120
+
+
+def test_an_empty_repository_takes_one_listing_each(github, client):
+    assert reset_repository(client, 'acct', 'repo') == (0, 0)
+    assert len(github.requests) == 2
+
+
+def test_the_ledger_forgets_the_reset_repository(ledger):
+    ledger.record('TEST-1', 'repo', IMPORTED, number=1)
+    ledger.record('OTHER-1', 'other', IMPORTED, number=1)
+
+    ledger.forget_repo('repo')
+
+    assert ledger.imported() == {'OTHER-1': ('other', 1)}
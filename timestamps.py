@@ -0,0 +1,56 @@
+"""
+Conversion of Jira timestamps to ISO 8601.
+
+Jira's XML export writes every timestamp in one RFC 2822 style format, e.g.
+'Mon, 3 Jan 2022 10:00:00 +0000', and its REST API uses ISO 8601, e.g.
+'2022-01-03T10:00:00.000+0000'. Both are parsed directly; anything else falls
+back to dateutil's general purpose parser. Results are memoized,
+since created/updated dates repeat across an item, its subtasks and its
+comments.
+"""
+
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from dateutil.parser import parse
+
+_MONTHS = {name: number for number, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), start=1)}
+
+
+@lru_cache(maxsize=None)
+def _timezone(offset):
+    if len(offset) != 5 or offset[0] not in '+-':
+        raise ValueError(f'Unsupported UTC offset {offset!r}')
+    minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+    if minutes == 0:
+        return timezone.utc
+    return timezone(timedelta(minutes=minutes if offset[0] == '+' else -minutes))
+
+
+def _parse_jira_timestamp(timestamp):
+    weekday, day, month, year, clock, offset = timestamp.split()
+    if not weekday.endswith(','):
+        raise ValueError(f'Not a Jira timestamp: {timestamp!r}')
+    hour, minute, second = clock.split(':')
+    return datetime(int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second),
+                    tzinfo=_timezone(offset))
+
+
+@lru_cache(maxsize=65536)
+def convert_to_iso(timestamp):
+    try:
+        dt = _parse_jira_timestamp(timestamp)
+    except (ValueError, KeyError, AttributeError):
+        try:
+            dt = datetime.fromisoformat(timestamp)
+        except (ValueError, TypeError):
+            dt = parse(timestamp)
+    return dt.isoformat()
+
+
+def convert_timestamps(*timestamps):
+    """
+    Convert several timestamps at once, passing None through unchanged.
+    """
+    return [None if timestamp is None else convert_to_iso(timestamp) for timestamp in timestamps]
@@ -1,7 +1,11 @@
-from lxml import objectify
+from lxml import etree, objectify
+import gzip
 import os
 import glob
 
+# Export files are plain Jira XML, or gzip-compressed as written by fetch_issues.py
+XML_PATTERNS = ('*.xml', '*.xml.gz')
+
 
 def fetch_labels_mapping():
     # If labels_mapping.txt is not found, we return an empty dictionary
@@ -15,13 +19,27 @@ def fetch_labels_mapping():
 
 
 def fetch_allowed_labels():
-    # Graceful handling if allowed_labels.txt is missing
+    # Graceful handling if allowed_labels.txt is missing: None means every label is allowed
     try:
         with open("allowed_labels.txt") as file:
             return [line.strip('\n') for line in file.readlines()]
     except FileNotFoundError:
         print("Warning: allowed_labels.txt not found. No label filtering will be applied.")
-        return []
+        return None
+
+
+def fetch_projects_mapping(path):
+    # One line per Jira project: KEY=default repository URL,security repository URL
+    with open(path) as file:
+        entries = [line.strip() for line in file.readlines()]
+    mapping = {}
+    for entry in entries:
+        if not entry or entry.startswith('#'):
+            continue
+        key, repos = entry.split('=', 1)
+        default_repo, security_repo = (repo.strip() for repo in repos.split(','))
+        mapping[key.strip()] = (default_repo, security_repo)
+    return mapping
 
 
 def _map_label(label, labels_mapping):
@@ -32,7 +50,7 @@ def _map_label(label, labels_mapping):
 
 
 def _is_label_approved(label, approved_labels):
-    return label in approved_labels
+    return approved_labels is None or label in approved_labels
 
 
 def convert_label(label, labels_mappings, approved_labels):
@@ -43,19 +61,59 @@ def convert_label(label, labels_mappings, approved_labels):
     return None
 
 
+def open_xml_file(file_path):
+    # Compressed exports are decompressed on the fly, so callers never see the difference
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'rb')
+    return open(file_path, 'rb')
+
+
 def read_xml_file(file_path):
-    with open(file_path) as file:
+    with open_xml_file(file_path) as file:
         return objectify.fromstring(file.read())
 
 
-def read_xml_files(file_path):
-    files = list()
+def expand_xml_paths(file_path):
+    # Expand the ';'-separated list of files and directories into file names
+    file_names = list()
     for file_name in file_path.split(';'):
         if os.path.isdir(file_name):
-            xml_files = glob.glob(file_name + '/*.xml')
-            for file in xml_files:
-                files.append(read_xml_file(file))
+            for pattern in XML_PATTERNS:
+                file_names.extend(glob.glob(os.path.join(file_name, pattern)))
         else:
-            files.append(read_xml_file(file_name))
+            file_names.append(file_name)
+    return file_names
 
-    return files
+
+def read_xml_files(file_path):
+    return [read_xml_file(file_name) for file_name in expand_xml_paths(file_path)]
+
+
+def iter_xml_file_items(file_name):
+    """
+    Stream the <item> elements of a single Jira XML export, compressed or not.
+
+    Each item is yielded as an objectify element, the same type `read_xml_file`
+    produces, and is cleared together with any already consumed siblings once
+    the caller moves on. Callers must copy whatever they need out of the item
+    before asking for the next one.
+    """
+    with open_xml_file(file_name) as file:
+        context = etree.iterparse(file, events=('end',), tag='item', remove_blank_text=True)
+        context.set_element_class_lookup(objectify.ObjectifyElementClassLookup())
+        for _, item in context:
+            yield item
+            item.clear()
+            parent = item.getparent()
+            while item.getprevious() is not None:
+                parent.remove(item.getprevious())
+        del context
+
+
+def iter_xml_items(file_path):
+    """
+    Stream every <item> from the ';'-separated list of files and directories,
+    keeping at most one parsed item in memory at a time.
+    """
+    for file_name in expand_xml_paths(file_path):
+        yield from iter_xml_file_items(file_name)